@@ -0,0 +1,575 @@
+"""
+Backends de cache intercambiáveis (valores em bytes, com TTL).
+
+Todos expõem get(key) / set(key, value, ttl) / delete(key) / clear() / stats():
+
+- MemoryLRUBackend: LRU no processo, limitado por bytes (e opcionalmente por
+  número de entradas);
+- SqliteBackend: arquivo SQLite (WAL) compartilhado pelos processos do mesmo
+  host, limitado por bytes; a remoção segue o último acesso (aproximado: o
+  acesso só é regravado se o anterior tiver mais de `touch_interval` segundos,
+  para uma leitura não virar uma escrita sempre);
+- RespBackend: servidor que fala o protocolo do Redis (RESP2), compartilhado
+  entre hosts. A remoção por tamanho é a do servidor (maxmemory + política LRU).
+
+RespStandIn é um servidor RESP mínimo (GET/SET/DEL/PING/SCAN/DBSIZE/FLUSHDB),
+em uma thread, com limite de bytes e remoção LRU — para testes e desenvolvimento
+local sem um Redis de verdade.
+
+ObjectCache guarda objetos (dicts/listas de JSON) num backend, com um
+namespace por uso, serialização compacta (orjson se instalado; zlib acima de
+`compress_min_bytes`) e contadores de acerto/erro. Falhas do backend contam
+como miss: o cache nunca derruba o chamador.
+"""
+
+import hashlib
+import json
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str)
+
+    _json_loads = orjson.loads
+except ImportError:  # fallback para a biblioteca padrão
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+    _json_loads = json.loads
+
+# Primeiro byte do valor serializado: JSON puro ou JSON comprimido com zlib
+_RAW = b"j"
+_ZLIB = b"z"
+
+
+def encode_value(obj: Any, compress_min_bytes: int = 1024, level: int = 6) -> bytes:
+    """Objeto → bytes (JSON compacto; zlib se o JSON passar de `compress_min_bytes`)."""
+    data = _json_dumps(obj)
+    if compress_min_bytes and len(data) >= compress_min_bytes:
+        compressed = zlib.compress(data, level)
+        if len(compressed) < len(data):
+            return _ZLIB + compressed
+    return _RAW + data
+
+
+def decode_value(data: bytes) -> Any:
+    tag, payload = data[:1], data[1:]
+    if tag == _ZLIB:
+        payload = zlib.decompress(payload)
+    elif tag != _RAW:
+        raise ValueError("Valor de cache com formato desconhecido.")
+    return _json_loads(payload)
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+class MemoryLRUBackend:
+    """LRU em memória, limitado a `max_bytes` (e a `max_entries`, se > 0)."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 0):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Optional[float], bytes]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if len(value) > self.max_bytes:
+                return
+            self._entries[key] = (expires_at, value)
+            self._bytes += len(key) + len(value)
+            while self._entries and (
+                self._bytes > self.max_bytes
+                or (self.max_entries and len(self._entries) > self.max_entries)
+            ):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(key) + len(value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed_at);
+"""
+
+
+class SqliteBackend:
+    """
+    Cache num arquivo SQLite compartilhado pelos processos do host. Cada thread
+    (e cada processo, após um fork) abre a sua conexão.
+
+    A soma dos tamanhos é conferida a cada `check_every` gravações; acima de
+    `max_bytes`, as entradas menos acessadas são removidas até 90% do limite.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        check_every: int = 64,
+        touch_interval: float = 60.0,
+        timeout: float = 5.0,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.check_every = max(1, check_every)
+        self.touch_interval = touch_interval
+        self.timeout = timeout
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self.evictions = 0
+        with self._conn() as conn:
+            conn.executescript(_SQLITE_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        import os
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            return None
+        if now - accessed_at > self.touch_interval:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return bytes(value)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, size, expires_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, sqlite3.Binary(value), len(key) + len(value), now + ttl if ttl else None, now),
+        )
+        with self._writes_lock:
+            self._writes += 1
+            check = self._writes % self.check_every == 0
+        if check:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove expiradas e, acima do limite, as menos acessadas. Retorna quantas saíram."""
+        conn = self._conn()
+        removed = conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        ).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        if total > self.max_bytes:
+            target = total - int(self.max_bytes * 0.9)
+            freed = 0
+            keys: List[str] = []
+            for key, size in conn.execute(
+                "SELECT key, size FROM cache_entries ORDER BY accessed_at"
+            ):
+                keys.append(key)
+                freed += size
+                if freed >= target:
+                    break
+            conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(k,) for k in keys])
+            removed += len(keys)
+        self.evictions += removed
+        return removed
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache_entries")
+
+    def stats(self) -> Dict[str, Any]:
+        entries, total = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class RespError(Exception):
+    """Erro devolvido pelo servidor RESP (linha "-ERR ...")."""
+
+
+class RespBackend:
+    """
+    Cliente RESP2 mínimo (uma conexão por thread) para Redis ou compatível.
+    URL: redis://[:senha@]host:porta/db. As chaves recebem o prefixo `prefix`.
+    Cada processo, após um fork, abre a sua conexão: um socket herdado seria
+    dividido com o pai e as respostas de um iriam para o outro.
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", prefix: str = "m1:", timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").strip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # -- protocolo ----------------------------------------------------------
+    def _conn(self) -> Tuple[socket.socket, Any]:
+        import os
+
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) != os.getpid():
+            # Conexão herdada do pai: fecha só a cópia deste processo, sem QUIT
+            conn[1].close()
+            conn[0].close()
+            conn = self._local.conn = None
+        return conn or self._connect()
+
+    def _connect(self) -> Tuple[socket.socket, Any]:
+        import os
+
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("rb")
+        self._local.conn = (sock, reader)
+        self._local.pid = os.getpid()
+        if self.password:
+            self._command("AUTH", self.password)
+        if self.db:
+            self._command("SELECT", str(self.db))
+        return sock, reader
+
+    def _command(self, *args: Any) -> Any:
+        sock, reader = self._conn()
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        try:
+            sock.sendall(b"".join(parts))
+            return _read_reply(reader)
+        except (OSError, EOFError):
+            # Conexão quebrada: a próxima chamada reconecta
+            self._local.conn = None
+            sock.close()
+            raise
+
+    # -- interface de backend ----------------------------------------------
+    def get(self, key: str) -> Optional[bytes]:
+        return self._command("GET", self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self._command("SET", self.prefix + key, value, "PX", str(int(ttl * 1000)))
+        else:
+            self._command("SET", self.prefix + key, value)
+
+    def delete(self, key: str) -> None:
+        self._command("DEL", self.prefix + key)
+
+    def clear(self) -> None:
+        """Remove só as chaves com o prefixo deste backend."""
+        cursor = b"0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", "500")
+            if keys:
+                self._command("DEL", *keys)
+            if cursor in (b"0", 0):
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            return {"backend": "resp", "server_keys": self._command("DBSIZE")}
+        except (OSError, EOFError, RespError) as e:
+            return {"backend": "resp", "error": str(e)}
+
+
+def _read_reply(reader: Any) -> Any:
+    line = reader.readline()
+    if not line:
+        raise EOFError("Conexão RESP fechada.")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise RespError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count < 0:
+            return None
+        return [_read_reply(reader) for _ in range(count)]
+    raise RespError(f"Resposta RESP inválida: {line[:40]!r}")
+
+
+# ---------------------------------------------------------------------------
+# Servidor RESP local (stand-in do Redis)
+# ---------------------------------------------------------------------------
+def _encode_reply(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(_encode_reply(v) for v in value)
+    raise TypeError(type(value))
+
+
+class RespStandIn:
+    """
+    Servidor RESP em memória, numa thread, com limite de bytes (LRU). Suporta o
+    que o RespBackend usa. Uso:
+
+        server = RespStandIn(max_bytes=1 << 20).start()
+        backend = RespBackend(server.url)
+        ...
+        server.stop()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_bytes: int = 64 * 1024 * 1024):
+        self.store = MemoryLRUBackend(max_bytes=max_bytes)
+        standin = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                while True:
+                    try:
+                        request = _read_reply(self.rfile)
+                    except (EOFError, OSError, ValueError):
+                        return
+                    try:
+                        reply = standin._dispatch(request)
+                    except Exception as e:
+                        self.wfile.write(b"-ERR %s\r\n" % str(e).encode())
+                    else:
+                        self.wfile.write(_encode_reply(reply))
+                    self.wfile.flush()
+
+        class _Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self._server = _Server((host, port), _Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "RespStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="resp-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _dispatch(self, request: List[bytes]) -> Any:
+        command = request[0].upper()
+        args = request[1:]
+        if command == b"PING":
+            return "PONG"
+        if command in (b"SELECT", b"AUTH"):
+            return "OK"
+        if command == b"GET":
+            return self.store.get(args[0].decode())
+        if command == b"SET":
+            ttl = None
+            options = [a.upper() for a in args[2:]]
+            if b"PX" in options:
+                ttl = int(args[2 + options.index(b"PX") + 1]) / 1000.0
+            elif b"EX" in options:
+                ttl = float(args[2 + options.index(b"EX") + 1])
+            self.store.set(args[0].decode(), args[1], ttl)
+            return "OK"
+        if command == b"DEL":
+            existing = [a for a in args if self.store.get(a.decode()) is not None]
+            for key in args:
+                self.store.delete(key.decode())
+            return len(existing)
+        if command == b"DBSIZE":
+            return self.store.stats()["entries"]
+        if command == b"FLUSHDB":
+            self.store.clear()
+            return "OK"
+        if command == b"SCAN":
+            pattern = b"*"
+            if b"MATCH" in [a.upper() for a in args]:
+                pattern = args[[a.upper() for a in args].index(b"MATCH") + 1]
+            prefix = pattern.rstrip(b"*").decode()
+            with self.store._lock:
+                keys = [k.encode() for k in self.store._entries if k.startswith(prefix)]
+            return [b"0", keys]
+        raise RespError(f"comando não suportado: {command.decode()}")
+
+
+# ---------------------------------------------------------------------------
+# Cache de objetos
+# ---------------------------------------------------------------------------
+class ObjectCache:
+    """
+    Objetos JSON num backend, sob um namespace. As chaves são tuplas (ou
+    strings) convertidas num hash curto e estável.
+
+    on_result(namespace, outcome), se dado, é chamado a cada get com outcome
+    "hit", "miss" ou "error" (para métricas).
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        namespace: str,
+        ttl: Optional[float] = None,
+        compress_min_bytes: int = 1024,
+        on_result: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.compress_min_bytes = compress_min_bytes
+        self.on_result = on_result
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "errors": 0, "sets": 0}
+
+    def _key(self, key: Any) -> str:
+        raw = key if isinstance(key, str) else json.dumps(list(_as_iterable(key)), default=str)
+        digest = hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+        return f"{self.namespace}:{digest}"
+
+    def _count(self, name: str, outcome: Optional[str] = None) -> None:
+        with self._lock:
+            self._counts[name] += 1
+        if outcome and self.on_result is not None:
+            self.on_result(self.namespace, outcome)
+
+    def get(self, key: Any) -> Optional[Any]:
+        try:
+            data = self.backend.get(self._key(key))
+            value = decode_value(data) if data is not None else None
+        except Exception:
+            self._count("errors", "error")
+            return None
+        if value is None:
+            self._count("misses", "miss")
+            return None
+        self._count("hits", "hit")
+        return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            self.backend.set(
+                self._key(key),
+                encode_value(value, self.compress_min_bytes),
+                ttl if ttl is not None else self.ttl,
+            )
+        except Exception:
+            self._count("errors", "error")
+            return
+        self._count("sets")
+
+    def delete(self, key: Any) -> None:
+        try:
+            self.backend.delete(self._key(key))
+        except Exception:
+            self._count("errors", "error")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else 0.0
+        return counts
+
+
+def _as_iterable(key: Any) -> Iterable[Any]:
+    return key if isinstance(key, (list, tuple)) else (key,)
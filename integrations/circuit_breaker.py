@@ -0,0 +1,173 @@
+"""
+Circuit breaker para dependências externas (libindexr, OpenAI).
+
+Quando um serviço externo está degradado, cada chamada espera o timeout
+inteiro antes de falhar. O circuit breaker observa erros e lentidão e, ao
+atingir o limite, "abre": as próximas chamadas falham na hora com
+CircuitOpenError, permitindo ao chamador seguir por um caminho degradado.
+
+Estados:
+- closed: chamadas passam normalmente; falhas/lentidão consecutivas são contadas.
+- open: chamadas falham imediatamente até passar `reset_timeout` segundos.
+- half_open: deixa passar até `half_open_max_calls` chamadas de teste (probe).
+  Sucesso → closed; falha → open novamente.
+
+Uma chamada que termina, mas demora mais que `slow_call_seconds`, conta como falha.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Chamada rejeitada porque o circuito do serviço está aberto."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(
+            f"Circuito '{name}' aberto; nova tentativa em {max(0.0, retry_after):.1f}s."
+        )
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Args:
+        name: nome do serviço protegido (ex.: "libindexr", "openai").
+        failure_threshold: falhas (ou chamadas lentas) consecutivas para abrir.
+        slow_call_seconds: duração acima da qual uma chamada bem-sucedida conta
+            como falha (None = não considera latência).
+        reset_timeout: segundos em open antes de permitir probes (half_open).
+        half_open_max_calls: probes simultâneos permitidos em half_open.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_seconds: Optional[float] = None,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = float(reset_timeout)
+        self.half_open_max_calls = max(1, int(half_open_max_calls))
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._counters = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "slow_calls": 0,
+            "rejected": 0,
+            "opened": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == STATE_OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = STATE_HALF_OPEN
+            self._half_open_in_flight = 0
+
+    def _open(self, now: float) -> None:
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._half_open_in_flight = 0
+        self._counters["opened"] += 1
+
+    def check(self) -> None:
+        """
+        Falha na hora com CircuitOpenError se o circuito estiver aberto, sem
+        consumir um probe. Útil antes de etapas caras (ex.: fila de rate limit).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            if self._state == STATE_OPEN:
+                self._counters["rejected"] += 1
+                raise CircuitOpenError(self.name, self._opened_at + self.reset_timeout - now)
+
+    def _before_call(self) -> bool:
+        """Libera ou rejeita a chamada. Retorna True se a chamada é um probe."""
+        with self._lock:
+            now = time.monotonic()
+            self._maybe_half_open(now)
+            if self._state == STATE_OPEN:
+                self._counters["rejected"] += 1
+                raise CircuitOpenError(self.name, self._opened_at + self.reset_timeout - now)
+            if self._state == STATE_HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    self._counters["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._half_open_in_flight += 1
+                self._counters["calls"] += 1
+                return True
+            self._counters["calls"] += 1
+            return False
+
+    def _record(self, probe: bool, failed: bool, slow: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            if slow:
+                self._counters["slow_calls"] += 1
+            if failed or slow:
+                self._counters["failures"] += 1
+                self._consecutive_failures += 1
+                if self._state == STATE_HALF_OPEN or (
+                    self._state == STATE_CLOSED
+                    and self._consecutive_failures >= self.failure_threshold
+                ):
+                    self._open(now)
+            else:
+                self._counters["successes"] += 1
+                self._consecutive_failures = 0
+                if self._state == STATE_HALF_OPEN:
+                    self._state = STATE_CLOSED
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Executa fn(*args, **kwargs) protegida pelo circuito.
+
+        Raises:
+            CircuitOpenError: se o circuito estiver aberto (fn não é chamada).
+            Qualquer exceção de fn é registrada como falha e repassada.
+        """
+        probe = self._before_call()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._record(probe, failed=True, slow=False)
+            raise
+        duration = time.monotonic() - start
+        slow = self.slow_call_seconds is not None and duration > self.slow_call_seconds
+        self._record(probe, failed=False, slow=slow)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado atual e contadores (para métricas)."""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                **self._counters,
+            }
@@ -11,6 +11,9 @@ class LibIndexer:
         self,
         base_url: str = "https://llmindexer-api.saiapplications.com",
         api_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        breaker: Optional[Any] = None,
+        session: Optional[requests.Session] = None,
     ):
         """
         Inicializa o cliente LibIndexer.
@@ -18,10 +21,19 @@ class LibIndexer:
         Args:
             base_url (str): URL base da API.
             api_key (str, optional): Chave de API para autenticação no header 'ApiKey'.
+            timeout (float, optional): Timeout (segundos) das requisições de busca.
+            breaker (CircuitBreaker, optional): Circuit breaker (integrations/circuit_breaker.py)
+                que protege a busca; com o circuito aberto, query() falha na hora
+                com CircuitOpenError.
+            session (requests.Session, optional): Sessão HTTP para reaproveitar conexões
+                (keep-alive) entre buscas; sem sessão, cada chamada abre uma conexão nova.
         """
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
         self.headers = {"ApiKey": self.api_key} if self.api_key else {}
+        self.timeout = timeout
+        self.breaker = breaker
+        self.session = session
 
     def query(
         self,
@@ -31,10 +43,13 @@ class LibIndexer:
         threshold_similarity: float = 0.4,
         use_chunk_chain: bool = False,
         max_chunk_chain_link: int = 0,
+        timeout: Optional[float] = None,
     ) -> Dict[str, Any]:
         """
         Realiza uma busca (query) no índice especificado.
         Correspondente à requisição 'POST query' da imagem.
+
+        timeout (opcional) substitui o timeout do cliente nesta chamada.
         """
         url = f"{self.base_url}/api/index/search"
         payload = {
@@ -46,7 +61,17 @@ class LibIndexer:
             "searchQuery": search_query,
         }
 
-        response = requests.post(url, json=payload, headers=self.headers)
+        timeout = self.timeout if timeout is None else timeout
+        if self.breaker is not None:
+            return self.breaker.call(self._post_json, url, payload, timeout)
+        return self._post_json(url, payload, timeout)
+
+    def _post_json(
+        self, url: str, payload: Dict[str, Any], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """POST com payload JSON; levanta exceção em status HTTP de erro."""
+        http = self.session or requests
+        response = http.post(url, json=payload, headers=self.headers, timeout=timeout)
         response.raise_for_status()
         return response.json()
 
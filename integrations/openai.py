@@ -6,7 +6,12 @@ Usa LangChain ChatOpenAI para invocar o modelo e tiktoken para contagem
 de tokens (input e output), permitindo monitorar uso e custos.
 """
 
-from typing import Any, Dict, Optional, Tuple
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Clientes ChatOpenAI reaproveitados entre chamadas (mesmo pool HTTP), por configuração
+_CLIENTS: Dict[Tuple[Any, ...], Any] = {}
+_CLIENTS_LOCK = threading.Lock()
 
 
 def count_tokens(text: str, model: str = "gpt-4o") -> int:
@@ -28,6 +33,39 @@ def count_tokens(text: str, model: str = "gpt-4o") -> int:
     return len(encoding.encode(text))
 
 
+def _stream_with_cap(
+    llm: Any,
+    messages: List[Any],
+    call_kwargs: Dict[str, Any],
+    output_cap: Callable[[str], Optional[int]],
+) -> Any:
+    """
+    Lê a resposta em streaming e para assim que o número de pedaços (~tokens)
+    atinge o limite devolvido por output_cap. Fechar o stream encerra a
+    requisição, então o modelo deixa de gerar o restante.
+    """
+    from langchain_core.messages import AIMessage
+
+    parts: List[str] = []
+    cap: Optional[int] = None
+    stream = llm.stream(messages, **call_kwargs)
+    try:
+        for chunk in stream:
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            if not text:
+                continue
+            parts.append(text)
+            if cap is None:
+                cap = output_cap("".join(parts))
+            if cap is not None and len(parts) >= cap:
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return AIMessage(content="".join(parts))
+
+
 class OpenAIIntegration:
     """
     Cliente OpenAI para o M1: invoca o modelo (ChatOpenAI) e retorna
@@ -39,37 +77,111 @@ class OpenAIIntegration:
         api_key: Optional[str] = None,
         model: str = "gpt-4o",
         temperature: float = 0,
+        scheduler: Optional[Any] = None,
+        priority: str = "interactive",
+        expected_output_tokens: int = 512,
+        timeout: Optional[float] = None,
+        breaker: Optional[Any] = None,
     ):
+        """
+        Args:
+            scheduler: RateLimitScheduler (integrations/rate_limiter.py) opcional;
+                quando informado, cada chamada espera saldo de RPM/TPM antes de sair.
+            priority: "interactive" ou "batch" (prioridade na fila do scheduler).
+            expected_output_tokens: estimativa de tokens de saída somada ao prompt
+                para reservar TPM antes da chamada.
+            timeout: timeout (segundos) da chamada ao modelo.
+            breaker: CircuitBreaker (integrations/circuit_breaker.py) opcional; com o
+                circuito aberto, invoke() falha na hora com CircuitOpenError.
+        """
         self.api_key = api_key
         self.model = model
         self.temperature = temperature
+        self.scheduler = scheduler
+        self.priority = priority
+        self.expected_output_tokens = expected_output_tokens
+        self.timeout = timeout
+        self.breaker = breaker
 
     def invoke(
         self,
         system_prompt: str,
         user_prompt: str,
+        max_tokens: Optional[int] = None,
+        stop: Optional[Sequence[str]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        output_cap: Optional[Callable[[str], Optional[int]]] = None,
     ) -> Tuple[str, Dict[str, int]]:
         """
         Envia system + user para o modelo e retorna (conteúdo da resposta, uso de tokens).
 
+        Args:
+            max_tokens: limite de tokens de saída enviado à API.
+            stop: sequências de parada enviadas à API.
+            response_format: formato de saída da API (ex.: {"type": "json_schema", ...}).
+            output_cap: função que recebe o texto parcial e devolve o limite de tokens
+                de saída assim que ele puder ser decidido (ex.: pela classificação no
+                início da resposta), ou None enquanto não puder. Com output_cap a
+                resposta é lida em streaming e a leitura é interrompida no limite.
+
         Retorno:
             (content, usage) onde usage = { "input_tokens", "output_tokens", "total_tokens" }
         """
         from langchain_openai import ChatOpenAI
         from langchain_core.messages import HumanMessage, SystemMessage
 
-        llm = ChatOpenAI(
-            model=self.model,
-            api_key=self.api_key,
-            temperature=self.temperature,
-        )
+        # Circuito aberto: falha na hora, antes de montar o cliente e entrar na fila do scheduler
+        if self.breaker is not None:
+            self.breaker.check()
+
+        key = (self.model, self.api_key, self.temperature, self.timeout)
+        with _CLIENTS_LOCK:
+            llm = _CLIENTS.get(key)
+            if llm is None:
+                llm = ChatOpenAI(
+                    model=self.model,
+                    api_key=self.api_key,
+                    temperature=self.temperature,
+                    timeout=self.timeout,
+                )
+                _CLIENTS[key] = llm
         messages = [
             SystemMessage(content=system_prompt),
             HumanMessage(content=user_prompt),
         ]
 
         input_tokens = count_tokens(system_prompt + "\n" + user_prompt, self.model)
-        response = llm.invoke(messages)
+
+        # Reserva RPM/TPM no scheduler (se houver) com a estimativa de tokens
+        reservation = None
+        if self.scheduler is not None:
+            reservation = self.scheduler.acquire(
+                input_tokens + self.expected_output_tokens, priority=self.priority
+            )
+
+        call_kwargs: Dict[str, Any] = {}
+        if max_tokens:
+            call_kwargs["max_tokens"] = int(max_tokens)
+        if stop:
+            call_kwargs["stop"] = list(stop)
+        if response_format:
+            call_kwargs["response_format"] = response_format
+
+        def _call() -> Any:
+            if output_cap is None:
+                return llm.invoke(messages, **call_kwargs)
+            return _stream_with_cap(llm, messages, call_kwargs, output_cap)
+
+        try:
+            if self.breaker is not None:
+                response = self.breaker.call(_call)
+            else:
+                response = _call()
+        except Exception:
+            if reservation is not None:
+                # A chamada falhou: devolve a estimativa de saída ao bucket TPM
+                self.scheduler.settle(reservation, input_tokens)
+            raise
         content = response.content if hasattr(response, "content") else str(response)
         output_tokens = count_tokens(content, self.model)
 
@@ -86,4 +198,6 @@ class OpenAIIntegration:
             "output_tokens": output_tokens,
             "total_tokens": input_tokens + output_tokens,
         }
+        if reservation is not None:
+            self.scheduler.settle(reservation, usage["total_tokens"])
         return content, usage
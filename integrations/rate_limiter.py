@@ -0,0 +1,208 @@
+"""
+Limitador de taxa (RPM/TPM) com prioridade para chamadas à OpenAI.
+
+A conta OpenAI tem limites de requisições por minuto (RPM) e tokens por
+minuto (TPM). Sem controle, lotes de reprocessamento disparam rajadas de 429
+e retries que atrasam os chamados interativos.
+
+RateLimitScheduler mantém dois token buckets (RPM e TPM). Antes de cada
+chamada, o cliente estima os tokens (count_tokens do prompt + saída esperada)
+e chama acquire(); a chamada só sai quando os dois buckets têm saldo. Os
+pedidos esperam numa fila de prioridade: "interactive" sempre passa na frente
+de "batch". Depois da resposta, settle() corrige o bucket TPM com o uso real.
+
+stats() expõe profundidade da fila e tempo de espera por prioridade.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+
+# Menor valor = maior prioridade na fila
+_PRIORITY_ORDER = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1}
+
+
+class TokenBucket:
+    """
+    Token bucket clássico: até `capacity` unidades, reabastecido continuamente
+    a `refill_per_second` unidades por segundo. O saldo pode ficar negativo
+    quando o uso real supera a estimativa (ver settle()).
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self._last = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self._last = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Segundos até haver `amount` unidades disponíveis (0 se já houver)."""
+        self._refill(now)
+        missing = amount - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Reservation:
+    """Reserva concedida por acquire(): tokens estimados e tempo de espera."""
+
+    __slots__ = ("estimated_tokens", "priority", "wait_seconds")
+
+    def __init__(self, estimated_tokens: int, priority: str, wait_seconds: float):
+        self.estimated_tokens = estimated_tokens
+        self.priority = priority
+        self.wait_seconds = wait_seconds
+
+
+class RateLimitScheduler:
+    """
+    Escalonador de chamadas com limites RPM/TPM e fila de prioridade.
+
+    Args:
+        rpm: requisições por minuto permitidas (0 = sem limite de RPM).
+        tpm: tokens por minuto permitidos (0 = sem limite de TPM).
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = int(rpm)
+        self.tpm = int(tpm)
+        self._requests = TokenBucket(self.rpm, self.rpm / 60.0) if self.rpm > 0 else None
+        self._tokens = TokenBucket(self.tpm, self.tpm / 60.0) if self.tpm > 0 else None
+
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int]] = []  # heap de (prioridade, seq)
+        self._seq = itertools.count()
+        self._queued_by_priority: Dict[str, int] = {p: 0 for p in _PRIORITY_ORDER}
+        self._wait_stats: Dict[str, Dict[str, float]] = {
+            p: {"count": 0, "sum": 0.0, "max": 0.0} for p in _PRIORITY_ORDER
+        }
+        self._timeouts = 0
+
+    def _time_until_admit(self, tokens: int, now: float) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.time_until(1, now))
+        if self._tokens is not None:
+            # Um pedido maior que a capacidade nunca caberia: limita à capacidade
+            wait = max(wait, self._tokens.time_until(min(tokens, self._tokens.capacity), now))
+        return wait
+
+    def acquire(
+        self,
+        estimated_tokens: int,
+        priority: str = PRIORITY_INTERACTIVE,
+        timeout: Optional[float] = None,
+    ) -> Reservation:
+        """
+        Bloqueia até a chamada poder sair respeitando RPM/TPM e a prioridade.
+
+        Raises:
+            TimeoutError: se `timeout` (segundos) expirar antes da liberação.
+        """
+        if priority not in _PRIORITY_ORDER:
+            priority = PRIORITY_INTERACTIVE
+        estimated_tokens = max(0, int(estimated_tokens))
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        entry = (_PRIORITY_ORDER[priority], next(self._seq))
+
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            self._queued_by_priority[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] == entry:
+                        wait = self._time_until_admit(estimated_tokens, now)
+                        if wait <= 0:
+                            break
+                    else:
+                        # Não é a vez deste pedido: espera ser acordado pelo da frente
+                        wait = None
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise TimeoutError(
+                                f"Limite de taxa OpenAI: espera excedeu {timeout:.1f}s "
+                                f"(prioridade {priority})."
+                            )
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+
+                if self._requests is not None:
+                    self._requests.consume(1)
+                if self._tokens is not None:
+                    self._tokens.consume(estimated_tokens)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._queued_by_priority[priority] -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            stats = self._wait_stats[priority]
+            stats["count"] += 1
+            stats["sum"] += waited
+            stats["max"] = max(stats["max"], waited)
+
+        return Reservation(estimated_tokens, priority, waited)
+
+    def settle(self, reservation: Reservation, actual_tokens: int) -> None:
+        """Ajusta o bucket TPM com o uso real de tokens informado pela API."""
+        if self._tokens is None:
+            return
+        diff = int(actual_tokens) - reservation.estimated_tokens
+        with self._cond:
+            if diff > 0:
+                self._tokens.consume(diff)
+            elif diff < 0:
+                self._tokens.refund(-diff)
+                self._cond.notify_all()
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, tempos de espera por prioridade e saldos dos buckets."""
+        with self._cond:
+            now = time.monotonic()
+            waits = {}
+            for priority, s in self._wait_stats.items():
+                waits[priority] = {
+                    **s,
+                    "avg": s["sum"] / s["count"] if s["count"] else 0.0,
+                }
+            if self._requests is not None:
+                self._requests._refill(now)
+            if self._tokens is not None:
+                self._tokens._refill(now)
+            return {
+                "rpm_limit": self.rpm,
+                "tpm_limit": self.tpm,
+                "queue_depth": len(self._queue),
+                "queue_depth_by_priority": dict(self._queued_by_priority),
+                "wait_seconds": waits,
+                "timeouts": self._timeouts,
+                "requests_available": self._requests.tokens if self._requests else None,
+                "tokens_available": self._tokens.tokens if self._tokens else None,
+            }
@@ -0,0 +1,55 @@
+"""
+Cliente HTTP do sistema de chamados (entrega em lote dos resultados).
+
+POST {base_url}/api/tickets/handoffs com {"items": [...]}. Cada item traz um
+delivery_id estável: o sistema de chamados deve tratá-lo como chave de
+idempotência, pois o mesmo item pode ser reenviado (entrega "pelo menos uma vez").
+
+Resposta esperada: 2xx, opcionalmente {"failed": ["<delivery_id>", ...]} com os
+itens recusados individualmente (os demais contam como entregues).
+"""
+
+from typing import Any, Dict, List, Optional
+
+import requests
+
+
+class TicketingClient:
+    """Cliente do endpoint de hand-off em lote do sistema de chamados."""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        session: Optional[requests.Session] = None,
+    ):
+        """
+        Args:
+            base_url (str): URL base do sistema de chamados.
+            api_key (str, optional): Chave enviada no header 'ApiKey'.
+            timeout (float, optional): Timeout (segundos) de cada lote.
+            session (requests.Session, optional): Sessão HTTP para reaproveitar conexões.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"ApiKey": api_key} if api_key else {}
+        self.timeout = timeout
+        self.session = session
+
+    def post_handoffs(self, items: List[Dict[str, Any]]) -> List[str]:
+        """
+        Envia um lote de hand-offs. Retorna os delivery_id recusados pelo
+        servidor; levanta exceção em erro HTTP (o lote inteiro falhou).
+        """
+        http = self.session or requests
+        response = http.post(
+            f"{self.base_url}/api/tickets/handoffs",
+            json={"items": items},
+            headers=self.headers,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        if not response.content:
+            return []
+        body = response.json()
+        return [str(d) for d in (body.get("failed") or [])] if isinstance(body, dict) else []
@@ -8,11 +8,12 @@ Pipeline RAG de 2 etapas:
   3. Síntese: LLM (GPT-4o) gera resposta baseada apenas no contexto local.
 """
 
-from m1_busca_documental.graph import build_rag_graph, rag_graph
+from m1_busca_documental.graph import build_rag_graph, invoke_coalesced, rag_graph
 from m1_busca_documental.state import AgentState
 
 __all__ = [
     "AgentState",
     "build_rag_graph",
+    "invoke_coalesced",
     "rag_graph",
 ]
@@ -0,0 +1,145 @@
+"""
+Profundidade adaptativa da busca — Módulo M1 N1 Chamados
+
+O call_libindexr pede sempre M1_QUANTITY chunks com M1_THRESHOLD_SIMILARITY. Uma
+pergunta curta e específica resolve com um acerto; uma vaga precisa de mais.
+Com M1_ADAPTIVE_RETRIEVAL=1 a busca sobe uma escada de passos (M1_ADAPTIVE_STEPS):
+começa pequena e barata e só passa ao próximo passo — mais chunks, limiar menor,
+cadeia de chunks — quando a distribuição de scores da resposta é ambígua:
+
+- empty: nenhum chunk acima do limiar;
+- low_score: o melhor score está abaixo de M1_ADAPTIVE_CONFIDENT_SCORE;
+- close_margin: o segundo documento está a menos de M1_ADAPTIVE_MIN_MARGIN do
+  primeiro (com um acerto só não há margem a medir).
+
+O último passo é aceito sempre. Cada passo fica em retrieval_steps no estado
+(parâmetros, scores, segundos e o motivo de escalar) e nas métricas
+adaptive_retrieval{final_step} e adaptive_retrieval_escalation_seconds.
+
+Formato de M1_ADAPTIVE_STEPS: passos separados por vírgula, cada um
+"quantidade@limiar", com "+chain" para pedir a cadeia de chunks vizinhos.
+Ex.: "1@0.4,3@0.4,6@0.3+chain". Com M1_CHUNK_FAST_PATH=1 o call_libindexr pede
+a cadeia em todos os passos, porque o assemble_chunk_context depende dela.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    ADAPTIVE_CONFIDENT_SCORE,
+    ADAPTIVE_MIN_MARGIN,
+    ADAPTIVE_STEPS,
+)
+
+# (quantity, threshold_similarity, use_chunk_chain)
+Step = Tuple[int, float, bool]
+
+
+def parse_steps(spec: str = ADAPTIVE_STEPS) -> List[Step]:
+    """Converte M1_ADAPTIVE_STEPS na lista de passos (quantity, threshold, chain)."""
+    steps: List[Step] = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        chain = part.endswith("+chain")
+        if chain:
+            part = part[: -len("+chain")]
+        quantity, _, threshold = part.partition("@")
+        try:
+            steps.append((int(quantity), float(threshold), chain))
+        except ValueError:
+            raise ValueError(
+                f"M1_ADAPTIVE_STEPS: passo inválido {part!r} (esperado quantidade@limiar[+chain])."
+            ) from None
+    if not steps:
+        raise ValueError("M1_ADAPTIVE_STEPS não tem nenhum passo.")
+    return steps
+
+
+def document_scores(response: Optional[Dict[str, Any]]) -> List[float]:
+    """Maior similarityScore de cada documento (sourceId) da resposta, em ordem decrescente."""
+    best: Dict[str, float] = {}
+    for res in (response or {}).get("results") or []:
+        for ch in res.get("chunks") or []:
+            chunk = ch.get("chunk") if isinstance(ch, dict) else None
+            score = ch.get("similarityScore") if isinstance(ch, dict) else None
+            if not isinstance(chunk, dict) or score is None:
+                continue
+            sid = str(chunk.get("sourceId") or res.get("fromDocument") or "")
+            best[sid] = max(best.get(sid, 0.0), float(score))
+    return sorted(best.values(), reverse=True)
+
+
+def assess(
+    response: Optional[Dict[str, Any]],
+    confident_score: float = ADAPTIVE_CONFIDENT_SCORE,
+    min_margin: float = ADAPTIVE_MIN_MARGIN,
+) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Motivo para escalar (None se a resposta é clara) e o resumo dos scores:
+    top_score, margin (None com um documento só) e documents.
+    """
+    scores = document_scores(response)
+    summary = {
+        "top_score": round(scores[0], 4) if scores else None,
+        "margin": round(scores[0] - scores[1], 4) if len(scores) > 1 else None,
+        "documents": len(scores),
+    }
+    if not scores:
+        return "empty", summary
+    if scores[0] < confident_score:
+        return "low_score", summary
+    if summary["margin"] is not None and summary["margin"] < min_margin:
+        return "close_margin", summary
+    return None, summary
+
+
+def search(
+    query: Callable[[int, float, bool], Dict[str, Any]],
+    steps: Optional[List[Step]] = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Sobe a escada chamando query(quantity, threshold, chain) até uma resposta
+    clara ou o último passo. Devolve a resposta aceita e o registro dos passos.
+
+    Se um passo depois do primeiro falhar, fica a resposta do passo anterior
+    (o erro vai para o registro); uma falha no primeiro passo é propagada.
+    """
+    steps = steps or parse_steps()
+    records: List[Dict[str, Any]] = []
+    response: Optional[Dict[str, Any]] = None
+    for i, (quantity, threshold, chain) in enumerate(steps):
+        record: Dict[str, Any] = {
+            "step": i,
+            "quantity": quantity,
+            "threshold": threshold,
+            "chunk_chain": chain,
+        }
+        start = time.perf_counter()
+        try:
+            result = query(quantity, threshold, chain)
+        except Exception as e:
+            if response is None:
+                raise
+            record.update(seconds=round(time.perf_counter() - start, 4), error=str(e))
+            records.append(record)
+            break
+        record["seconds"] = round(time.perf_counter() - start, 4)
+        response = result
+        reason, summary = assess(response)
+        record.update(summary)
+        last = i == len(steps) - 1
+        record["outcome"] = "accepted" if reason is None or last else "escalated"
+        record["reason"] = reason
+        records.append(record)
+        if record["outcome"] == "accepted":
+            break
+
+    final = records[-1] if "error" not in records[-1] else records[-2]
+    metrics.incr("adaptive_retrieval", final_step=str(final["step"]), reason=final["reason"] or "clear")
+    escalation = sum(r["seconds"] for r in records[1:])
+    if len(records) > 1:
+        metrics.observe("adaptive_retrieval_escalation_seconds", escalation)
+    return response, records
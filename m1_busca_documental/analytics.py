@@ -0,0 +1,475 @@
+"""
+Analytics de custo por KB — Módulo M1 N1 Chamados
+
+O token_usage de cada ticket era impresso pelo run_example e descartado. Com
+M1_ANALYTICS=1, toda execução do grafo grava um registro compacto num
+log colunar local (M1_ANALYTICS_DIR), e o comando report agrega por KB e por dia
+para mostrar quais artigos mais consomem tokens e latência — candidatos a
+enxugar, resumir ou pré-computar no FAQ.
+
+Registro por ticket (uma linha do log):
+- ts, day, ticket_id, kb_id, status, classification (RELEVANTE/IRRELEVANTE),
+  retrieval_backend, model_tier, similarity, degraded, coalesced;
+- input_tokens / output_tokens: soma de todas as chamadas à LLM do ticket
+  (inclusive a repetição com o KB inteiro no caminho rápido por chunks);
+- seconds e node.<nó>: tempo de parede de cada nó (até o nó final, exclusive);
+- cache.<namespace>: acertos de cache durante a execução (answers, libindexr).
+
+Os nós instrumentados (profiling.instrument) acumulam tempos, tokens e acertos
+em run_stats no estado; os nós finais (forward_to_user / forward_to_attendant)
+entregam o registro ao log. Tickets servidos por coalescência com a execução de
+outro entram com coalesced=1 e sem tempos nem tokens (não custaram nada).
+
+Formato: o processo junta os registros em memória e grava um segmento .npz por
+lote (M1_ANALYTICS_FLUSH_ROWS registros ou M1_ANALYTICS_FLUSH_SECONDS segundos),
+uma coluna NumPy por campo. Cada processo grava seus próprios segmentos (nome
+com pid), então vários workers podem escrever na mesma pasta sem trava.
+
+Uso:
+  python -m m1_busca_documental.analytics report                 # por KB
+  python -m m1_busca_documental.analytics report --by day --since 2026-10-01
+  python -m m1_busca_documental.analytics report --by kb-day --sort seconds --json r.json
+  python -m m1_busca_documental.analytics compact                # junta os segmentos
+"""
+
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    ANALYTICS_DIR,
+    ANALYTICS_ENABLED,
+    ANALYTICS_FLUSH_ROWS,
+    ANALYTICS_FLUSH_SECONDS,
+)
+
+NODE_PREFIX = "node."
+CACHE_PREFIX = "cache."
+
+# Colunas fixas e seus tipos; node.* é float32 e cache.* é int16
+_COLUMNS = {
+    "ts": np.float64,
+    "day": str,
+    "ticket_id": str,
+    "kb_id": str,
+    "status": str,
+    "classification": str,
+    "retrieval_backend": str,
+    "model_tier": str,
+    "similarity": np.float32,
+    "degraded": np.int8,
+    "coalesced": np.int8,
+    "input_tokens": np.int32,
+    "output_tokens": np.int32,
+    "seconds": np.float32,
+}
+
+# Acertos de cache do nó em execução (aberto por node_scope)
+_node_hits: "contextvars.ContextVar[Optional[Counter]]" = contextvars.ContextVar(
+    "m1_analytics_hits", default=None
+)
+
+
+# ---------------------------------------------------------------------------
+# Coleta durante a execução do grafo
+# ---------------------------------------------------------------------------
+def note_cache(namespace: str, outcome: str) -> None:
+    """Conta um acerto de cache para o nó em execução (chamado por cache.py)."""
+    hits = _node_hits.get()
+    if hits is not None and outcome == "hit":
+        hits[namespace] += 1
+
+
+@contextmanager
+def node_scope() -> Iterator[Counter]:
+    """Abre a contagem de acertos de cache de um nó."""
+    hits: Counter = Counter()
+    token = _node_hits.set(hits)
+    try:
+        yield hits
+    finally:
+        _node_hits.reset(token)
+
+
+def merge_run_stats(
+    previous: Optional[Dict[str, Any]],
+    node: str,
+    seconds: float,
+    hits: Counter,
+    token_usage: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """run_stats do estado somado com a execução de um nó (novo dict)."""
+    stats = {
+        "nodes": dict((previous or {}).get("nodes") or {}),
+        "cache": dict((previous or {}).get("cache") or {}),
+        "input_tokens": (previous or {}).get("input_tokens", 0),
+        "output_tokens": (previous or {}).get("output_tokens", 0),
+    }
+    stats["nodes"][node] = round(stats["nodes"].get(node, 0.0) + seconds, 6)
+    for namespace, count in hits.items():
+        stats["cache"][namespace] = stats["cache"].get(namespace, 0) + count
+    if token_usage:
+        stats["input_tokens"] += int(token_usage.get("input_tokens") or 0)
+        stats["output_tokens"] += int(token_usage.get("output_tokens") or 0)
+    return stats
+
+
+def _classification(state: Dict[str, Any]) -> str:
+    if state.get("is_kb_relevant") is None:
+        return ""
+    return "RELEVANTE" if state.get("is_kb_relevant") else "IRRELEVANTE"
+
+
+def build_record(state: Dict[str, Any], coalesced: bool = False) -> Dict[str, Any]:
+    """Registro compacto de uma execução a partir do estado final."""
+    now = time.time()
+    stats = {} if coalesced else (state.get("run_stats") or {})
+    node_seconds = stats.get("nodes") or {}
+    similarity = state.get("best_similarity_score")
+    record: Dict[str, Any] = {
+        "ts": now,
+        "day": time.strftime("%Y-%m-%d", time.localtime(now)),
+        "ticket_id": str(state.get("ticket_id") or ""),
+        "kb_id": str(state.get("kb_id") or "").upper(),
+        "status": state.get("status") or "",
+        "classification": _classification(state),
+        "retrieval_backend": state.get("retrieval_backend") or "",
+        "model_tier": state.get("model_tier") or "",
+        "similarity": float(similarity) if similarity is not None else float("nan"),
+        "degraded": int(bool(state.get("degraded"))),
+        "coalesced": int(coalesced),
+        "input_tokens": int(stats.get("input_tokens") or 0),
+        "output_tokens": int(stats.get("output_tokens") or 0),
+        "seconds": sum(node_seconds.values()),
+    }
+    for node, seconds in node_seconds.items():
+        record[NODE_PREFIX + node] = seconds
+    for namespace, count in (stats.get("cache") or {}).items():
+        record[CACHE_PREFIX + namespace] = count
+    return record
+
+
+# ---------------------------------------------------------------------------
+# Log colunar
+# ---------------------------------------------------------------------------
+def _dtype_for(column: str) -> Any:
+    if column in _COLUMNS:
+        return _COLUMNS[column]
+    if column.startswith(NODE_PREFIX):
+        return np.float32
+    if column.startswith(CACHE_PREFIX):
+        return np.int16
+    return str
+
+
+def _empty_value(column: str) -> Any:
+    """Valor de um campo ausente: "" em texto, NaN na similaridade, 0 no resto."""
+    if _dtype_for(column) is str:
+        return ""
+    return float("nan") if column == "similarity" else 0
+
+
+def to_columns(records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Registros → colunas NumPy (campos ausentes: "" ou 0)."""
+    names = list(_COLUMNS)
+    for record in records:
+        names.extend(k for k in record if k not in names)
+    columns: Dict[str, np.ndarray] = {}
+    for name in names:
+        dtype = _dtype_for(name)
+        default = _empty_value(name)
+        values = [record.get(name, default) for record in records]
+        columns[name] = np.array(values, dtype=dtype)
+    return columns
+
+
+def write_segment(columns: Dict[str, np.ndarray], directory: str = ANALYTICS_DIR) -> str:
+    """Grava um segmento .npz (arquivo temporário + rename) e devolve o caminho."""
+    os.makedirs(directory, exist_ok=True)
+    name = f"seg-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.monotonic_ns()}.npz"
+    path = os.path.join(directory, name)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp, path)
+    return path
+
+
+def segment_paths(directory: str = ANALYTICS_DIR) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, n)
+        for n in os.listdir(directory)
+        if n.startswith("seg-") and n.endswith(".npz")
+    )
+
+
+def read_segments(paths: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Lê e concatena os segmentos dados (colunas ausentes num segmento viram ""/0)."""
+    parts: List[Dict[str, np.ndarray]] = []
+    names: List[str] = []
+    for path in paths:
+        with np.load(path, allow_pickle=False) as data:
+            part = {k: data[k] for k in data.files}
+        parts.append(part)
+        names.extend(k for k in part if k not in names)
+    columns: Dict[str, np.ndarray] = {}
+    for name in names:
+        dtype = _dtype_for(name)
+        chunks = []
+        for part in parts:
+            rows = len(next(iter(part.values()))) if part else 0
+            if name in part:
+                chunks.append(part[name])
+            else:
+                chunks.append(np.full(rows, _empty_value(name), dtype=dtype))
+        columns[name] = np.concatenate(chunks) if chunks else np.array([], dtype=dtype)
+    return columns
+
+
+def read_log(directory: str = ANALYTICS_DIR, since: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Todos os segmentos da pasta; `since` (AAAA-MM-DD) filtra pelo dia."""
+    columns = read_segments(segment_paths(directory))
+    if since and "day" in columns:
+        keep = columns["day"] >= since
+        columns = {k: v[keep] for k, v in columns.items()}
+    return columns
+
+
+class AnalyticsLog:
+    """Buffer de registros do processo, gravado em segmentos por lote."""
+
+    def __init__(
+        self,
+        directory: str = ANALYTICS_DIR,
+        flush_rows: int = ANALYTICS_FLUSH_ROWS,
+        flush_seconds: float = ANALYTICS_FLUSH_SECONDS,
+    ):
+        self.directory = directory
+        self.flush_rows = max(1, flush_rows)
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_flush = time.monotonic()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._buffer.append(record)
+            due = (
+                len(self._buffer) >= self.flush_rows
+                or time.monotonic() - self._last_flush >= self.flush_seconds
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> Optional[str]:
+        """Grava o que está no buffer; devolve o caminho do segmento (ou None)."""
+        with self._lock:
+            records, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not records:
+            return None
+        try:
+            path = write_segment(to_columns(records), self.directory)
+        except OSError as e:
+            metrics.incr("analytics_write_errors")
+            print(f"Falha ao gravar o log de analytics: {e!s}")
+            return None
+        metrics.incr("analytics_records", len(records))
+        return path
+
+    def _after_fork(self) -> None:
+        # Os registros do pai são gravados por ele; o filho começa vazio
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+
+_log = AnalyticsLog()
+atexit.register(_log.flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_log._after_fork)
+
+
+def record_run(state: Dict[str, Any], coalesced: bool = False) -> None:
+    """Entrega o registro da execução ao log do processo (com M1_ANALYTICS=1)."""
+    if ANALYTICS_ENABLED:
+        _log.append(build_record(state, coalesced))
+
+
+def flush() -> Optional[str]:
+    """Grava os registros pendentes do processo (workers que saem com os._exit)."""
+    return _log.flush()
+
+
+def compact(directory: str = ANALYTICS_DIR) -> Optional[str]:
+    """
+    Junta os segmentos num só e apaga os antigos. Lê exatamente a lista que
+    vai apagar: um segmento gravado por um worker durante a compactação fica
+    para a próxima.
+    """
+    paths = segment_paths(directory)
+    if len(paths) < 2:
+        return paths[0] if paths else None
+    columns = read_segments(paths)
+    merged = write_segment(columns, directory)
+    for path in paths:
+        os.remove(path)
+    return merged
+
+
+# ---------------------------------------------------------------------------
+# Relatório
+# ---------------------------------------------------------------------------
+def _group_keys(columns: Dict[str, np.ndarray], by: str) -> np.ndarray:
+    kb = np.where(columns["kb_id"] == "", "(sem KB)", columns["kb_id"])
+    if by == "kb":
+        return kb
+    if by == "day":
+        return columns["day"]
+    if by == "kb-day":
+        return np.char.add(np.char.add(columns["day"], " "), kb)
+    raise ValueError(f"--by deve ser kb, day ou kb-day (recebido: {by!r}).")
+
+
+def report(columns: Dict[str, np.ndarray], by: str = "kb", sort: str = "tokens") -> List[Dict[str, Any]]:
+    """
+    Agrega o log por KB, dia ou KB+dia: tickets, tokens (total, por ticket e
+    participação), latência p50/p95, nó mais lento em média, taxa de
+    relevância e tickets com acerto de cache.
+    """
+    if not columns or not len(columns.get("ts", [])):
+        return []
+    keys, inverse = np.unique(_group_keys(columns, by), return_inverse=True)
+    tokens = columns["input_tokens"].astype(np.int64) + columns["output_tokens"].astype(np.int64)
+    total_tokens = max(int(tokens.sum()), 1)
+    node_columns = [k for k in columns if k.startswith(NODE_PREFIX)]
+    cache_columns = [k for k in columns if k.startswith(CACHE_PREFIX)]
+    cache_hit = (
+        np.sum([columns[k] > 0 for k in cache_columns], axis=0) > 0
+        if cache_columns
+        else np.zeros(len(tokens), dtype=bool)
+    ) | (columns["retrieval_backend"] == "faq")
+    executed = columns["coalesced"] == 0
+    classified = columns["classification"] != ""
+
+    rows: List[Dict[str, Any]] = []
+    for g, key in enumerate(keys):
+        mask = inverse == g
+        run = mask & executed
+        seconds = columns["seconds"][run]
+        node_means = {
+            k[len(NODE_PREFIX):]: float(columns[k][run].mean()) for k in node_columns if run.any()
+        }
+        slowest = max(node_means, key=node_means.get) if node_means else ""
+        n_classified = int((mask & classified).sum())
+        rows.append(
+            {
+                "group": str(key),
+                "tickets": int(mask.sum()),
+                "coalesced": int((mask & ~executed).sum()),
+                "input_tokens": int(columns["input_tokens"][mask].sum()),
+                "output_tokens": int(columns["output_tokens"][mask].sum()),
+                "tokens_per_ticket": round(float(tokens[run].mean()), 1) if run.any() else 0.0,
+                "token_share": round(float(tokens[mask].sum()) / total_tokens, 4),
+                "p50_seconds": round(float(np.percentile(seconds, 50)), 3) if seconds.size else 0.0,
+                "p95_seconds": round(float(np.percentile(seconds, 95)), 3) if seconds.size else 0.0,
+                "seconds_total": round(float(seconds.sum()), 3),
+                "slowest_node": slowest,
+                "slowest_node_seconds": round(node_means.get(slowest, 0.0), 3),
+                "relevant_rate": round(
+                    float((columns["classification"][mask] == "RELEVANTE").sum()) / n_classified, 3
+                )
+                if n_classified
+                else None,
+                "cache_hit_rate": round(float(cache_hit[mask].mean()), 3),
+            }
+        )
+    order = {
+        "tokens": lambda r: -(r["input_tokens"] + r["output_tokens"]),
+        "seconds": lambda r: -r["seconds_total"],
+        "p95": lambda r: -r["p95_seconds"],
+        "tickets": lambda r: -r["tickets"],
+        "group": lambda r: r["group"],
+    }
+    if sort not in order:
+        raise ValueError(f"--sort deve ser um de {', '.join(order)} (recebido: {sort!r}).")
+    return sorted(rows, key=order[sort])
+
+
+def _print_report(rows: List[Dict[str, Any]], top: int) -> None:
+    header = (
+        f"{'grupo':<24} {'tickets':>7} {'tok in':>9} {'tok out':>8} {'tok/tkt':>8} "
+        f"{'% tok':>6} {'p50 s':>7} {'p95 s':>7} {'nó mais lento':<22} {'relev.':>6} {'cache':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows[:top] if top else rows:
+        relevant = f"{row['relevant_rate']:.0%}" if row["relevant_rate"] is not None else "-"
+        slowest = f"{row['slowest_node']} {row['slowest_node_seconds']:.2f}" if row["slowest_node"] else "-"
+        print(
+            f"{row['group'][:24]:<24} {row['tickets']:>7} {row['input_tokens']:>9} "
+            f"{row['output_tokens']:>8} {row['tokens_per_ticket']:>8.0f} {row['token_share']:>6.1%} "
+            f"{row['p50_seconds']:>7.2f} {row['p95_seconds']:>7.2f} {slowest[:22]:<22} "
+            f"{relevant:>6} {row['cache_hit_rate']:>6.0%}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Custo de tokens e latência por KB.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rp = sub.add_parser("report", help="Agrega o log por KB e/ou dia.")
+    rp.add_argument("--dir", default=ANALYTICS_DIR)
+    rp.add_argument("--by", default="kb", choices=["kb", "day", "kb-day"])
+    rp.add_argument("--since", help="Primeiro dia (AAAA-MM-DD).")
+    rp.add_argument("--sort", default="tokens", choices=["tokens", "seconds", "p95", "tickets", "group"])
+    rp.add_argument("--top", type=int, default=30, help="Linhas exibidas (0 = todas).")
+    rp.add_argument("--json", help="Grava o relatório completo neste arquivo.")
+
+    cp = sub.add_parser("compact", help="Junta os segmentos do log num só.")
+    cp.add_argument("--dir", default=ANALYTICS_DIR)
+
+    args = parser.parse_args(argv)
+    if args.command == "compact":
+        before = len(segment_paths(args.dir))
+        merged = compact(args.dir)
+        print(f"{before} segmentos → {merged or 'nenhum'}")
+        return
+
+    columns = read_log(args.dir, args.since)
+    rows = report(columns, args.by, args.sort)
+    if not rows:
+        print("Nenhum registro em", args.dir)
+        return
+    _print_report(rows, args.top)
+    print(
+        f"\n{len(columns['ts'])} tickets, "
+        f"{int(columns['input_tokens'].sum())} tokens de entrada, "
+        f"{int(columns['output_tokens'].sum())} de saída"
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Cache de respostas recentes — Módulo M1 N1 Chamados
+
+Guarda as últimas respostas geradas com sucesso, por (kb_id, pergunta
+normalizada). É usado pelo generate_answer no modo degradado: com o circuito
+da OpenAI aberto, um chamado idêntico a um já respondido recebe a resposta
+anterior em vez de ir direto para o atendente.
+
+Namespace "answers" do cache do M1 (cache.py): com M1_CACHE_BACKEND=memory, LRU
+no processo limitado a ANSWER_CACHE_SIZE entradas; com sqlite/redis, a resposta
+gerada por um worker serve aos demais.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+from m1_busca_documental.cache import get_cache
+from m1_busca_documental.config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS
+from m1_busca_documental.text_normalization import normalize_query
+
+
+def _cache() -> Any:
+    return get_cache(
+        "answers", ttl=ANSWER_CACHE_TTL_SECONDS or None, max_entries=ANSWER_CACHE_SIZE
+    )
+
+
+def _key(kb_id: str, user_query: str) -> Tuple[str, str]:
+    return (kb_id or "", normalize_query(user_query))
+
+
+def get_answer(kb_id: str, user_query: str) -> Optional[Dict[str, Any]]:
+    """Resposta guardada para o KB + pergunta, ou None."""
+    return _cache().get(_key(kb_id, user_query))
+
+
+def put_answer(kb_id: str, user_query: str, answer: Dict[str, Any]) -> None:
+    """Guarda a resposta (final_response, is_kb_relevant...); o backend descarta as mais antigas."""
+    if ANSWER_CACHE_SIZE <= 0:
+        return
+    _cache().set(_key(kb_id, user_query), answer)
+
+
+def size() -> int:
+    return int(_cache().backend.stats().get("entries") or 0)
@@ -0,0 +1,144 @@
+"""
+Execução em lote retomável — Módulo M1 N1 Chamados
+
+Processa um arquivo JSONL de tickets ({"ticket_id": "...", "user_query": "..."}
+por linha) com o grafo compilado com checkpointer SQLite. Cada ticket usa o
+próprio ticket_id como thread_id, então:
+
+- ticket já concluído numa execução anterior → não roda de novo;
+- ticket interrompido no meio → retoma do último nó concluído;
+- ticket novo → executa do início.
+
+Uso:
+  python -m m1_busca_documental.batch tickets.jsonl
+  python -m m1_busca_documental.batch tickets.jsonl --db m1_checkpoints.sqlite --output resultados.jsonl
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental.checkpointing import (
+    build_sqlite_checkpointer,
+    prune_checkpoints,
+    ticket_config,
+)
+from m1_busca_documental.config import CHECKPOINT_DB
+from m1_busca_documental.graph import build_rag_graph
+from m1_busca_documental.profiling import invoke_profiled
+
+# Campos do estado final gravados no arquivo de saída
+RESULT_FIELDS = (
+    "ticket_id",
+    "user_query",
+    "kb_id",
+    "best_similarity_score",
+    "final_response",
+    "is_kb_relevant",
+    "status",
+    "model_tier",
+    "token_usage",
+    "error",
+)
+
+
+def read_tickets(path: str) -> Iterator[Dict[str, Any]]:
+    """Lê tickets de um arquivo JSONL (linhas vazias são ignoradas)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            ticket = json.loads(line)
+            if not ticket.get("ticket_id"):
+                raise ValueError(f"Linha {line_no}: ticket sem 'ticket_id'.")
+            yield ticket
+
+
+def run_ticket(graph: Any, ticket: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Executa (ou retoma) um ticket no grafo com checkpointer.
+
+    Retorna o estado final acrescido de "batch_action":
+    "skipped" (já concluído), "resumed" ou "started".
+    """
+    config = ticket_config(ticket["ticket_id"])
+    snapshot = graph.get_state(config)
+
+    if snapshot.values and not snapshot.next:
+        return {**snapshot.values, "batch_action": "skipped"}
+
+    if snapshot.next:
+        # invoke(None, ...) continua a partir do checkpoint salvo
+        result = invoke_profiled(graph, None, config)
+        return {**result, "batch_action": "resumed"}
+
+    initial_state = {
+        "ticket_id": str(ticket["ticket_id"]),
+        "user_query": ticket.get("user_query") or "",
+        "priority": "batch",
+    }
+    result = invoke_profiled(graph, initial_state, config)
+    return {**result, "batch_action": "started"}
+
+
+def run_batch(
+    tickets: Iterable[Dict[str, Any]],
+    db_path: str = CHECKPOINT_DB,
+    prune: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Processa os tickets em sequência com checkpoint em SQLite (db_path).
+    Ao final, opcionalmente remove o histórico intermediário de checkpoints.
+    """
+    checkpointer = build_sqlite_checkpointer(db_path)
+    graph = build_rag_graph(checkpointer=checkpointer)
+
+    results = []
+    for ticket in tickets:
+        result = run_ticket(graph, ticket)
+        print(f"[{result['batch_action']}] ticket {ticket['ticket_id']}: {result.get('status')}")
+        results.append(result)
+
+    if prune:
+        prune_checkpoints(checkpointer)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Execução em lote retomável do M1.")
+    parser.add_argument("tickets", help="Arquivo JSONL com ticket_id e user_query por linha.")
+    parser.add_argument("--db", default=CHECKPOINT_DB, help="Banco SQLite de checkpoints.")
+    parser.add_argument("--output", help="Arquivo JSONL para gravar os resultados.")
+    parser.add_argument(
+        "--no-prune",
+        action="store_true",
+        help="Mantém o histórico completo de checkpoints (por padrão só o último por ticket).",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_batch(read_tickets(args.tickets), db_path=args.db, prune=not args.no_prune)
+
+    actions = [r["batch_action"] for r in results]
+    print(
+        f"\nTotal: {len(results)} | iniciados: {actions.count('started')} | "
+        f"retomados: {actions.count('resumed')} | já concluídos: {actions.count('skipped')}"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for r in results:
+                row = {k: r.get(k) for k in RESULT_FIELDS}
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        print("Resultados gravados em:", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Caches do M1 num backend plugável — Módulo M1 N1 Chamados
+
+Um cache só ajuda de verdade se os workers o compartilham. M1_CACHE_BACKEND
+escolhe onde ficam os caches de todos os nós (integrations/cache.py):
+
+- memory: LRU no processo (padrão; cada worker tem o seu);
+- sqlite: arquivo M1_CACHE_SQLITE_PATH compartilhado pelos processos do host
+  (prefork, vários workers do uvicorn);
+- redis: servidor Redis (ou compatível) em M1_CACHE_REDIS_URL, compartilhado
+  entre hosts. Para testes: integrations.cache.RespStandIn.
+
+Namespaces em uso:
+- answers: respostas recentes por KB + pergunta (answer_cache.py, modo degradado);
+- libindexr: respostas da busca por (índice, pergunta normalizada, parâmetros),
+  com M1_CACHE_LIBINDEXR_TTL_SECONDS > 0.
+
+Os valores são fragmentos do AgentState (dicts pequenos de texto, números e
+booleanos): JSON compacto (orjson) e zlib acima de M1_CACHE_COMPRESS_MIN_BYTES.
+Métrica cache_requests{cache, outcome=hit|miss|error} e coletor "cache" com
+acertos por namespace e o estado do backend.
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+from integrations.cache import MemoryLRUBackend, ObjectCache, RespBackend, SqliteBackend
+from m1_busca_documental import analytics, metrics
+from m1_busca_documental.config import (
+    CACHE_BACKEND,
+    CACHE_COMPRESS_MIN_BYTES,
+    CACHE_MAX_BYTES,
+    CACHE_REDIS_URL,
+    CACHE_SQLITE_PATH,
+)
+
+_lock = threading.Lock()
+_backends: Dict[str, Any] = {}
+_caches: Dict[str, ObjectCache] = {}
+
+
+def build_backend(kind: str = CACHE_BACKEND, max_entries: int = 0) -> Any:
+    """Backend pelo nome (memory, sqlite, redis)."""
+    kind = (kind or "memory").strip().lower()
+    if kind == "memory":
+        return MemoryLRUBackend(max_bytes=CACHE_MAX_BYTES, max_entries=max_entries)
+    if kind == "sqlite":
+        return SqliteBackend(CACHE_SQLITE_PATH, max_bytes=CACHE_MAX_BYTES)
+    if kind == "redis":
+        return RespBackend(CACHE_REDIS_URL, prefix="m1:")
+    raise ValueError(f"M1_CACHE_BACKEND deve ser memory, sqlite ou redis (recebido: {kind!r}).")
+
+
+def _record(namespace: str, outcome: str) -> None:
+    metrics.incr("cache_requests", cache=namespace, outcome=outcome)
+    analytics.note_cache(namespace, outcome)
+
+
+def get_cache(namespace: str, ttl: Optional[float] = None, max_entries: int = 0) -> ObjectCache:
+    """
+    Cache do namespace no processo. Com o backend memory cada namespace tem o
+    seu LRU (max_entries limita o número de entradas); os backends
+    compartilhados são um só para todos os namespaces.
+    """
+    with _lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            if CACHE_BACKEND == "memory":
+                backend = build_backend("memory", max_entries)
+            else:
+                backend = _backends.get(CACHE_BACKEND)
+                if backend is None:
+                    backend = _backends[CACHE_BACKEND] = build_backend(CACHE_BACKEND)
+            cache = ObjectCache(
+                backend,
+                namespace,
+                ttl=ttl,
+                compress_min_bytes=CACHE_COMPRESS_MIN_BYTES,
+                on_result=_record,
+            )
+            _caches[namespace] = cache
+        return cache
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        caches = dict(_caches)
+    return {
+        name: {**cache.stats(), "backend": cache.backend.stats()} for name, cache in caches.items()
+    }
+
+
+def reset() -> None:
+    """Esquece os caches do processo (testes e troca de backend)."""
+    with _lock:
+        _caches.clear()
+        _backends.clear()
+
+
+metrics.register_collector("cache", stats)
@@ -0,0 +1,154 @@
+"""
+Checkpointing persistente (SQLite) — Módulo M1 N1 Chamados
+
+Com um checkpointer, o LangGraph salva o estado após cada nó concluído. Se um
+processamento em lote morrer no meio, basta invocar de novo com o mesmo
+thread_id (aqui: o id do ticket) e o grafo continua do último nó concluído —
+sem repetir chamadas já pagas à LLM.
+
+Para manter o banco pequeno:
+- CompactStateSerializer reduz o api_response (resposta bruta do libindexr,
+  com os chunks de todos os documentos) aos chunks do documento escolhido
+  (doc_reference) — é o que o assemble_chunk_context precisa para um lote
+  retomado seguir no caminho rápido — e comprime com zlib os blobs acima de
+  algumas centenas de bytes.
+- prune_checkpoints() remove o histórico intermediário, mantendo só o último
+  checkpoint de cada ticket.
+
+Requer o pacote opcional langgraph-checkpoint-sqlite.
+"""
+
+import sqlite3
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from m1_busca_documental.config import CHECKPOINT_DB
+
+# Prefixo do "type" gravado no banco para blobs comprimidos
+_COMPRESSED_PREFIX = "z+"
+
+
+def compact_api_response(response: Any, doc_reference: Any) -> Optional[Dict[str, Any]]:
+    """
+    api_response só com os chunks (e as cadeias de vizinhos) do documento
+    doc_reference; None se não houver documento escolhido ou chunks dele.
+    """
+    if not isinstance(response, dict) or not doc_reference:
+        return None
+    results = []
+    for res in response.get("results") or []:
+        if not isinstance(res, dict):
+            continue
+        chunks = [
+            entry
+            for entry in res.get("chunks") or []
+            if isinstance(entry, dict)
+            and isinstance(entry.get("chunk"), dict)
+            and str(entry["chunk"].get("sourceId")) == str(doc_reference)
+        ]
+        if chunks:
+            results.append({**res, "chunks": chunks})
+    return {"results": results} if results else None
+
+
+class CompactStateSerializer:
+    """
+    Serializer (SerializerProtocol do LangGraph) que envolve o JsonPlusSerializer
+    padrão, reduzindo o api_response dos checkpoints ao documento escolhido e
+    comprimindo blobs grandes.
+    """
+
+    def __init__(self, inner: Any = None, compress_min_bytes: int = 512, level: int = 6):
+        if inner is None:
+            from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+            inner = JsonPlusSerializer()
+        self.inner = inner
+        self.compress_min_bytes = compress_min_bytes
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        # Checkpoint completo: {"channel_values": {...estado...}, ...}
+        if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+            channel_values = obj["channel_values"]
+            if channel_values.get("api_response") is not None:
+                obj = {
+                    **obj,
+                    "channel_values": {
+                        **channel_values,
+                        "api_response": compact_api_response(
+                            channel_values["api_response"], channel_values.get("doc_reference")
+                        ),
+                    },
+                }
+
+        type_, data = self.inner.dumps_typed(obj)
+        if len(data) >= self.compress_min_bytes:
+            return _COMPRESSED_PREFIX + type_, zlib.compress(data, self.level)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.startswith(_COMPRESSED_PREFIX):
+            type_ = type_[len(_COMPRESSED_PREFIX):]
+            payload = zlib.decompress(payload)
+        return self.inner.loads_typed((type_, payload))
+
+
+def build_sqlite_checkpointer(db_path: str = CHECKPOINT_DB) -> Any:
+    """
+    Cria um SqliteSaver (langgraph-checkpoint-sqlite) com o CompactStateSerializer.
+    O arquivo é criado se não existir.
+    """
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as e:
+        raise ImportError(
+            "Checkpoint em SQLite requer o pacote 'langgraph-checkpoint-sqlite' "
+            "(pip install langgraph-checkpoint-sqlite)."
+        ) from e
+
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    return SqliteSaver(conn, serde=CompactStateSerializer())
+
+
+def ticket_config(ticket_id: Any) -> Dict[str, Any]:
+    """Config do LangGraph que associa a execução ao ticket (thread_id = id do ticket)."""
+    return {"configurable": {"thread_id": str(ticket_id)}}
+
+
+def prune_checkpoints(checkpointer: Any, vacuum: bool = False) -> int:
+    """
+    Mantém apenas o checkpoint mais recente de cada ticket (e as escritas
+    pendentes dele). Os ids de checkpoint são ordenáveis no tempo, então o
+    maior id é o mais recente.
+
+    Retorna a quantidade de checkpoints removidos.
+    """
+    with checkpointer.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM checkpoints
+            WHERE checkpoint_id NOT IN (
+                SELECT MAX(checkpoint_id) FROM checkpoints AS latest
+                WHERE latest.thread_id = checkpoints.thread_id
+                  AND latest.checkpoint_ns = checkpoints.checkpoint_ns
+            )
+            """
+        )
+        removed = cur.rowcount
+        cur.execute(
+            """
+            DELETE FROM writes
+            WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints AS c
+                WHERE c.thread_id = writes.thread_id
+                  AND c.checkpoint_ns = writes.checkpoint_ns
+                  AND c.checkpoint_id = writes.checkpoint_id
+            )
+            """
+        )
+    if vacuum:
+        with checkpointer.lock:
+            checkpointer.conn.execute("VACUUM")
+    return removed
@@ -0,0 +1,81 @@
+"""
+Contexto a partir dos chunks — Módulo M1 N1 Chamados
+
+Caminho rápido do pipeline (M1_CHUNK_FAST_PATH): em vez de carregar o KB
+inteiro no fetch_local_document, o generate_answer responde a partir dos
+chunks que o libindexr já devolveu para o documento escolhido. Com
+useChunkChain, a API também devolve os chunks vizinhos de cada acerto
+(até maxChunkChainLink elos), o que costuma bastar para perguntas pontuais.
+
+build_chunk_context() junta esses chunks num texto compacto: só os do
+documento escolhido, sem repetição, na ordem do documento quando a API
+informa a posição, e limitado a CHUNK_CONTEXT_MAX_CHARS.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+
+from m1_busca_documental.config import CHUNK_CONTEXT_MAX_CHARS
+
+# Campos em que a API pode devolver a cadeia de chunks vizinhos de um acerto
+_CHAIN_KEYS = ("chunkChain", "chain", "linkedChunks")
+# Campos com a posição do chunk no documento (o primeiro presente é usado)
+_POSITION_KEYS = ("chunkIndex", "index", "order", "position", "sequence")
+
+CHUNK_SEPARATOR = "\n...\n"
+
+
+def _position(chunk: Dict[str, Any]) -> Optional[float]:
+    for key in _POSITION_KEYS:
+        value = chunk.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+def _iter_document_chunks(
+    response: Dict[str, Any], source_id: str
+) -> Iterator[Dict[str, Any]]:
+    """Chunks (dicionário "chunk") do documento, incluindo os da cadeia de cada acerto."""
+    for res in (response or {}).get("results") or []:
+        if not isinstance(res, dict):
+            continue
+        for entry in res.get("chunks") or []:
+            chunk = entry.get("chunk") if isinstance(entry, dict) else None
+            if not isinstance(chunk, dict) or str(chunk.get("sourceId")) != source_id:
+                continue
+            yield chunk
+            for key in _CHAIN_KEYS:
+                for linked in entry.get(key) or chunk.get(key) or []:
+                    linked = linked.get("chunk", linked) if isinstance(linked, dict) else None
+                    if isinstance(linked, dict):
+                        yield linked
+
+
+def build_chunk_context(
+    response: Dict[str, Any], source_id: str, max_chars: int = CHUNK_CONTEXT_MAX_CHARS
+) -> str:
+    """
+    Texto do documento `source_id` montado a partir dos chunks da resposta.
+    Retorna "" quando não há chunks com conteúdo.
+    """
+    seen = set()
+    chunks: List[Dict[str, Any]] = []
+    for chunk in _iter_document_chunks(response, str(source_id)):
+        raw = (chunk.get("rawContent") or "").strip()
+        if raw and raw not in seen:
+            seen.add(raw)
+            chunks.append({"raw": raw, "position": _position(chunk), "arrival": len(chunks)})
+
+    # Com posição informada, segue a ordem do documento; sem posição, a ordem de chegada
+    if chunks and all(c["position"] is not None for c in chunks):
+        chunks.sort(key=lambda c: c["position"])
+
+    parts: List[str] = []
+    total = 0
+    for c in chunks:
+        room = max_chars - total
+        if room <= 0:
+            break
+        parts.append(c["raw"][:room])
+        total += len(parts[-1]) + len(CHUNK_SEPARATOR)
+    return CHUNK_SEPARATOR.join(parts)
@@ -18,6 +18,26 @@ def _env(key: str, default: str = "") -> str:
     return os.environ.get(key, default) or default
 
 
+def _env_bool(key: str, default: bool = False) -> bool:
+    """Helper para flags booleanas (1/true/yes/on)."""
+    value = os.environ.get(key)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_floats(key: str, default: str, count: int) -> tuple:
+    """Helper para listas de números separados por vírgula, com tamanho fixo."""
+    raw = _env(key, default)
+    try:
+        values = tuple(float(v) for v in raw.split(","))
+    except ValueError:
+        values = ()
+    if len(values) != count:
+        raise ValueError(f"{key}: esperados {count} números separados por vírgula, recebido {raw!r}.")
+    return values
+
+
 # --- Configurações Extraídas ---
 
 # Documentos locais
@@ -29,11 +49,198 @@ LIBINDEXR_BASE_URL = _env(
 )
 LIBINDEXR_API_KEY = _env("LIBINDEXR_API_KEY")
 INDEX_ID = _env("M1_INDEX_ID")
+# Vários índices consultados em paralelo (multi_index.py): lista separada por vírgula,
+# ou "auto" para usar todos os index_id da tabela n1_chamados. Vazio = só INDEX_ID.
+INDEX_IDS = _env("M1_INDEX_IDS", "")
+MULTI_INDEX_DEADLINE_SECONDS = float(_env("M1_MULTI_INDEX_DEADLINE_SECONDS", "4"))
+MULTI_INDEX_MAX_WORKERS = int(_env("M1_MULTI_INDEX_MAX_WORKERS", "16"))
+
+# Roteamento direto por palavra-chave (keyword_router.py): código KB, título ou apelido
+# na pergunta leva direto ao fetch_local_document, sem busca vetorial.
+KEYWORD_ROUTING_ENABLED = _env_bool("M1_KEYWORD_ROUTING", True)
+KB_ALIASES_PATH = _env("M1_KB_ALIASES") or str(Path(__file__).resolve().parent / "kb_aliases.yaml")
 
 # Parâmetros de Busca
-DEFAULT_QUANTITY = 3
-DEFAULT_THRESHOLD_SIMILARITY = 0.4
+DEFAULT_QUANTITY = int(_env("M1_QUANTITY", "3"))
+DEFAULT_THRESHOLD_SIMILARITY = float(_env("M1_THRESHOLD_SIMILARITY", "0.4"))
 
 # OpenAI 
 OPENAI_API_KEY = _env("N1_OPENAI_API_KEY_AF")
 LLM_MODEL = _env("M1_LLM_MODEL", "gpt-4o")
+
+# Roteamento de modelo por ticket (tiering)
+# Tickets curtos e de alta confiança vão para o modelo menor; o resto fica no LLM_MODEL.
+MODEL_ROUTING_ENABLED = _env_bool("M1_MODEL_ROUTING", True)
+LLM_MODEL_SMALL = _env("M1_LLM_MODEL_SMALL", "gpt-4o-mini")
+ROUTER_MIN_SIMILARITY = float(_env("M1_ROUTER_MIN_SIMILARITY", "0.75"))
+ROUTER_MAX_DOC_CHARS = int(_env("M1_ROUTER_MAX_DOC_CHARS", "12000"))
+ROUTER_MAX_QUERY_CHARS = int(_env("M1_ROUTER_MAX_QUERY_CHARS", "200"))
+# Se o modelo menor precisou ser escalado esta fração das vezes para um KB, o KB vai direto ao maior
+ROUTER_MAX_KB_ESCALATION_RATE = float(_env("M1_ROUTER_MAX_KB_ESCALATION_RATE", "0.3"))
+
+# Saída do generate_answer. M1_STRUCTURED_OUTPUT=1 usa os prompts v4_json (JSON com
+# classification/source/answer via response_format). M1_OUTPUT_TOKEN_CAPS limita os tokens
+# de saída por classificação ("RELEVANTE:600,IRRELEVANTE:250,INSUFICIENTE:40"): a resposta
+# é lida em streaming e cortada no limite assim que a classificação aparece. Vazio = sem
+# limite. M1_LLM_STOP: sequências de parada enviadas à API, separadas por "|".
+STRUCTURED_OUTPUT = _env_bool("M1_STRUCTURED_OUTPUT", False)
+OUTPUT_TOKEN_CAPS = _env("M1_OUTPUT_TOKEN_CAPS", "")
+LLM_STOP_SEQUENCES = [s for s in _env("M1_LLM_STOP", "").split("|") if s]
+
+# Coalescência (single-flight) de tickets/buscas/chamadas LLM idênticos e concorrentes
+COALESCING_ENABLED = _env_bool("M1_COALESCING", True)
+
+# Checkpoint persistente (SQLite) para execuções em lote retomáveis
+CHECKPOINT_DB = _env("M1_CHECKPOINT_DB") or str(ROOT_DIR / "m1_checkpoints.sqlite")
+
+# Limites da conta OpenAI (0 = sem limite). Com RPM/TPM > 0, todas as chamadas à LLM do
+# processo passam por um scheduler com token buckets e prioridade interactive > batch.
+OPENAI_RPM = int(_env("M1_OPENAI_RPM", "0"))
+OPENAI_TPM = int(_env("M1_OPENAI_TPM", "0"))
+OPENAI_EXPECTED_OUTPUT_TOKENS = int(_env("M1_OPENAI_EXPECTED_OUTPUT_TOKENS", "512"))
+
+# Timeouts e circuit breakers (libindexr e OpenAI). Com o circuito aberto o pipeline
+# segue pelo modo degradado: busca lexical local e respostas em cache / atendente.
+LIBINDEXR_TIMEOUT_SECONDS = float(_env("M1_LIBINDEXR_TIMEOUT_SECONDS", "15"))
+OPENAI_TIMEOUT_SECONDS = float(_env("M1_OPENAI_TIMEOUT_SECONDS", "60"))
+CIRCUIT_FAILURE_THRESHOLD = int(_env("M1_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(_env("M1_CIRCUIT_RESET_SECONDS", "30"))
+LIBINDEXR_SLOW_CALL_SECONDS = float(_env("M1_LIBINDEXR_SLOW_CALL_SECONDS", "5"))
+OPENAI_SLOW_CALL_SECONDS = float(_env("M1_OPENAI_SLOW_CALL_SECONDS", "45"))
+# Cobertura mínima dos termos da pergunta para aceitar um KB da busca local degradada
+DEGRADED_MIN_COVERAGE = float(_env("M1_DEGRADED_MIN_COVERAGE", "0.5"))
+ANSWER_CACHE_SIZE = int(_env("M1_ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(_env("M1_ANSWER_CACHE_TTL_SECONDS", "0"))
+
+# Profiling por ticket (profiling.py): "off", "sample" (amostragem de pilhas, baixo custo)
+# ou "cprofile". PROFILE_RATE é a fração de tickets perfilados; tickets com "profile": true
+# são sempre perfilados.
+PROFILE_MODE = _env("M1_PROFILE", "off").strip().lower()
+PROFILE_RATE = float(_env("M1_PROFILE_RATE", "1.0"))
+PROFILE_INTERVAL_MS = float(_env("M1_PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = _env("M1_PROFILE_DIR") or str(ROOT_DIR / "m1_profiles")
+
+# Log colunar de custo por ticket (analytics.py): KB, tempos por nó, tokens e acertos de
+# cache, gravados em lotes; "python -m m1_busca_documental.analytics report" agrega.
+ANALYTICS_ENABLED = _env_bool("M1_ANALYTICS", False)
+ANALYTICS_DIR = _env("M1_ANALYTICS_DIR") or str(ROOT_DIR / "m1_analytics")
+ANALYTICS_FLUSH_ROWS = int(_env("M1_ANALYTICS_FLUSH_ROWS", "256"))
+ANALYTICS_FLUSH_SECONDS = float(_env("M1_ANALYTICS_FLUSH_SECONDS", "30"))
+
+# Origem do texto dos KBs no fetch_local_document: "files" (.txt em DOCS_REPO_PATH) ou
+# "pack" (arquivo único mapeado em memória, ver kb_pack.py; atualizar com
+# "python -m m1_busca_documental.kb_pack update" quando os KBs mudarem).
+KB_STORE = _env("M1_KB_STORE", "files").strip().lower()
+KB_PACK_DIR = _env("M1_KB_PACK_DIR") or str(ROOT_DIR / "m1_kb_pack")
+
+# Deduplicação dos KBs (m1_busca_documental/kb_dedup.py). Com o manifest gerado por
+# "python -m m1_busca_documental.kb_dedup scan" e M1_KB_DEDUP=1, a listagem dos KBs
+# (busca local, pack, índices, FAQ) só devolve o documento canônico de cada KB.
+KB_DEDUP_ENABLED = _env_bool("M1_KB_DEDUP", True)
+KB_DEDUP_MANIFEST = _env("M1_KB_DEDUP_MANIFEST") or str(ROOT_DIR / "m1_kb_dedup.json")
+KB_DEDUP_THRESHOLD = float(_env("M1_KB_DEDUP_THRESHOLD", "0.8"))
+KB_DEDUP_SHINGLE = int(_env("M1_KB_DEDUP_SHINGLE", "5"))
+KB_DEDUP_PERMUTATIONS = int(_env("M1_KB_DEDUP_PERMUTATIONS", "128"))
+
+# Runner multiprocesso (m1_busca_documental/prefork.py). 0 = um worker por CPU.
+PREFORK_WORKERS = int(_env("M1_PREFORK_WORKERS", "0"))
+
+# Serviço HTTP (m1_busca_documental/service.py)
+SERVICE_HOST = _env("M1_SERVICE_HOST", "0.0.0.0")
+SERVICE_PORT = int(_env("M1_SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(_env("M1_SERVICE_WORKERS", "8"))
+SERVICE_MAX_QUEUE = int(_env("M1_SERVICE_MAX_QUEUE", "32"))
+SERVICE_MAX_BODY_BYTES = int(_env("M1_SERVICE_MAX_BODY_BYTES", "65536"))
+
+# Escalonamento por prazo no serviço (m1_busca_documental/scheduler.py): fila EDF com SLA
+# por classe (interactive/batch) e preempção do lote nas fronteiras de nó quando um
+# interativo espera mais que M1_SCHED_PREEMPT_WAIT_SECONDS.
+SCHEDULER_ENABLED = _env_bool("M1_SCHEDULER", True)
+SCHED_INTERACTIVE_SLA_SECONDS = float(_env("M1_SCHED_INTERACTIVE_SLA_SECONDS", "30"))
+SCHED_BATCH_SLA_SECONDS = float(_env("M1_SCHED_BATCH_SLA_SECONDS", "3600"))
+SCHED_BATCH_MAX_QUEUE = int(_env("M1_SCHED_BATCH_MAX_QUEUE", "1000"))
+SCHED_PREEMPT_WAIT_SECONDS = float(_env("M1_SCHED_PREEMPT_WAIT_SECONDS", "0.5"))
+# Tickets de lote parados ao mesmo tempo (vazio = M1_SERVICE_WORKERS; 0 desliga a preempção)
+SCHED_MAX_PAUSED = int(_env("M1_SCHED_MAX_PAUSED")) if _env("M1_SCHED_MAX_PAUSED").strip() else None
+
+# Re-ranking local dos chunks por documento (rerank.py).
+# Pesos de (max, média, top-k, sobreposição lexical) no score combinado — um por
+# sinal de rerank.SIGNALS; outra quantidade falha já no import.
+RERANK_ENABLED = _env_bool("M1_RERANK", True)
+RERANK_WEIGHTS = _env_floats("M1_RERANK_WEIGHTS", "0.5,0.15,0.25,0.1", 4)
+RERANK_TOP_K = int(_env("M1_RERANK_TOP_K", "3"))
+
+# Backend de busca do call_libindexr: "libindexr" (API) ou "vector" (índice vetorial
+# local em VECTOR_INDEX_DIR, para réplicas sem rede; ver vector_store.py).
+RETRIEVAL_BACKEND = _env("M1_RETRIEVAL_BACKEND", "libindexr").strip().lower()
+VECTOR_INDEX_DIR = _env("M1_VECTOR_INDEX_DIR") or str(ROOT_DIR / "m1_vector_index")
+# Função de embedding "modulo:funcao" (vazio = hashing de termos, sem modelo)
+VECTOR_EMBEDDER = _env("M1_VECTOR_EMBEDDER", "")
+VECTOR_DIM = int(_env("M1_VECTOR_DIM", "1024"))
+VECTOR_CHUNK_CHARS = int(_env("M1_VECTOR_CHUNK_CHARS", "800"))
+VECTOR_CHUNK_OVERLAP = int(_env("M1_VECTOR_CHUNK_OVERLAP", "150"))
+VECTOR_NPROBE = int(_env("M1_VECTOR_NPROBE", "4"))
+# Os scores do embedding local não são comparáveis aos do libindexr: limiar próprio
+VECTOR_MIN_SIMILARITY = float(_env("M1_VECTOR_MIN_SIMILARITY", "0.1"))
+
+# Caminho rápido por chunks (chunk_context.py): pede ao libindexr a cadeia de chunks
+# vizinhos e responde só com eles; o KB inteiro é lido apenas se a LLM classificar
+# os trechos como INSUFICIENTE.
+CHUNK_FAST_PATH = _env_bool("M1_CHUNK_FAST_PATH", False)
+CHUNK_CHAIN_MAX_LINK = int(_env("M1_CHUNK_CHAIN_MAX_LINK", "2"))
+CHUNK_CONTEXT_MIN_CHARS = int(_env("M1_CHUNK_CONTEXT_MIN_CHARS", "300"))
+CHUNK_CONTEXT_MAX_CHARS = int(_env("M1_CHUNK_CONTEXT_MAX_CHARS", "6000"))
+
+# Profundidade adaptativa da busca (adaptive_retrieval.py): começa com uma busca pequena
+# e só aumenta quantity / baixa o limiar / pede a cadeia de chunks se os scores forem
+# ambíguos. Passos "quantidade@limiar[+chain]" separados por vírgula.
+ADAPTIVE_RETRIEVAL_ENABLED = _env_bool("M1_ADAPTIVE_RETRIEVAL", False)
+ADAPTIVE_STEPS = _env("M1_ADAPTIVE_STEPS") or (
+    f"1@{DEFAULT_THRESHOLD_SIMILARITY},"
+    f"{DEFAULT_QUANTITY}@{DEFAULT_THRESHOLD_SIMILARITY},"
+    f"{DEFAULT_QUANTITY * 2}@{max(DEFAULT_THRESHOLD_SIMILARITY - 0.1, 0.0):.2f}+chain"
+)
+ADAPTIVE_CONFIDENT_SCORE = float(_env("M1_ADAPTIVE_CONFIDENT_SCORE", "0.7"))
+ADAPTIVE_MIN_MARGIN = float(_env("M1_ADAPTIVE_MIN_MARGIN", "0.1"))
+
+# FAQ pré-computado (faq_store.py): respostas geradas offline para perguntas canônicas
+# por KB, servidas na hora enquanto o hash do .txt do KB não mudar.
+FAQ_ENABLED = _env_bool("M1_FAQ", True)
+FAQ_DB = _env("M1_FAQ_DB") or str(ROOT_DIR / "m1_faq.sqlite")
+FAQ_QUESTIONS_PATH = _env("M1_FAQ_QUESTIONS") or str(Path(__file__).resolve().parent / "faq_questions.yaml")
+FAQ_AUTO_REGENERATE = _env_bool("M1_FAQ_AUTO_REGENERATE", True)
+
+# Fila durável de hand-off (handoff.py): forward_to_user/forward_to_attendant
+# enfileiram o resultado e uma thread entrega em lotes ao sistema de chamados.
+HANDOFF_ENABLED = _env_bool("M1_HANDOFF", False)
+HANDOFF_DB = _env("M1_HANDOFF_DB") or str(ROOT_DIR / "m1_handoff.sqlite")
+# "stub" (local, para testes), "http" (integrations/ticketing.py) ou "modulo:funcao"
+HANDOFF_SINK = _env("M1_HANDOFF_SINK", "stub")
+HANDOFF_SINK_URL = _env("M1_HANDOFF_SINK_URL", "")
+HANDOFF_SINK_API_KEY = _env("M1_HANDOFF_SINK_API_KEY", "")
+HANDOFF_BATCH_SIZE = int(_env("M1_HANDOFF_BATCH_SIZE", "50"))
+HANDOFF_FLUSH_INTERVAL_MS = int(_env("M1_HANDOFF_FLUSH_INTERVAL_MS", "200"))
+HANDOFF_MAX_ATTEMPTS = int(_env("M1_HANDOFF_MAX_ATTEMPTS", "10"))
+HANDOFF_RETRY_BASE_SECONDS = float(_env("M1_HANDOFF_RETRY_BASE_SECONDS", "1"))
+# Tempo que um lote reservado por um processo fica fora da fila; se o processo
+# morrer antes de confirmar, o lote volta a "pending" ao fim do lease.
+HANDOFF_LEASE_SECONDS = float(_env("M1_HANDOFF_LEASE_SECONDS", "120"))
+
+# Afinidade por KB entre nós (kb_ring.py): cada ticket vai ao nó dono da chave
+# (kb:<KB> ou q:<pergunta>) num anel de hash consistente. Vazio = sem roteamento.
+RING_NODES = _env("M1_RING_NODES", "")
+RING_SELF = _env("M1_RING_SELF", "")
+RING_MEMBERS_FILE = _env("M1_RING_MEMBERS_FILE", "")
+RING_VNODES = int(_env("M1_RING_VNODES", "160"))
+RING_FORWARD_TIMEOUT_SECONDS = float(_env("M1_RING_FORWARD_TIMEOUT_SECONDS", "90"))
+RING_NODE_COOLDOWN_SECONDS = float(_env("M1_RING_NODE_COOLDOWN_SECONDS", "30"))
+
+# Backend dos caches do M1 (cache.py): "memory" (LRU por processo), "sqlite"
+# (arquivo compartilhado pelos processos do host) ou "redis" (entre hosts).
+CACHE_BACKEND = _env("M1_CACHE_BACKEND", "memory").strip().lower()
+CACHE_MAX_BYTES = int(_env("M1_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_SQLITE_PATH = _env("M1_CACHE_SQLITE_PATH") or str(ROOT_DIR / "m1_cache.sqlite")
+CACHE_REDIS_URL = _env("M1_CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+CACHE_COMPRESS_MIN_BYTES = int(_env("M1_CACHE_COMPRESS_MIN_BYTES", "1024"))
+# Respostas da busca do libindexr em cache (0 = desligado)
+CACHE_LIBINDEXR_TTL_SECONDS = float(_env("M1_CACHE_LIBINDEXR_TTL_SECONDS", "0"))
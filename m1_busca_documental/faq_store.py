@@ -0,0 +1,367 @@
+"""
+FAQ pré-computado por KB — Módulo M1 N1 Chamados
+
+As perguntas mais recorrentes têm sempre a mesma resposta enquanto o KB não
+muda. Um job offline gera essas respostas com o mesmo nó generate_answer
+(mesmo prompt, mesmo roteamento de modelo) para as perguntas canônicas de
+faq_questions.yaml e as grava num SQLite, com o hash do conteúdo do .txt do KB
+(só as versões canônicas do manifest de deduplicação, não todas as cópias).
+
+Online, o nó lookup_faq (primeiro nó do grafo) normaliza a pergunta e, se ela
+é uma pergunta canônica com resposta gravada para o hash atual do KB, a
+resposta sai na hora, sem busca nem LLM.
+
+Quando o .txt de um KB muda, o hash não confere: a resposta antiga não é
+servida e (com M1_FAQ_AUTO_REGENERATE) as respostas daquele KB são
+regeneradas em segundo plano, com prioridade "batch".
+
+Uso:
+  python -m m1_busca_documental.faq_store build [--kb KB0018415 ...] [--force]
+  python -m m1_busca_documental.faq_store list
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    DOCS_REPO_PATH,
+    FAQ_AUTO_REGENERATE,
+    FAQ_DB,
+    FAQ_QUESTIONS_PATH,
+)
+from m1_busca_documental.kb_catalog import canonical_path, kb_title, list_kb_files, read_kb_text
+from m1_busca_documental.text_normalization import normalize_query
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS faq_answers (
+    kb_id TEXT NOT NULL,
+    question_norm TEXT NOT NULL,
+    question TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    final_response TEXT NOT NULL,
+    llm_model TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (kb_id, question_norm)
+);
+CREATE INDEX IF NOT EXISTS faq_answers_question ON faq_answers (question_norm);
+"""
+
+_hash_lock = threading.Lock()
+# path -> (mtime, tamanho, sha256)
+_hash_cache: Dict[str, Tuple[float, int, str]] = {}
+
+
+def kb_paths(kb_id: str, docs_path: str = DOCS_REPO_PATH) -> List[str]:
+    """
+    .txt que formam o texto do KB no FAQ: só os canônicos (o manifest de
+    deduplicação tira as versões antigas), mesmo com M1_KB_DEDUP desligado. Um
+    KB que é cópia de outro fica com o seu próprio documento canônico.
+    """
+    kb_id = (kb_id or "").upper()
+    paths = list_kb_files(docs_path, canonical_only=True).get(kb_id)
+    if paths:
+        return paths
+    path = canonical_path(kb_id, docs_path)
+    return [path] if path else []
+
+
+def kb_content_hash(kb_id: str, docs_path: str = DOCS_REPO_PATH) -> Optional[str]:
+    """
+    sha256 do conteúdo dos .txt do KB (kb_paths, na ordem do nome). O hash de cada
+    arquivo é cacheado por (mtime, tamanho), então a verificação online não relê o KB.
+    """
+    paths = kb_paths(kb_id, docs_path)
+    if not paths:
+        return None
+    combined = hashlib.sha256()
+    for path in paths:
+        st = os.stat(path)
+        with _hash_lock:
+            cached = _hash_cache.get(path)
+        if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            digest = cached[2]
+        else:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            with _hash_lock:
+                _hash_cache[path] = (st.st_mtime, st.st_size, digest)
+        combined.update(digest.encode("ascii"))
+    return combined.hexdigest()
+
+
+def load_questions(path: str = FAQ_QUESTIONS_PATH) -> Dict[str, List[str]]:
+    """Perguntas canônicas por KB (faq_questions.yaml)."""
+    if not path or not os.path.isfile(path):
+        return {}
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return {str(kb).upper(): [str(q) for q in (qs or [])] for kb, qs in data.items()}
+
+
+class FaqStore:
+    """Respostas do FAQ em SQLite, por (kb_id, pergunta normalizada)."""
+
+    def __init__(self, db_path: str = FAQ_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def find(self, question_norm: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kb_id, question, content_hash, final_response, llm_model"
+                " FROM faq_answers WHERE question_norm = ?",
+                (question_norm,),
+            ).fetchall()
+        keys = ("kb_id", "question", "content_hash", "final_response", "llm_model")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def hashes(self, kb_id: str) -> Dict[str, str]:
+        """{pergunta normalizada: hash com que foi gerada} de um KB."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question_norm, content_hash FROM faq_answers WHERE kb_id = ?",
+                (kb_id,),
+            ).fetchall()
+        return dict(rows)
+
+    def put(
+        self,
+        kb_id: str,
+        question: str,
+        content_hash: str,
+        final_response: str,
+        llm_model: Optional[str],
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO faq_answers"
+                " (kb_id, question_norm, question, content_hash, final_response, llm_model, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    kb_id,
+                    normalize_query(question),
+                    question,
+                    content_hash,
+                    final_response,
+                    llm_model,
+                    time.time(),
+                ),
+            )
+
+    def delete_missing(self, kb_id: str, keep: Sequence[str]) -> int:
+        """Remove respostas de perguntas que saíram do faq_questions.yaml."""
+        keep = set(keep)
+        stale = [q for q in self.hashes(kb_id) if q not in keep]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM faq_answers WHERE kb_id = ? AND question_norm = ?",
+                [(kb_id, q) for q in stale],
+            )
+        return len(stale)
+
+    def all_rows(self) -> List[Tuple[str, str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT kb_id, question, content_hash FROM faq_answers ORDER BY kb_id, question"
+            ).fetchall()
+
+
+_store_lock = threading.Lock()
+_store: Optional[FaqStore] = None
+
+
+def get_faq_store() -> Optional[FaqStore]:
+    """Store do processo; None enquanto o banco do FAQ não foi gerado."""
+    global _store
+    with _store_lock:
+        if _store is None and os.path.exists(FAQ_DB):
+            _store = FaqStore(FAQ_DB)
+        return _store
+
+
+# ---------------------------------------------------------------------------
+# Geração (offline ou regeneração em segundo plano)
+# ---------------------------------------------------------------------------
+def build_kb(
+    store: FaqStore,
+    kb_id: str,
+    questions: Sequence[str],
+    force: bool = False,
+) -> Dict[str, int]:
+    """
+    Gera (ou regenera) as respostas de um KB. Perguntas já geradas com o hash
+    atual são puladas, salvo com force=True. Só respostas classificadas como
+    RELEVANTE são gravadas: as demais iriam para o atendente de qualquer forma.
+    """
+    from m1_busca_documental.nodes import generate_answer
+
+    counts = {"generated": 0, "skipped": 0, "irrelevant": 0, "failed": 0, "removed": 0}
+    paths = kb_paths(kb_id)
+    content_hash = kb_content_hash(kb_id)
+    if not paths or not content_hash:
+        counts["failed"] = len(questions)
+        return counts
+
+    raw_text_content = "\n\n".join(read_kb_text(p) for p in paths)
+    existing = store.hashes(kb_id)
+    for question in questions:
+        if not force and existing.get(normalize_query(question)) == content_hash:
+            counts["skipped"] += 1
+            continue
+        result = generate_answer(
+            {
+                "user_query": question,
+                "raw_text_content": raw_text_content,
+                "kb_id": kb_id,
+                "priority": "batch",
+            }
+        )
+        if result.get("error") or result.get("degraded") or not result.get("final_response"):
+            counts["failed"] += 1
+        elif not result.get("is_kb_relevant"):
+            counts["irrelevant"] += 1
+        else:
+            store.put(kb_id, question, content_hash, result["final_response"], result.get("llm_model"))
+            counts["generated"] += 1
+    counts["removed"] = store.delete_missing(kb_id, [normalize_query(q) for q in questions])
+    return counts
+
+
+def build_faq(
+    db_path: str = FAQ_DB,
+    kb_ids: Optional[Sequence[str]] = None,
+    force: bool = False,
+) -> Dict[str, Dict[str, int]]:
+    """Gera o FAQ de todos os KBs de faq_questions.yaml (ou só dos kb_ids informados)."""
+    questions = load_questions()
+    store = FaqStore(db_path)
+    try:
+        selected = [k.upper() for k in kb_ids] if kb_ids else sorted(questions)
+        return {kb: build_kb(store, kb, questions.get(kb, []), force=force) for kb in selected}
+    finally:
+        store.close()
+
+
+_regenerating_lock = threading.Lock()
+_regenerating: set = set()
+
+
+def regenerate_kb_async(kb_id: str) -> bool:
+    """
+    Regenera as respostas de um KB numa thread em segundo plano (uma por KB por
+    vez). Retorna False se já havia uma regeneração em andamento.
+    """
+    store = get_faq_store()
+    if store is None:
+        return False
+    with _regenerating_lock:
+        if kb_id in _regenerating:
+            return False
+        _regenerating.add(kb_id)
+
+    def _run() -> None:
+        try:
+            counts = build_kb(store, kb_id, load_questions().get(kb_id, []))
+            metrics.incr("faq_regenerations", kb_id=kb_id)
+            metrics.incr("faq_regenerated_answers", counts["generated"])
+        except Exception as e:
+            print(f"Falha ao regenerar o FAQ do {kb_id}: {e!s}")
+        finally:
+            with _regenerating_lock:
+                _regenerating.discard(kb_id)
+
+    threading.Thread(target=_run, name=f"m1-faq-{kb_id}", daemon=True).start()
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Consulta online
+# ---------------------------------------------------------------------------
+def lookup(user_query: str) -> Optional[Dict[str, Any]]:
+    """
+    Resposta do FAQ para a pergunta, se houver uma gerada com o conteúdo atual
+    do KB. Respostas desatualizadas não são servidas e disparam a regeneração do
+    KB (M1_FAQ_AUTO_REGENERATE).
+
+    Retorno: {"kb_id", "question", "final_response", "llm_model", "doc_title", "doc_path"}
+    """
+    store = get_faq_store()
+    if store is None or not (user_query or "").strip():
+        return None
+    rows = store.find(normalize_query(user_query))
+    if not rows:
+        metrics.incr("faq_lookups", outcome="miss")
+        return None
+
+    fresh = []
+    for row in rows:
+        if row["content_hash"] == kb_content_hash(row["kb_id"]):
+            fresh.append(row)
+        else:
+            metrics.incr("faq_lookups", outcome="stale")
+            if FAQ_AUTO_REGENERATE:
+                regenerate_kb_async(row["kb_id"])
+    # A mesma pergunta canônica em dois KBs é ambígua: deixa a busca decidir
+    if len(fresh) != 1:
+        return None
+
+    metrics.incr("faq_lookups", outcome="hit")
+    row = fresh[0]
+    path = canonical_path(row["kb_id"], DOCS_REPO_PATH)
+    return {
+        **row,
+        "doc_title": kb_title(path) if path else None,
+        "doc_path": path,
+    }
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="FAQ pré-computado por KB do M1.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Gera/regenera as respostas do FAQ.")
+    build.add_argument("--db", default=FAQ_DB, help="Banco SQLite do FAQ.")
+    build.add_argument("--kb", nargs="*", help="Só estes KBs (default: todos do YAML).")
+    build.add_argument("--force", action="store_true", help="Regenera mesmo sem mudança no KB.")
+    listing = sub.add_parser("list", help="Lista as respostas gravadas.")
+    listing.add_argument("--db", default=FAQ_DB, help="Banco SQLite do FAQ.")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        for kb_id, counts in build_faq(args.db, args.kb, force=args.force).items():
+            print(f"{kb_id}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+        return
+
+    store = FaqStore(args.db)
+    for kb_id, question, content_hash in store.all_rows():
+        current = kb_content_hash(kb_id)
+        flag = "ok" if current == content_hash else "desatualizada"
+        print(f"{kb_id}  [{flag}]  {question}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -24,30 +24,81 @@ Por que essa arquitetura é mais estável que um script sequencial?
 - Reuso: o mesmo grafo pode ser chamado por API REST, CLI ou outro orquestrador.
 """
 
+from typing import Any, Dict, Optional
+
 from langgraph.graph import StateGraph, START, END
 
+from m1_busca_documental import analytics, handoff
+from m1_busca_documental.config import CHUNK_FAST_PATH, COALESCING_ENABLED, HANDOFF_ENABLED
+
 from m1_busca_documental.nodes import (
+    assemble_chunk_context,
     call_libindexr,
     fetch_local_document,
     generate_answer,
+    lookup_faq,
+    route_by_keyword,
     forward_to_user,
     forward_to_attendant,
 )
+from m1_busca_documental.profiling import instrument, invoke_profiled
+from m1_busca_documental.singleflight import graph_flight
 from m1_busca_documental.state import AgentState
+from m1_busca_documental.text_normalization import normalize_query
+
+
+def decide_after_faq(state: AgentState):
+    """Resposta do FAQ pré-computado → forward_to_user; senão segue o pipeline."""
+    if state.get("retrieval_backend") == "faq" and state.get("final_response"):
+        return "forward_to_user"
+    return "route_by_keyword"
+
+
+def decide_after_keyword(state: AgentState):
+    """Acerto confiável do roteamento por palavra-chave → KB direto; senão busca vetorial."""
+    if state.get("retrieval_backend") == "keyword" and state.get("doc_reference"):
+        return "fetch_local_document"
+    return "call_libindexr"
+
+
+def decide_context_source(state: AgentState):
+    """
+    Após call_libindexr: com M1_CHUNK_FAST_PATH e um documento escolhido, tenta
+    responder só com os chunks (assemble_chunk_context); senão lê o KB inteiro.
+    """
+    if CHUNK_FAST_PATH and state.get("doc_reference") and not state.get("error"):
+        return "assemble_chunk_context"
+    return "fetch_local_document"
+
+
+def decide_after_chunk_context(state: AgentState):
+    """Chunks suficientes para montar o contexto → generate_answer; senão KB inteiro."""
+    if state.get("context_source") == "chunks":
+        return "generate_answer"
+    return "fetch_local_document"
 
 
 def decide_next_node(state: AgentState):
     """
     Decide qual o próximo nó após a geração da resposta.
+    Se a resposta veio dos chunks e a LLM os classificou como INSUFICIENTE,
+    volta para fetch_local_document (KB inteiro) e gera a resposta de novo.
+    Se o KB veio do roteamento por palavra-chave e a LLM o achou irrelevante,
+    tenta a busca normal (call_libindexr) — uma vez só: a busca troca o
+    retrieval_backend, e uma falha (error) vai direto ao atendente.
     Se is_kb_relevant for True, vai para forward_to_user.
     Caso contrário, vai para forward_to_attendant.
     """
+    if state.get("chunk_context_insufficient") and state.get("context_source") == "chunks":
+        return "fetch_local_document"
     if state.get("is_kb_relevant") is True:
         return "forward_to_user"
+    if state.get("retrieval_backend") == "keyword" and not state.get("error"):
+        return "call_libindexr"
     return "forward_to_attendant"
 
 
-def build_rag_graph():
+def build_rag_graph(checkpointer: Optional[Any] = None):
     """
     Constrói e compila o grafo RAG de 2 etapas com encaminhamento condicional.
 
@@ -62,22 +113,73 @@ def build_rag_graph():
                                            |                                |
                                          END                              END
 
+        Primeiro, lookup_faq serve respostas pré-computadas (faq_store.py) de perguntas
+        canônicas, direto para forward_to_user.
+
+        Antes do call_libindexr, route_by_keyword procura código KB, título ou apelido
+        na pergunta; com acerto confiável o fluxo vai direto ao fetch_local_document.
+        Se a resposta desse KB vier irrelevante, generate_answer → call_libindexr.
+
+        Com M1_CHUNK_FAST_PATH, call_libindexr → assemble_chunk_context → generate_answer
+        (só os chunks); se os chunks não bastam para montar o contexto, ou a LLM os
+        classifica como INSUFICIENTE, o fluxo volta ao fetch_local_document (KB inteiro).
+
+    Args:
+        checkpointer: opcional (ex.: checkpointing.build_sqlite_checkpointer()).
+            Com checkpointer, o estado é salvo após cada nó e a execução precisa
+            de um thread_id (checkpointing.ticket_config(ticket_id)) para poder
+            ser retomada do último nó concluído.
+
     Retorno:
         CompiledStateGraph: use .invoke({"user_query": "..."}) para executar.
     """
     # StateGraph(AgentState) indica que o estado do grafo segue o formato AgentState
     graph = StateGraph[AgentState, None, AgentState, AgentState](AgentState)
 
-    # Registrar os nós
-    graph.add_node("call_libindexr", call_libindexr)
-    graph.add_node("fetch_local_document", fetch_local_document)
-    graph.add_node("generate_answer", generate_answer)
-    graph.add_node("forward_to_user", forward_to_user)
-    graph.add_node("forward_to_attendant", forward_to_attendant)
+    # Registrar os nós (instrumentados: métrica node_seconds e profiling por ticket)
+    graph.add_node("lookup_faq", instrument("lookup_faq", lookup_faq))
+    graph.add_node("route_by_keyword", instrument("route_by_keyword", route_by_keyword))
+    graph.add_node("call_libindexr", instrument("call_libindexr", call_libindexr))
+    graph.add_node("assemble_chunk_context", instrument("assemble_chunk_context", assemble_chunk_context))
+    graph.add_node("fetch_local_document", instrument("fetch_local_document", fetch_local_document))
+    graph.add_node("generate_answer", instrument("generate_answer", generate_answer))
+    graph.add_node("forward_to_user", instrument("forward_to_user", forward_to_user))
+    graph.add_node("forward_to_attendant", instrument("forward_to_attendant", forward_to_attendant))
 
     # Definir as bordas (edges): ordem de execução
-    graph.add_edge(START, "call_libindexr")
-    graph.add_edge("call_libindexr", "fetch_local_document")
+    graph.add_edge(START, "lookup_faq")
+    graph.add_conditional_edges(
+        "lookup_faq",
+        decide_after_faq,
+        {
+            "route_by_keyword": "route_by_keyword",
+            "forward_to_user": "forward_to_user",
+        },
+    )
+    graph.add_conditional_edges(
+        "route_by_keyword",
+        decide_after_keyword,
+        {
+            "call_libindexr": "call_libindexr",
+            "fetch_local_document": "fetch_local_document",
+        },
+    )
+    graph.add_conditional_edges(
+        "call_libindexr",
+        decide_context_source,
+        {
+            "assemble_chunk_context": "assemble_chunk_context",
+            "fetch_local_document": "fetch_local_document",
+        },
+    )
+    graph.add_conditional_edges(
+        "assemble_chunk_context",
+        decide_after_chunk_context,
+        {
+            "generate_answer": "generate_answer",
+            "fetch_local_document": "fetch_local_document",
+        },
+    )
     graph.add_edge("fetch_local_document", "generate_answer")
 
     # Borda condicional após generate_answer
@@ -85,6 +187,8 @@ def build_rag_graph():
         "generate_answer",
         decide_next_node,
         {
+            "fetch_local_document": "fetch_local_document",
+            "call_libindexr": "call_libindexr",
             "forward_to_user": "forward_to_user",
             "forward_to_attendant": "forward_to_attendant",
         },
@@ -94,8 +198,45 @@ def build_rag_graph():
     graph.add_edge("forward_to_user", END)
     graph.add_edge("forward_to_attendant", END)
 
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
 
 
 # Instância compilada para uso direto (ex.: from m1_busca_documental.graph import rag_graph)
 rag_graph = build_rag_graph()
+
+
+_HANDOFF_KINDS = {"forwarded_to_user": "user", "forwarded_to_attendant": "attendant"}
+
+
+def invoke_coalesced(state: AgentState, graph: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Executa o grafo com coalescência na entrada: tickets concorrentes com a
+    mesma pergunta normalizada compartilham uma única execução do pipeline.
+
+    Cada chamador recebe sua própria cópia rasa do estado final, com o
+    user_query e o ticket_id originais dele preservados. Os nós finais só
+    enfileiram o hand-off do ticket que executou o grafo; com M1_HANDOFF=1, o
+    dos demais é enfileirado aqui. O registro de analytics dos demais também é
+    gravado aqui, marcado como coalesced.
+    """
+    graph = graph or rag_graph
+    user_query = state.get("user_query") or ""
+    # Tickets com profiling pedido rodam sozinhos, para o perfil ser deles
+    if not COALESCING_ENABLED or not user_query.strip() or state.get("profile"):
+        return invoke_profiled(graph, state)
+
+    key = (id(graph), normalize_query(user_query))
+    leader = False
+
+    def _run() -> Dict[str, Any]:
+        nonlocal leader
+        leader = True
+        return invoke_profiled(graph, state)
+
+    result = graph_flight.do(key, _run)
+    result = {**result, "user_query": user_query, "ticket_id": state.get("ticket_id")}
+    if HANDOFF_ENABLED and not leader and result.get("status") in _HANDOFF_KINDS:
+        handoff.enqueue_result(result, _HANDOFF_KINDS[result["status"]])
+    if not leader:
+        analytics.record_run(result, coalesced=True)
+    return result
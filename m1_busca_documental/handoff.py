@@ -0,0 +1,498 @@
+"""
+Fila durável de hand-off — Módulo M1 N1 Chamados
+
+Os nós finais (forward_to_user e forward_to_attendant) não falam com o sistema
+de chamados: com M1_HANDOFF=1 eles só gravam o resultado numa fila SQLite local
+(WAL) e seguem. Uma thread de fundo (HandoffFlusher) lê a fila e entrega em
+lotes a um "sink" plugável:
+
+- stub: guarda os itens em memória (e opcionalmente num JSONL), para testes;
+- http: integrations/ticketing.py (POST em lote no sistema de chamados);
+- "modulo:funcao": fábrica que devolve um callable sink(itens) -> ids recusados.
+
+Garantias:
+- vários processos (workers do prefork, CLI flush) podem esvaziar a mesma fila:
+  cada um reserva o lote numa transação só (state "inflight" com lease_until);
+  um lote reservado por um processo que morreu volta a "pending" quando o lease
+  (M1_HANDOFF_LEASE_SECONDS) vence;
+- pelo menos uma vez: o item só sai da fila depois que o sink confirma. Se o
+  processo morrer entre a entrega e a remoção, o item é reenviado; cada item
+  tem um delivery_id estável para o destino deduplicar;
+- falhas (lote inteiro ou itens recusados) voltam para a fila com backoff
+  exponencial; após M1_HANDOFF_MAX_ATTEMPTS tentativas o item fica como "dead"
+  (retry-dead o devolve à fila).
+
+Métricas: handoff_enqueued, handoff_delivered, handoff_delivery_failures,
+handoff_dead_letters, handoff_delivery_lag_seconds (enfileirado → entregue),
+handoff_batch_size e o coletor "handoff" (pendentes, em entrega, mortos, idade do
+mais antigo).
+
+Uso:
+  python -m m1_busca_documental.handoff stats
+  python -m m1_busca_documental.handoff flush      # entrega tudo o que está vencido e sai
+  python -m m1_busca_documental.handoff retry-dead
+"""
+
+import argparse
+import atexit
+import importlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    HANDOFF_BATCH_SIZE,
+    HANDOFF_DB,
+    HANDOFF_FLUSH_INTERVAL_MS,
+    HANDOFF_LEASE_SECONDS,
+    HANDOFF_MAX_ATTEMPTS,
+    HANDOFF_RETRY_BASE_SECONDS,
+    HANDOFF_SINK,
+    HANDOFF_SINK_API_KEY,
+    HANDOFF_SINK_URL,
+)
+
+# sink(itens) -> delivery_ids recusados; exceção = lote inteiro falhou
+Sink = Callable[[List[Dict[str, Any]]], Sequence[str]]
+
+STATE_PENDING = "pending"
+STATE_INFLIGHT = "inflight"
+STATE_DEAD = "dead"
+
+# Teto do backoff entre tentativas
+_MAX_RETRY_DELAY_SECONDS = 300.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS handoff_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    ticket_id TEXT,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS handoff_due ON handoff_queue (state, next_attempt_at);
+"""
+
+# Campos do estado final enviados ao sistema de chamados
+PAYLOAD_FIELDS = (
+    "ticket_id",
+    "user_query",
+    "final_response",
+    "status",
+    "kb_id",
+    "doc_reference",
+    "is_kb_relevant",
+    "is_suggestion",
+    "needs_consultant",
+    "llm_model",
+)
+
+
+def _retry_delay(attempts: int, base: float = HANDOFF_RETRY_BASE_SECONDS) -> float:
+    return min(_MAX_RETRY_DELAY_SECONDS, base * (2 ** max(0, attempts - 1)))
+
+
+class HandoffQueue:
+    """Fila em SQLite. Uma conexão por processo, protegida por lock."""
+
+    def __init__(self, db_path: str = HANDOFF_DB, max_attempts: int = HANDOFF_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL: gravações não bloqueiam a leitura do flusher; NORMAL sobrevive a
+        # queda do processo (uma queda de energia pode perder os últimos commits)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(handoff_queue)")}
+        if "lease_until" not in columns:  # fila criada antes do lease
+            self._conn.execute("ALTER TABLE handoff_queue ADD COLUMN lease_until REAL")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], now: Optional[float] = None) -> int:
+        """Grava um item (commit imediato) e devolve o id dele."""
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO handoff_queue (kind, ticket_id, payload, enqueued_at, next_attempt_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    kind,
+                    payload.get("ticket_id"),
+                    json.dumps(payload, ensure_ascii=False, default=str),
+                    now,
+                    now,
+                ),
+            )
+        return int(cur.lastrowid)
+
+    def claim(
+        self,
+        limit: int,
+        now: Optional[float] = None,
+        lease_seconds: float = HANDOFF_LEASE_SECONDS,
+    ) -> List[Dict[str, Any]]:
+        """
+        Reserva até `limit` itens pendentes com tentativa vencida, mais antigos
+        primeiro: passam a "inflight" até now + lease_seconds, numa transação
+        só (BEGIN IMMEDIATE), então dois processos nunca levam o mesmo item.
+        Antes, os itens com lease vencido voltam a "pending".
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "UPDATE handoff_queue SET state = ?, lease_until = NULL"
+                " WHERE state = ? AND lease_until <= ?",
+                (STATE_PENDING, STATE_INFLIGHT, now),
+            )
+            rows = self._conn.execute(
+                "SELECT id, kind, payload, enqueued_at, attempts FROM handoff_queue"
+                " WHERE state = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (STATE_PENDING, now, limit),
+            ).fetchall()
+            if rows:
+                marks = ",".join("?" * len(rows))
+                self._conn.execute(
+                    f"UPDATE handoff_queue SET state = ?, lease_until = ?"
+                    f" WHERE id IN ({marks}) AND state = ?",
+                    (STATE_INFLIGHT, now + lease_seconds, *(row[0] for row in rows), STATE_PENDING),
+                )
+        return [
+            {
+                "id": row[0],
+                "kind": row[1],
+                "payload": json.loads(row[2]),
+                "enqueued_at": row[3],
+                "attempts": row[4],
+            }
+            for row in rows
+        ]
+
+    def ack(self, ids: Sequence[int]) -> None:
+        """Remove itens entregues."""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM handoff_queue WHERE id = ?", [(i,) for i in ids])
+
+    def nack(self, items: Sequence[Dict[str, Any]], error: str, now: Optional[float] = None) -> int:
+        """
+        Reagenda itens que falharam (backoff exponencial); os que esgotaram as
+        tentativas passam a "dead". Retorna quantos morreram.
+        """
+        now = time.time() if now is None else now
+        dead = 0
+        updates = []
+        for item in items:
+            attempts = item["attempts"] + 1
+            if attempts >= self.max_attempts:
+                state, next_at = STATE_DEAD, now
+                dead += 1
+            else:
+                state, next_at = STATE_PENDING, now + _retry_delay(attempts)
+            updates.append((attempts, next_at, state, error[:500], item["id"]))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE handoff_queue SET attempts = ?, next_attempt_at = ?, state = ?,"
+                " last_error = ?, lease_until = NULL WHERE id = ?",
+                updates,
+            )
+        return dead
+
+    def retry_dead(self) -> int:
+        """Devolve à fila os itens mortos, com as tentativas zeradas."""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE handoff_queue SET state = ?, attempts = 0, next_attempt_at = ?"
+                " WHERE state = ?",
+                (STATE_PENDING, time.time(), STATE_DEAD),
+            )
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(
+                self._conn.execute(
+                    "SELECT state, COUNT(*) FROM handoff_queue GROUP BY state"
+                ).fetchall()
+            )
+            oldest = self._conn.execute(
+                "SELECT MIN(enqueued_at) FROM handoff_queue WHERE state IN (?, ?)",
+                (STATE_PENDING, STATE_INFLIGHT),
+            ).fetchone()[0]
+        return {
+            "pending": counts.get(STATE_PENDING, 0),
+            "inflight": counts.get(STATE_INFLIGHT, 0),
+            "dead": counts.get(STATE_DEAD, 0),
+            "oldest_pending_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+class StubSink:
+    """
+    Sink local para testes: guarda os itens entregues em memória e, se
+    `path` for dado, acrescenta cada um num JSONL. `fail_every` > 0 faz um lote
+    a cada N falhar inteiro (para exercitar as novas tentativas).
+    """
+
+    def __init__(self, path: Optional[str] = None, fail_every: int = 0):
+        self.path = path
+        self.fail_every = fail_every
+        self.delivered: List[Dict[str, Any]] = []
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, items: List[Dict[str, Any]]) -> Sequence[str]:
+        with self._lock:
+            self.batches += 1
+            if self.fail_every and self.batches % self.fail_every == 0:
+                raise ConnectionError("Falha simulada do sink stub.")
+            self.delivered.extend(items)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for item in items:
+                        f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+        return []
+
+
+def build_sink(spec: str = HANDOFF_SINK) -> Sink:
+    """M1_HANDOFF_SINK: "stub", "http" ou "modulo:funcao" (fábrica sem argumentos)."""
+    spec = (spec or "stub").strip()
+    if spec == "stub":
+        return StubSink()
+    if spec == "http":
+        import requests
+
+        from integrations.ticketing import TicketingClient
+
+        if not HANDOFF_SINK_URL:
+            raise ValueError("M1_HANDOFF_SINK=http requer M1_HANDOFF_SINK_URL.")
+        client = TicketingClient(
+            HANDOFF_SINK_URL,
+            api_key=HANDOFF_SINK_API_KEY or None,
+            timeout=30,
+            session=requests.Session(),
+        )
+        return client.post_handoffs
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(
+            f"M1_HANDOFF_SINK deve ser 'stub', 'http' ou 'modulo:funcao' (recebido: {spec!r})."
+        )
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+# ---------------------------------------------------------------------------
+# Entrega em lote
+# ---------------------------------------------------------------------------
+def _delivery_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    payload = row["payload"]
+    return {
+        "delivery_id": f"{payload.get('ticket_id') or '-'}:{row['kind']}:{row['id']}",
+        "kind": row["kind"],
+        "enqueued_at": row["enqueued_at"],
+        **payload,
+    }
+
+
+def deliver_batch(queue: HandoffQueue, sink: Sink, batch_size: int = HANDOFF_BATCH_SIZE) -> int:
+    """Reserva e entrega um lote de itens vencidos. Retorna quantos foram reservados."""
+    rows = queue.claim(batch_size)
+    if not rows:
+        return 0
+    items = [_delivery_item(row) for row in rows]
+    try:
+        refused = set(sink(items) or ())
+        error = "recusado pelo destino"
+    except Exception as e:
+        refused = {item["delivery_id"] for item in items}
+        error = f"{type(e).__name__}: {e!s}"
+
+    now = time.time()
+    delivered = [row for row, item in zip(rows, items) if item["delivery_id"] not in refused]
+    failed = [row for row, item in zip(rows, items) if item["delivery_id"] in refused]
+    if delivered:
+        queue.ack([row["id"] for row in delivered])
+        for row in delivered:
+            metrics.incr("handoff_delivered", kind=row["kind"])
+            metrics.observe("handoff_delivery_lag_seconds", now - row["enqueued_at"])
+    if failed:
+        metrics.incr("handoff_delivery_failures", len(failed))
+        dead = queue.nack(failed, error, now)
+        if dead:
+            metrics.incr("handoff_dead_letters", dead)
+    metrics.observe("handoff_batch_size", len(rows))
+    return len(rows)
+
+
+class HandoffFlusher:
+    """
+    Thread de fundo que esvazia a fila: entrega lotes seguidos enquanto houver
+    itens vencidos e, quando a fila seca, dorme até o próximo intervalo ou até
+    um lote completo ser enfileirado (wake).
+    """
+
+    def __init__(
+        self,
+        queue: HandoffQueue,
+        sink: Sink,
+        batch_size: int = HANDOFF_BATCH_SIZE,
+        interval_seconds: float = HANDOFF_FLUSH_INTERVAL_MS / 1000.0,
+    ):
+        self.queue = queue
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="m1-handoff", daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Para a thread depois de uma última entrega (limitada por `timeout`)."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._drain()
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+        self._drain()
+
+    def _drain(self) -> None:
+        try:
+            while deliver_batch(self.queue, self.sink, self.batch_size) == self.batch_size:
+                pass
+        except sqlite3.Error as e:
+            print(f"Falha ao ler a fila de hand-off: {e!s}")
+
+
+# ---------------------------------------------------------------------------
+# Fila e flusher do processo
+# ---------------------------------------------------------------------------
+_handoff_lock = threading.Lock()
+_queue: Optional[HandoffQueue] = None
+_flusher: Optional[HandoffFlusher] = None
+_pending_since_wake = 0
+
+
+def _get_handoff() -> HandoffQueue:
+    """Fila do processo; o flusher começa junto, no primeiro enqueue."""
+    global _queue, _flusher
+    with _handoff_lock:
+        if _queue is None:
+            _queue = HandoffQueue(HANDOFF_DB)
+            _flusher = HandoffFlusher(_queue, build_sink())
+            _flusher.start()
+            metrics.register_collector("handoff", _queue.stats)
+        return _queue
+
+
+def enqueue_result(state: Dict[str, Any], kind: str) -> Optional[int]:
+    """
+    Enfileira o resultado final de um ticket. Uma falha da fila não derruba o
+    grafo: é contada em handoff_enqueue_errors e o ticket segue sem hand-off.
+    """
+    global _pending_since_wake
+    payload = {k: state.get(k) for k in PAYLOAD_FIELDS}
+    try:
+        item_id = _get_handoff().enqueue(kind, payload)
+    except sqlite3.Error as e:
+        metrics.incr("handoff_enqueue_errors")
+        print(f"Falha ao enfileirar o hand-off do ticket {payload.get('ticket_id')}: {e!s}")
+        return None
+    metrics.incr("handoff_enqueued", kind=kind)
+    with _handoff_lock:
+        _pending_since_wake += 1
+        # Lote completo: entrega já, sem esperar o intervalo
+        if _pending_since_wake >= HANDOFF_BATCH_SIZE and _flusher is not None:
+            _pending_since_wake = 0
+            _flusher.wake()
+    return item_id
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Para o flusher do processo (tentando entregar o que está vencido) e fecha a fila."""
+    global _queue, _flusher
+    with _handoff_lock:
+        flusher, queue = _flusher, _queue
+        _queue = _flusher = None
+    if flusher is not None:
+        flusher.stop(timeout)
+    if queue is not None:
+        queue.close()
+
+
+def _after_fork() -> None:
+    # A conexão SQLite e a thread do pai não valem no filho: cada processo abre as suas
+    global _queue, _flusher, _pending_since_wake
+    _queue = _flusher = None
+    _pending_since_wake = 0
+
+
+atexit.register(shutdown)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fila de hand-off do M1.")
+    parser.add_argument("command", choices=("stats", "flush", "retry-dead"))
+    parser.add_argument("--db", default=HANDOFF_DB, help="Arquivo SQLite da fila.")
+    parser.add_argument("--sink", default=HANDOFF_SINK, help="stub, http ou modulo:funcao.")
+    args = parser.parse_args(argv)
+
+    queue = HandoffQueue(args.db)
+    try:
+        if args.command == "retry-dead":
+            print(f"{queue.retry_dead()} itens devolvidos à fila.")
+        elif args.command == "flush":
+            sink = build_sink(args.sink)
+            total = 0
+            while True:
+                read = deliver_batch(queue, sink)
+                total += read
+                if read < HANDOFF_BATCH_SIZE:
+                    break
+            print(f"{total} itens processados.")
+        print(json.dumps(queue.stats(), ensure_ascii=False))
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
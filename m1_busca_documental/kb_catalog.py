@@ -0,0 +1,181 @@
+"""
+Catálogo dos KBs locais — Módulo M1 N1 Chamados
+
+Os documentos ficam em DOCS_REPO_PATH como "KBxxxxxxx <título> (n).txt" (mais o
+PDF correspondente). Este módulo lista os .txt por código KB, para que a busca
+local, o roteamento por palavra-chave e os jobs offline não precisem repetir
+a varredura da pasta e as regex de nome de arquivo.
+
+A listagem é cacheada e só é refeita quando o mtime da pasta muda. Com o
+manifest de deduplicação (kb_dedup.py) presente, as cópias e versões antigas de
+cada KB saem da listagem e canonical_path resolve o código KB para o documento
+canônico. Os textos podem ser pré-carregados (preload_texts) — o runner
+multiprocesso (prefork.py) faz isso no processo pai para que os filhos
+compartilhem as páginas.
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from m1_busca_documental.config import DOCS_REPO_PATH, KB_DEDUP_ENABLED, KB_DEDUP_MANIFEST
+
+KB_CODE_RE = re.compile(r"KB\d+", re.IGNORECASE)
+
+_cache_lock = threading.Lock()
+# docs_path -> (mtime da pasta, {kb_code: [paths]})
+_listing_cache: Dict[str, Tuple[float, Dict[str, List[str]]]] = {}
+# docs_path -> (mtime da pasta, mtime do manifest, listagem só com canônicos)
+_canonical_cache: Dict[str, Tuple[float, float, Dict[str, List[str]]]] = {}
+# (mtime do manifest, manifest) — o manifest é relido só quando muda
+_manifest_cache: Tuple[float, Optional[Dict[str, Any]]] = (-1.0, None)
+# path -> (mtime, tamanho, texto) dos .txt pré-carregados
+_text_cache: Dict[str, Tuple[float, int, str]] = {}
+
+
+def extract_kb_code(text: str) -> Optional[str]:
+    """Extrai o código KB (ex.: 'KB0019150') de um nome de arquivo ou texto."""
+    match = KB_CODE_RE.search(text or "")
+    return match.group(0).upper() if match else None
+
+
+def kb_title(path: str) -> str:
+    """Título do documento = nome do arquivo sem extensão."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_dedup_manifest(docs_path: str = DOCS_REPO_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Manifest de deduplicação (M1_KB_DEDUP_MANIFEST) se existir e tiver sido
+    gerado para esta pasta; senão None.
+    """
+    global _manifest_cache
+    try:
+        mtime = os.stat(KB_DEDUP_MANIFEST).st_mtime
+    except OSError:
+        return None
+    if _manifest_cache[0] != mtime:
+        try:
+            with open(KB_DEDUP_MANIFEST, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        _manifest_cache = (mtime, manifest)
+    manifest = _manifest_cache[1]
+    if not manifest or manifest.get("docs_path") != os.path.abspath(docs_path):
+        return None
+    return manifest
+
+
+def _canonical_listing(
+    listing: Dict[str, List[str]], manifest: Dict[str, Any]
+) -> Dict[str, List[str]]:
+    """
+    Tira da listagem os arquivos marcados como cópia no manifest — desde que o
+    canônico ainda esteja na pasta (se sumiu, o KB fica com o que tem).
+    """
+    duplicates = manifest.get("duplicates") or {}
+    present = {os.path.basename(p) for paths in listing.values() for p in paths}
+    result: Dict[str, List[str]] = {}
+    for kb_code, paths in listing.items():
+        kept = [p for p in paths if duplicates.get(os.path.basename(p)) not in present]
+        if kept:
+            result[kb_code] = kept
+    return result
+
+
+def list_kb_files(
+    docs_path: str = DOCS_REPO_PATH, canonical_only: Optional[bool] = None
+) -> Dict[str, List[str]]:
+    """
+    Mapeia código KB -> lista de caminhos .txt (ordem alfabética do nome).
+    Arquivos sem código KB no nome são ignorados.
+
+    canonical_only (padrão: M1_KB_DEDUP) aplica o manifest de deduplicação:
+    cada documento aparece uma vez só, e KBs cujo texto é cópia de outro KB
+    ficam de fora (use canonical_path para resolvê-los).
+    """
+    if not os.path.isdir(docs_path):
+        return {}
+    if canonical_only is None:
+        canonical_only = KB_DEDUP_ENABLED
+    listing = _raw_listing(docs_path)
+    if not canonical_only:
+        return listing
+    manifest = load_dedup_manifest(docs_path)
+    if manifest is None:
+        return listing
+    mtime, manifest_mtime = os.stat(docs_path).st_mtime, _manifest_cache[0]
+    with _cache_lock:
+        cached = _canonical_cache.get(docs_path)
+        if cached and cached[:2] == (mtime, manifest_mtime):
+            return cached[2]
+    result = _canonical_listing(listing, manifest)
+    with _cache_lock:
+        _canonical_cache[docs_path] = (mtime, manifest_mtime, result)
+    return result
+
+
+def canonical_path(kb_code: str, docs_path: str = DOCS_REPO_PATH) -> Optional[str]:
+    """
+    Caminho do documento canônico de um código KB (inclusive KBs que são cópia
+    de outro), ou o primeiro .txt do código quando não há manifest.
+    """
+    kb_code = (kb_code or "").upper()
+    manifest = load_dedup_manifest(docs_path) if KB_DEDUP_ENABLED else None
+    if manifest:
+        name = (manifest.get("canonical") or {}).get(kb_code)
+        if name and os.path.isfile(os.path.join(docs_path, name)):
+            return os.path.join(docs_path, name)
+    paths = list_kb_files(docs_path).get(kb_code)
+    return paths[0] if paths else None
+
+
+def _raw_listing(docs_path: str) -> Dict[str, List[str]]:
+    mtime = os.stat(docs_path).st_mtime
+    with _cache_lock:
+        cached = _listing_cache.get(docs_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    listing: Dict[str, List[str]] = {}
+    for name in sorted(os.listdir(docs_path)):
+        if not name.lower().endswith(".txt"):
+            continue
+        kb_code = extract_kb_code(name)
+        if kb_code:
+            listing.setdefault(kb_code, []).append(os.path.join(docs_path, name))
+
+    with _cache_lock:
+        _listing_cache[docs_path] = (mtime, listing)
+    return listing
+
+
+def read_kb_text(path: str) -> str:
+    """
+    Lê o .txt de um KB (UTF-8, caracteres inválidos substituídos). Se o arquivo
+    foi pré-carregado e não mudou (mtime e tamanho), devolve o texto em memória.
+    """
+    cached = _text_cache.get(path)
+    if cached is not None:
+        st = os.stat(path)
+        if (st.st_mtime, st.st_size) == cached[:2]:
+            return cached[2]
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def preload_texts(docs_path: str = DOCS_REPO_PATH) -> int:
+    """Carrega em memória todos os .txt de KB da pasta. Retorna o total de bytes."""
+    total = 0
+    for paths in list_kb_files(docs_path).values():
+        for path in paths:
+            st = os.stat(path)
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            with _cache_lock:
+                _text_cache[path] = (st.st_mtime, st.st_size, text)
+            total += st.st_size
+    return total
@@ -0,0 +1,356 @@
+"""
+Deduplicação dos KBs (MinHash) — Módulo M1 N1 Chamados
+
+A pasta de documentos acumula cópias versionadas do mesmo KB ("... (1).txt",
+"... (2).txt") e, às vezes, o mesmo texto com outro código. Sem tratamento, o
+_find_local_file pega o primeiro nome que casa, e índices, pack, caches e
+uploads carregam cópias.
+
+Esta passada offline:
+1. quebra cada .txt em shingles de M1_KB_DEDUP_SHINGLE palavras (texto
+   normalizado) e calcula uma assinatura MinHash (M1_KB_DEDUP_PERMUTATIONS
+   permutações, NumPy);
+2. acha pares candidatos por LSH (bandas da assinatura) e confirma os que têm
+   similaridade de Jaccard estimada >= M1_KB_DEDUP_THRESHOLD. Textos com menos
+   palavras que um shingle (vazios, só espaços) não têm o que comparar e ficam
+   fora desta etapa — só se agrupam com as versões do próprio código;
+3. agrupa os pares (union-find) e elege um canônico por código KB: maior
+   versão "(n)" no nome, depois o mais recente, depois o maior texto. As outras
+   versões do código saem (superseded), quase iguais ou não: o código continua
+   tendo um documento só, o mais novo. Entre códigos do mesmo grupo, o canônico
+   de um código quase igual ao melhor do grupo sai da listagem (near_duplicate),
+   mas canonical_path ainda resolve o código para o seu próprio arquivo.
+
+O resultado vai para o manifest M1_KB_DEDUP_MANIFEST. Com ele presente (e
+M1_KB_DEDUP=1), kb_catalog.list_kb_files devolve só os canônicos — e com isso o
+fetch_local_document, o pack, o índice vetorial, a busca local e o FAQ passam a
+ler um documento por KB. O plano de upload (sync-plan) lista os arquivos
+canônicos (.txt e .pdf) a indexar e os que devem sair do índice.
+
+Uso:
+  python -m m1_busca_documental.kb_dedup scan            # gera o manifest
+  python -m m1_busca_documental.kb_dedup scan --dry-run  # só mostra os grupos
+  python -m m1_busca_documental.kb_dedup sync-plan [--json plano.json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental.config import (
+    DOCS_REPO_PATH,
+    KB_DEDUP_MANIFEST,
+    KB_DEDUP_PERMUTATIONS,
+    KB_DEDUP_SHINGLE,
+    KB_DEDUP_THRESHOLD,
+)
+from m1_busca_documental.kb_catalog import list_kb_files, read_kb_text
+from m1_busca_documental.text_normalization import normalize_query
+
+# Primo de Mersenne 2^31 - 1: a*x + b cabe em uint64 com a, x, b < 2^31
+_PRIME = np.uint64((1 << 31) - 1)
+_VERSION_RE = re.compile(r"\((\d+)\)\s*$")
+_SEED = 1
+
+
+def shingles(text: str, size: int = KB_DEDUP_SHINGLE) -> np.ndarray:
+    """
+    Hashes (31 bits) dos shingles de `size` palavras do texto normalizado.
+    Vazio se o texto tem menos de `size` palavras.
+    """
+    words = normalize_query(text).split()
+    grams = [" ".join(words[i : i + size]) for i in range(len(words) - size + 1)]
+    hashes = {
+        int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "big") % int(_PRIME)
+        for g in grams
+    }
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def _permutations(count: int) -> Tuple[np.ndarray, np.ndarray]:
+    rnd = np.random.default_rng(_SEED)
+    a = rnd.integers(1, int(_PRIME), size=count, dtype=np.uint64)
+    b = rnd.integers(0, int(_PRIME), size=count, dtype=np.uint64)
+    return a, b
+
+
+def minhash(shingle_hashes: np.ndarray, permutations: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """Assinatura MinHash: o menor (a*x + b) mod p de cada permutação."""
+    a, b = permutations
+    if shingle_hashes.size == 0:
+        return np.full(a.shape, int(_PRIME), dtype=np.uint64)
+    values = (np.outer(shingle_hashes, a) + b) % _PRIME
+    return values.min(axis=0)
+
+
+def estimated_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+def _bands_for(permutations: int, threshold: float) -> int:
+    """
+    Número de bandas do LSH cujo ponto de corte (1/b)^(1/r) fica logo abaixo do
+    limiar — os candidatos ainda são confirmados pela similaridade estimada.
+    """
+    best = 1
+    for bands in range(1, permutations + 1):
+        if permutations % bands:
+            continue
+        rows = permutations // bands
+        if (1.0 / bands) ** (1.0 / rows) <= threshold * 0.9:
+            return bands
+        best = bands
+    return best
+
+
+def _version(path: str) -> int:
+    match = _VERSION_RE.search(os.path.splitext(os.path.basename(path))[0])
+    return int(match.group(1)) if match else 0
+
+
+def _canonical_rank(path: str, chars: int) -> Tuple[int, float, int, str]:
+    return (_version(path), os.path.getmtime(path), chars, os.path.basename(path))
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def scan(
+    docs_path: str = DOCS_REPO_PATH,
+    threshold: float = KB_DEDUP_THRESHOLD,
+    shingle_size: int = KB_DEDUP_SHINGLE,
+    permutations: int = KB_DEDUP_PERMUTATIONS,
+) -> Dict[str, Any]:
+    """
+    Varre todos os .txt de KB (inclusive os não canônicos) e devolve o manifest:
+    {"canonical": {kb: arquivo}, "duplicates": {arquivo: canônico},
+     "reasons": {arquivo: "near_duplicate"|"superseded"}, "clusters": [...],
+     "too_short": [arquivos sem shingles]}. Os nomes são relativos a docs_path.
+    """
+    start = time.perf_counter()
+    docs: List[Tuple[str, str, int]] = []  # (kb, path, caracteres)
+    for kb_id, paths in sorted(list_kb_files(docs_path, canonical_only=False).items()):
+        for path in paths:
+            docs.append((kb_id, path, len(read_kb_text(path))))
+
+    perms = _permutations(permutations)
+    hashes = [shingles(read_kb_text(path), shingle_size) for _, path, _ in docs]
+    signatures = np.stack(
+        [minhash(h, perms) for h in hashes]
+    ) if docs else np.zeros((0, permutations), dtype=np.uint64)
+    # Sem shingles a assinatura é constante: iguala textos curtos de KBs sem relação
+    comparable = [h.size > 0 for h in hashes]
+
+    def similarity(i: int, j: int) -> float:
+        if not (comparable[i] and comparable[j]):
+            return 0.0
+        return estimated_jaccard(signatures[i], signatures[j])
+
+    # LSH: documentos com alguma banda idêntica viram candidatos
+    bands = _bands_for(permutations, threshold)
+    rows = permutations // bands
+    candidates = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = {}
+        for i in range(len(docs)):
+            if not comparable[i]:
+                continue
+            key = signatures[i, band * rows : (band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    candidates.add((members[x], members[y]))
+
+    uf = _UnionFind(len(docs))
+    for i, j in candidates:
+        if similarity(i, j) >= threshold:
+            uf.union(i, j)
+    # Versões do mesmo código ficam sempre no mesmo grupo
+    first_of_kb: Dict[str, int] = {}
+    for i, (kb_id, _, _) in enumerate(docs):
+        if kb_id in first_of_kb:
+            uf.union(first_of_kb[kb_id], i)
+        else:
+            first_of_kb[kb_id] = i
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(docs)):
+        groups.setdefault(uf.find(i), []).append(i)
+
+    canonical: Dict[str, str] = {}
+    duplicates: Dict[str, str] = {}
+    reasons: Dict[str, str] = {}
+    clusters = []
+
+    def rank(i: int) -> Tuple[int, float, int, str]:
+        return _canonical_rank(docs[i][1], docs[i][2])
+
+    for members in groups.values():
+        # Canônico de cada código: as outras versões dele saem como superseded
+        by_kb: Dict[str, List[int]] = {}
+        for i in members:
+            by_kb.setdefault(docs[i][0], []).append(i)
+        kb_elected: Dict[str, int] = {}
+        for kb_id, versions in by_kb.items():
+            kept = max(versions, key=rank)
+            kb_elected[kb_id] = kept
+            canonical[kb_id] = os.path.basename(docs[kept][1])
+            for i in versions:
+                if i != kept:
+                    duplicates[os.path.basename(docs[i][1])] = canonical[kb_id]
+                    reasons[os.path.basename(docs[i][1])] = "superseded"
+        # Entre códigos: o canônico de outro código que é quase igual ao do grupo
+        # sai da listagem (near_duplicate), mas o código continua com o seu arquivo
+        elected = max(kb_elected.values(), key=rank)
+        elected_name = os.path.basename(docs[elected][1])
+        for i in kb_elected.values():
+            if i != elected and similarity(i, elected) >= threshold:
+                duplicates[os.path.basename(docs[i][1])] = elected_name
+                reasons[os.path.basename(docs[i][1])] = "near_duplicate"
+        if len(members) > 1:
+            clusters.append(
+                {
+                    "canonical": elected_name,
+                    "kb_ids": sorted({docs[i][0] for i in members}),
+                    "members": [
+                        {
+                            "file": os.path.basename(docs[i][1]),
+                            "similarity": round(similarity(i, elected), 4),
+                        }
+                        for i in sorted(members)
+                    ],
+                }
+            )
+
+    return {
+        "docs_path": os.path.abspath(docs_path),
+        "generated_at": time.time(),
+        "params": {
+            "threshold": threshold,
+            "shingle": shingle_size,
+            "permutations": permutations,
+            "bands": bands,
+        },
+        "documents": len(docs),
+        "too_short": sorted(os.path.basename(docs[i][1]) for i in range(len(docs)) if not comparable[i]),
+        "canonical": canonical,
+        "duplicates": duplicates,
+        "reasons": reasons,
+        "clusters": clusters,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def write_manifest(manifest: Dict[str, Any], path: str = KB_DEDUP_MANIFEST) -> None:
+    """Grava o manifest de forma atômica (arquivo temporário + rename)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def sync_plan(
+    docs_path: str = DOCS_REPO_PATH, indexed: Optional[Sequence[str]] = None
+) -> Dict[str, List[str]]:
+    """
+    Arquivos a enviar ao índice (canônicos, .txt e .pdf de mesmo nome) e a
+    manter fora dele. `indexed` (nomes já no índice), se dado, separa o que
+    falta enviar do que deve ser removido.
+    """
+    upload: List[str] = []
+    for paths in list_kb_files(docs_path, canonical_only=True).values():
+        for path in paths:
+            stem = os.path.splitext(path)[0]
+            upload.extend(p for p in (path, stem + ".pdf") if os.path.exists(p))
+    upload_names = sorted({os.path.basename(p) for p in upload})
+    skip = sorted(
+        name
+        for name in os.listdir(docs_path)
+        if name.lower().endswith((".txt", ".pdf")) and name not in upload_names
+    ) if os.path.isdir(docs_path) else []
+    plan = {"upload": upload_names, "skip": skip}
+    if indexed is not None:
+        indexed_set = set(indexed)
+        plan["missing"] = [n for n in upload_names if n not in indexed_set]
+        plan["remove"] = sorted(n for n in indexed_set if n in set(skip))
+    return plan
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Deduplicação dos KBs (MinHash).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sc = sub.add_parser("scan", help="Agrupa quase-duplicatas e grava o manifest.")
+    sc.add_argument("--docs", default=DOCS_REPO_PATH)
+    sc.add_argument("--out", default=KB_DEDUP_MANIFEST)
+    sc.add_argument("--threshold", type=float, default=KB_DEDUP_THRESHOLD)
+    sc.add_argument("--shingle", type=int, default=KB_DEDUP_SHINGLE)
+    sc.add_argument("--permutations", type=int, default=KB_DEDUP_PERMUTATIONS)
+    sc.add_argument("--dry-run", action="store_true", help="Não grava o manifest.")
+
+    sp = sub.add_parser("sync-plan", help="Lista os arquivos canônicos a indexar.")
+    sp.add_argument("--docs", default=DOCS_REPO_PATH)
+    sp.add_argument("--indexed", help="Arquivo com os nomes já indexados (um por linha).")
+    sp.add_argument("--json", help="Grava o plano neste arquivo.")
+
+    args = parser.parse_args(argv)
+    if args.command == "scan":
+        manifest = scan(args.docs, args.threshold, args.shingle, args.permutations)
+        for cluster in manifest["clusters"]:
+            print(f"Grupo {', '.join(cluster['kb_ids'])} → canônico: {cluster['canonical']}")
+            for member in cluster["members"]:
+                if member["file"] != cluster["canonical"]:
+                    reason = manifest["reasons"].get(member["file"], "")
+                    print(f"    {member['file']}  (similaridade {member['similarity']:.2f}, {reason})")
+        print(
+            f"{manifest['documents']} documentos, {len(manifest['canonical'])} KBs, "
+            f"{len(manifest['duplicates'])} cópias fora em {manifest['seconds']:.2f}s"
+        )
+        if not args.dry_run:
+            write_manifest(manifest, args.out)
+            print("Manifest gravado em:", args.out)
+        return
+
+    indexed = None
+    if args.indexed:
+        with open(args.indexed, "r", encoding="utf-8") as f:
+            indexed = [line.strip() for line in f if line.strip()]
+    plan = sync_plan(args.docs, indexed)
+    for key, names in plan.items():
+        print(f"{key}: {len(names)}")
+        for name in names:
+            print(f"    {name}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Acervo de KBs empacotado (mmap) — Módulo M1 N1 Chamados
+
+Em vez de abrir um .txt de nome longo e acentuado por ticket, os textos de
+todos os KBs ficam num único arquivo de dados, com um índice JSON
+kb_id → (offset, tamanho, codec). O arquivo é mapeado em memória (mmap) uma vez
+por processo; o fetch_local_document (com M1_KB_STORE=pack) fatia o mapa, sem
+open/read por ticket. Os workers do prefork.py herdam o mesmo mapa e o page
+cache é compartilhado entre eles.
+
+Layout (M1_KB_PACK_DIR):
+- index.json       {"pack_file", "generation", "pack_bytes", "entries": {kb_id: {...}}}
+- kb-<geração>.pack  blobs concatenados (UTF-8, ou zlib por documento com --compress)
+
+Os textos são gravados como o fetch_local_document os leria do .txt (UTF-8,
+inválidos substituídos, quebras de linha normalizadas): o resultado é idêntico
+nos dois modos.
+
+Atualização:
+- update: acrescenta ao fim do pack os KBs novos ou alterados (mtime/tamanho do
+  .txt) e remove do índice os que sumiram; o espaço antigo vira "morto";
+- compact: reescreve só os blobs vivos num pack de geração nova. É chamado
+  automaticamente pelo update quando o espaço morto passa de metade do pack.
+
+O índice é sempre gravado por último (arquivo .tmp + rename), então um leitor
+vê o pack antigo ou o novo, nunca um meio-termo. Um pack compactado ganha nome
+novo; processos que ainda mapeiam o antigo continuam lendo dele até
+recarregarem (get_kb_pack compara o mtime do índice).
+
+Uso:
+  python -m m1_busca_documental.kb_pack update [--compress]
+  python -m m1_busca_documental.kb_pack compact
+  python -m m1_busca_documental.kb_pack stats
+  python -m m1_busca_documental.kb_pack get KB0019150
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental.config import DOCS_REPO_PATH, KB_PACK_DIR
+from m1_busca_documental.kb_catalog import list_kb_files
+
+INDEX_FILE = "index.json"
+CODEC_NONE = "none"
+CODEC_ZLIB = "zlib"
+# Só comprime um documento se o zlib economizar pelo menos 10%
+_MIN_COMPRESSION_GAIN = 0.9
+# update compacta sozinho quando o espaço morto passa desta fração do pack
+AUTO_COMPACT_DEAD_RATIO = 0.5
+
+
+def _read_index(pack_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(pack_dir, INDEX_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_index(pack_dir: str, index: Dict[str, Any]) -> None:
+    path = os.path.join(pack_dir, INDEX_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _encode(data: bytes, compress: bool) -> Dict[str, Any]:
+    if compress:
+        packed = zlib.compress(data, 6)
+        if len(packed) < len(data) * _MIN_COMPRESSION_GAIN:
+            return {"blob": packed, "codec": CODEC_ZLIB}
+    return {"blob": data, "codec": CODEC_NONE}
+
+
+class KbPack:
+    """Leitor do pack: um mmap somente leitura e o índice em memória."""
+
+    def __init__(self, pack_dir: str = KB_PACK_DIR):
+        index = _read_index(pack_dir)
+        if index is None:
+            raise FileNotFoundError(f"Índice do pack não encontrado em {pack_dir}")
+        self.pack_dir = pack_dir
+        self.index_mtime = os.path.getmtime(os.path.join(pack_dir, INDEX_FILE))
+        self.generation = int(index.get("generation", 0))
+        self.entries: Dict[str, Dict[str, Any]] = index.get("entries", {})
+        self._mm: Optional[mmap.mmap] = None
+        with open(os.path.join(pack_dir, index["pack_file"]), "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                # O mapa continua válido depois de fechar o arquivo
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, kb_id: str) -> bool:
+        return kb_id in self.entries
+
+    def entry(self, kb_id: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(kb_id)
+
+    def get_bytes(self, kb_id: str) -> Optional[memoryview]:
+        """Blob do KB como está no pack (fatia do mmap, sem cópia)."""
+        entry = self.entries.get(kb_id)
+        if entry is None or self._mm is None:
+            return None
+        return memoryview(self._mm)[entry["offset"] : entry["offset"] + entry["length"]]
+
+    def get_text(self, kb_id: str) -> Optional[str]:
+        """
+        Texto do KB. A única cópia é a decodificação UTF-8 (ou a descompressão)
+        direto da fatia do mmap.
+        """
+        view = self.get_bytes(kb_id)
+        if view is None:
+            return None
+        try:
+            if self.entries[kb_id]["codec"] == CODEC_ZLIB:
+                return zlib.decompress(view).decode("utf-8", errors="replace")
+            return str(view, "utf-8", errors="replace")
+        finally:
+            view.release()
+
+    def stats(self) -> Dict[str, Any]:
+        live = sum(e["length"] for e in self.entries.values())
+        size = len(self._mm) if self._mm is not None else 0
+        return {
+            "kbs": len(self.entries),
+            "generation": self.generation,
+            "pack_bytes": size,
+            "live_bytes": live,
+            "dead_bytes": size - live,
+            "text_bytes": sum(e["size"] for e in self.entries.values()),
+            "compressed": sum(1 for e in self.entries.values() if e["codec"] == CODEC_ZLIB),
+        }
+
+
+def _write_generation(
+    pack_dir: str,
+    generation: int,
+    blobs: Dict[str, bytes],
+    entries: Dict[str, Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Grava um pack novo só com os blobs informados e devolve o índice correspondente."""
+    pack_file = f"kb-{generation:06d}.pack"
+    offset = 0
+    new_entries: Dict[str, Dict[str, Any]] = {}
+    with open(os.path.join(pack_dir, pack_file), "wb") as f:
+        for kb_id in sorted(blobs):
+            blob = blobs[kb_id]
+            f.write(blob)
+            new_entries[kb_id] = {**entries[kb_id], "offset": offset, "length": len(blob)}
+            offset += len(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    return {
+        "pack_file": pack_file,
+        "generation": generation,
+        "pack_bytes": offset,
+        "entries": new_entries,
+    }
+
+
+def _remove_old_packs(pack_dir: str, keep: str) -> None:
+    for name in os.listdir(pack_dir):
+        if name.endswith(".pack") and name != keep:
+            os.remove(os.path.join(pack_dir, name))
+
+
+def compact_pack(pack_dir: str = KB_PACK_DIR) -> Dict[str, Any]:
+    """Reescreve os blobs vivos num pack de geração nova (sem recomprimir)."""
+    pack = KbPack(pack_dir)
+    blobs = {}
+    for kb_id in pack.entries:
+        view = pack.get_bytes(kb_id)
+        blobs[kb_id] = bytes(view) if view is not None else b""
+    index = _write_generation(pack_dir, pack.generation + 1, blobs, pack.entries)
+    _write_index(pack_dir, index)
+    _remove_old_packs(pack_dir, index["pack_file"])
+    return KbPack(pack_dir).stats()
+
+
+def update_pack(
+    docs_path: str = DOCS_REPO_PATH,
+    pack_dir: str = KB_PACK_DIR,
+    compress: bool = False,
+    rebuild: bool = False,
+) -> Dict[str, Any]:
+    """
+    Sincroniza o pack com a pasta de documentos. Um KB é relido quando o mtime ou
+    o tamanho do .txt mudaram (ou sempre, com rebuild). Sem pack existente, ou com
+    rebuild, grava uma geração nova; senão acrescenta ao fim do pack atual.
+    """
+    os.makedirs(pack_dir, exist_ok=True)
+    previous = _read_index(pack_dir)
+    index = None if rebuild else previous
+    old_entries: Dict[str, Dict[str, Any]] = (index or {}).get("entries", {})
+    listing = list_kb_files(docs_path)
+
+    entries: Dict[str, Dict[str, Any]] = {}
+    changed: Dict[str, bytes] = {}
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    for kb_id, paths in sorted(listing.items()):
+        path = paths[0]
+        st = os.stat(path)
+        old = old_entries.get(kb_id)
+        source = {
+            "file": os.path.basename(path),
+            "mtime": st.st_mtime,
+            "source_bytes": st.st_size,
+        }
+        if old is not None and all(old.get(k) == v for k, v in source.items()):
+            entries[kb_id] = old
+            counts["unchanged"] += 1
+            continue
+        # Texto como o fetch_local_document o leria (UTF-8, quebras de linha
+        # normalizadas), para que o leitor só precise decodificar
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            data = f.read().encode("utf-8")
+        encoded = _encode(data, compress)
+        changed[kb_id] = encoded["blob"]
+        entries[kb_id] = {**source, "codec": encoded["codec"], "size": len(data)}
+        counts["updated" if old is not None else "added"] += 1
+    counts["removed"] = len(set(old_entries) - set(listing))
+
+    if index is None:
+        # Geração nova (nome novo): quem ainda mapeia o pack anterior não é afetado
+        generation = int(previous["generation"]) + 1 if previous else 0
+        new_index = _write_generation(pack_dir, generation, changed, entries)
+        _write_index(pack_dir, new_index)
+        _remove_old_packs(pack_dir, new_index["pack_file"])
+        return {**counts, **KbPack(pack_dir).stats(), "compacted": False}
+
+    # Acrescenta os blobs novos ao fim do pack atual
+    pack_path = os.path.join(pack_dir, index["pack_file"])
+    with open(pack_path, "ab") as f:
+        offset = f.tell()
+        for kb_id in sorted(changed):
+            blob = changed[kb_id]
+            f.write(blob)
+            entries[kb_id] = {**entries[kb_id], "offset": offset, "length": len(blob)}
+            offset += len(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    index = {**index, "pack_bytes": offset, "entries": entries}
+    _write_index(pack_dir, index)
+
+    live = sum(e["length"] for e in entries.values())
+    compacted = offset > 0 and (offset - live) / offset > AUTO_COMPACT_DEAD_RATIO
+    stats = compact_pack(pack_dir) if compacted else KbPack(pack_dir).stats()
+    return {**counts, **stats, "compacted": compacted}
+
+
+_pack_lock = threading.Lock()
+_pack: Optional[KbPack] = None
+
+
+def get_kb_pack(pack_dir: str = KB_PACK_DIR) -> Optional[KbPack]:
+    """
+    KbPack do processo (None se o pack não foi construído); reaberto quando o
+    índice é regravado por um update/compact.
+    """
+    global _pack
+    index_path = os.path.join(pack_dir, INDEX_FILE)
+    if not os.path.isfile(index_path):
+        return None
+    mtime = os.path.getmtime(index_path)
+    with _pack_lock:
+        if _pack is None or _pack.pack_dir != pack_dir or _pack.index_mtime != mtime:
+            _pack = KbPack(pack_dir)
+        return _pack
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Acervo de KBs empacotado (mmap) do M1.")
+    parser.add_argument("--dir", default=KB_PACK_DIR, help="Pasta do pack.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    update = sub.add_parser("update", help="Acrescenta KBs novos/alterados ao pack.")
+    update.add_argument("--docs", default=DOCS_REPO_PATH, help="Pasta dos documentos.")
+    update.add_argument("--compress", action="store_true", help="zlib por documento.")
+    update.add_argument("--rebuild", action="store_true", help="Regrava o pack do zero.")
+    sub.add_parser("compact", help="Remove o espaço morto do pack.")
+    sub.add_parser("stats", help="Tamanhos e contagens do pack.")
+    get = sub.add_parser("get", help="Imprime o texto de um KB.")
+    get.add_argument("kb_id")
+
+    args = parser.parse_args(argv)
+    if args.command == "update":
+        result = update_pack(args.docs, args.dir, compress=args.compress, rebuild=args.rebuild)
+    elif args.command == "compact":
+        result = compact_pack(args.dir)
+    elif args.command == "stats":
+        result = KbPack(args.dir).stats()
+    else:
+        text = KbPack(args.dir).get_text(args.kb_id.upper())
+        if text is None:
+            print(f"KB {args.kb_id} não está no pack.")
+            sys.exit(1)
+        print(text)
+        return
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""
+Afinidade por KB entre nós (hash consistente) — Módulo M1 N1 Chamados
+
+Com várias réplicas do serviço atrás de um balanceador comum, cada réplica
+acaba aquecendo caches para todos os KBs (texto dos KBs, prefixos de prompt na
+OpenAI, respostas recentes, FAQ), com memória repetida e acerto baixo. Aqui,
+cada ticket é levado ao nó "dono" da sua chave de afinidade, num anel de hash
+consistente (com nós virtuais):
+
+- kb:<KB> quando o KB já é conhecido na entrada: campo "kb_id" do pedido ou
+  acerto confiável do roteamento por palavra-chave (keyword_router.py);
+- q:<pergunta normalizada> caso contrário, o que ainda mantém no mesmo nó as
+  perguntas repetidas (coalescência e caches de resposta).
+
+O serviço (service.py) encaminha POST /tickets ao dono com o header
+x-m1-forwarded (que impede um segundo salto). Se o dono falhar, ele fica fora
+do anel por M1_RING_NODE_COOLDOWN_SECONDS e o próximo nó da lista de
+preferência assume; sem nenhum nó disponível, o ticket roda localmente.
+
+Membros: M1_RING_NODES="n1=http://host1:8000,n2=http://host2:8000" e
+M1_RING_SELF com o nome deste nó. Com M1_RING_MEMBERS_FILE, a lista é relida
+quando o arquivo muda (uma linha "nome=url" por nó); só ~1/N das chaves muda
+de dono a cada nó que entra ou sai.
+
+O simulador roda N processos, cada um com seus caches LRU locais (texto do KB
+e respostas), sob uma carga sintética com popularidade de KBs em lei de
+potência, e compara o roteamento pelo anel com o aleatório (acerto, cópias de
+cada KB em cache, chaves movidas quando um nó entra no meio da carga):
+
+  python -m m1_busca_documental.kb_ring simulate --nodes 4 --tickets 20000
+  python -m m1_busca_documental.kb_ring owner "rejeição 215"
+"""
+
+import argparse
+import bisect
+import hashlib
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    KEYWORD_ROUTING_ENABLED,
+    RING_FORWARD_TIMEOUT_SECONDS,
+    RING_MEMBERS_FILE,
+    RING_NODE_COOLDOWN_SECONDS,
+    RING_NODES,
+    RING_SELF,
+    RING_VNODES,
+)
+from m1_busca_documental.text_normalization import normalize_query
+
+# Header dos pedidos encaminhados entre nós (impede encaminhar de novo)
+FORWARDED_HEADER = b"x-m1-forwarded"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Anel de hash consistente com `vnodes` pontos por nó."""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = RING_VNODES):
+        self.vnodes = max(1, vnodes)
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._nodes: set = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def add(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            idx = bisect.bisect(self._points, point)
+            self._points.insert(idx, point)
+            self._owners.insert(idx, node)
+
+    def remove(self, node: str) -> None:
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Nó dono da chave (primeiro ponto do anel a partir do hash dela)."""
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[idx]
+
+    def preference_list(self, key: str, n: Optional[int] = None) -> List[str]:
+        """Os `n` nós distintos seguintes no anel (o dono primeiro)."""
+        n = len(self._nodes) if n is None else min(n, len(self._nodes))
+        if not self._points or n <= 0:
+            return []
+        start = bisect.bisect(self._points, _hash(key))
+        found: List[str] = []
+        for offset in range(len(self._points)):
+            node = self._owners[(start + offset) % len(self._points)]
+            if node not in found:
+                found.append(node)
+                if len(found) == n:
+                    break
+        return found
+
+
+def moved_fraction(before: HashRing, after: HashRing, keys: Sequence[str]) -> float:
+    """Fração das chaves que mudam de dono entre dois anéis."""
+    if not keys:
+        return 0.0
+    return sum(before.owner(k) != after.owner(k) for k in keys) / len(keys)
+
+
+def parse_members(spec: str) -> Dict[str, str]:
+    """"n1=http://h1:8000,n2=http://h2:8000" (vírgulas ou linhas) → {nome: url}."""
+    members: Dict[str, str] = {}
+    for item in spec.replace("\n", ",").split(","):
+        name, _, url = item.strip().partition("=")
+        if name.strip() and url.strip() and not name.strip().startswith("#"):
+            members[name.strip()] = url.strip().rstrip("/")
+    return members
+
+
+def affinity_key(user_query: str, kb_hint: Optional[str] = None) -> str:
+    """Chave de afinidade do ticket: kb:<KB> se o KB é conhecido, senão q:<pergunta>."""
+    if kb_hint:
+        return f"kb:{str(kb_hint).strip().upper()}"
+    if KEYWORD_ROUTING_ENABLED and user_query.strip():
+        from m1_busca_documental.keyword_router import get_matcher, match_kb
+        from m1_busca_documental.nodes import _get_n1_db
+
+        result = match_kb(user_query, get_matcher(_get_n1_db().get_all_data()))
+        if result["confident"]:
+            return f"kb:{result['kb_id']}"
+    return f"q:{normalize_query(user_query)}"
+
+
+# ---------------------------------------------------------------------------
+# Roteador do processo (usado pelo service.py)
+# ---------------------------------------------------------------------------
+class KbRouter:
+    """
+    Anel dos membros + nó local. dispatch() encaminha o pedido ao dono remoto e
+    devolve a resposta dele, ou None quando o ticket deve rodar aqui.
+    """
+
+    def __init__(
+        self,
+        members: Dict[str, str],
+        self_name: str,
+        vnodes: int = RING_VNODES,
+        members_file: str = RING_MEMBERS_FILE,
+        cooldown_seconds: float = RING_NODE_COOLDOWN_SECONDS,
+    ):
+        self.self_name = self_name
+        self.vnodes = vnodes
+        self.members_file = members_file
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._members: Dict[str, str] = {}
+        self._ring = HashRing((), vnodes)
+        self._down_until: Dict[str, float] = {}
+        self._members_mtime: Optional[float] = None
+        self._session: Any = None
+        self.set_members(members)
+
+    @property
+    def members(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._members)
+
+    def set_members(self, members: Dict[str, str]) -> float:
+        """Troca a lista de membros; devolve a fração estimada de chaves que mudou de dono."""
+        new_ring = HashRing(members, self.vnodes)
+        with self._lock:
+            old_ring = self._ring
+            self._members = dict(members)
+            self._ring = new_ring
+        if not len(old_ring):
+            return 0.0
+        sample = [f"probe:{i}" for i in range(2000)]
+        moved = moved_fraction(old_ring, new_ring, sample)
+        metrics.incr("ring_rebalances")
+        metrics.observe("ring_rebalance_moved_fraction", moved)
+        return moved
+
+    def _reload_members(self) -> None:
+        if not self.members_file:
+            return
+        try:
+            mtime = os.path.getmtime(self.members_file)
+        except OSError:
+            return
+        if mtime == self._members_mtime:
+            return
+        self._members_mtime = mtime
+        with open(self.members_file, "r", encoding="utf-8") as f:
+            members = parse_members(f.read())
+        if members and members != self.members:
+            self.set_members(members)
+
+    def mark_down(self, node: str) -> None:
+        with self._lock:
+            self._down_until[node] = time.monotonic() + self.cooldown_seconds
+        metrics.incr("ring_node_down", node=node)
+
+    def candidates(self, key: str) -> List[Tuple[str, str]]:
+        """Lista de preferência (nome, url) sem os nós em cooldown; o local encerra a lista."""
+        self._reload_members()
+        now = time.monotonic()
+        with self._lock:
+            ring, members = self._ring, self._members
+            down = {n for n, until in self._down_until.items() if until > now}
+        ordered = []
+        for node in ring.preference_list(key):
+            if node in down:
+                continue
+            if node == self.self_name:
+                break
+            ordered.append((node, members[node]))
+        return ordered
+
+    def forward(self, node: str, url: str, payload: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        POST /tickets no nó dono. Devolve ("ok", resultado), ("busy", None) se o
+        dono respondeu 503 (sobrecarga, não queda) ou ("down", None) — e o nó
+        entra em cooldown — se ele não respondeu ou falhou.
+        """
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+        try:
+            response = self._session.post(
+                f"{url}/tickets",
+                json=payload,
+                headers={FORWARDED_HEADER.decode(): self.self_name or "1"},
+                timeout=RING_FORWARD_TIMEOUT_SECONDS,
+            )
+        except requests.RequestException:
+            self.mark_down(node)
+            return "down", None
+        if response.status_code == 503:
+            return "busy", None
+        if response.status_code != 200:
+            self.mark_down(node)
+            return "down", None
+        return "ok", response.json()
+
+    def dispatch(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Encaminha o pedido ao dono (ou ao próximo disponível). None quando o
+        ticket deve rodar localmente: este nó é o dono, os nós à frente estão
+        fora, ou o dono está sobrecarregado (outro nó não teria os caches dele).
+        """
+        key = affinity_key(payload.get("user_query") or "", payload.get("kb_id"))
+        key_kind = key.split(":", 1)[0]
+        for node, url in self.candidates(key):
+            outcome, result = self.forward(node, url, payload)
+            metrics.incr("ring_forward", node=node, outcome=outcome)
+            if outcome == "ok":
+                metrics.incr("ring_routed", target="remote", key_kind=key_kind)
+                return result
+            if outcome == "busy":
+                break
+        metrics.incr("ring_routed", target="local", key_kind=key_kind)
+        return None
+
+
+_router_lock = threading.Lock()
+_router: Optional[KbRouter] = None
+
+
+def get_router() -> Optional[KbRouter]:
+    """Roteador do processo; None sem M1_RING_NODES/M1_RING_MEMBERS_FILE ou sem M1_RING_SELF."""
+    global _router
+    with _router_lock:
+        if _router is None and RING_SELF and (RING_NODES or RING_MEMBERS_FILE):
+            _router = KbRouter(parse_members(RING_NODES), RING_SELF)
+        return _router
+
+
+# ---------------------------------------------------------------------------
+# Simulador multiprocesso
+# ---------------------------------------------------------------------------
+def _sim_kb_chars(kb_id: str) -> int:
+    """Tamanho (determinístico) do texto de um KB sintético: 2 mil a 40 mil caracteres."""
+    return 2000 + _hash(kb_id) % 38000
+
+
+def _sim_worker(name: str, tasks: Any, results: Any, doc_cache_kbs: int, answer_cache_size: int) -> None:
+    """Um "nó": caches LRU locais de texto do KB e de respostas."""
+    docs: "OrderedDict[str, str]" = OrderedDict()
+    answers: "OrderedDict[Tuple[str, int], bool]" = OrderedDict()
+    counts: Counter = Counter()
+    while True:
+        ticket = tasks.get()
+        if ticket is None:
+            break
+        kb_id, question = ticket
+        counts["tickets"] += 1
+        if (kb_id, question) in answers:
+            answers.move_to_end((kb_id, question))
+            counts["answer_hits"] += 1
+            continue
+        if kb_id in docs:
+            docs.move_to_end(kb_id)
+            counts["doc_hits"] += 1
+        else:
+            counts["doc_misses"] += 1
+            docs[kb_id] = "x" * _sim_kb_chars(kb_id)
+            if len(docs) > doc_cache_kbs:
+                docs.popitem(last=False)
+        answers[(kb_id, question)] = True
+        if len(answers) > answer_cache_size:
+            answers.popitem(last=False)
+    results.put((name, dict(counts), sorted(docs), sum(len(t) for t in docs.values())))
+
+
+def _zipf_workload(
+    kbs: int, questions_per_kb: int, tickets: int, skew: float, seed: int
+) -> List[Tuple[str, int]]:
+    """Tickets (kb, nº da pergunta) com popularidade de KBs e de perguntas em lei de potência."""
+    rnd = random.Random(seed)
+    kb_ids = [f"KBSIM{i:05d}" for i in range(kbs)]
+    kb_weights = [1.0 / (rank + 1) ** skew for rank in range(kbs)]
+    q_weights = [1.0 / (rank + 1) ** skew for rank in range(questions_per_kb)]
+    chosen = rnd.choices(kb_ids, weights=kb_weights, k=tickets)
+    questions = rnd.choices(range(questions_per_kb), weights=q_weights, k=tickets)
+    return list(zip(chosen, questions))
+
+
+def simulate(
+    nodes: int = 4,
+    tickets: int = 20000,
+    policy: str = "ring",
+    add_node_at: float = 0.5,
+    kbs: int = 500,
+    questions_per_kb: int = 20,
+    doc_cache_kbs: int = 50,
+    answer_cache_size: int = 500,
+    skew: float = 1.0,
+    seed: int = 7,
+    vnodes: int = RING_VNODES,
+) -> Dict[str, Any]:
+    """
+    Roda uma carga sintética (`kbs` KBs, `questions_per_kb` perguntas cada) em
+    `nodes` processos — mais um que entra em `add_node_at` da carga, 0 desliga —
+    com roteamento "ring" ou "random" e devolve os totais.
+    """
+    workload = _zipf_workload(kbs, questions_per_kb, tickets, skew, seed)
+    ctx = multiprocessing.get_context(
+        "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    results = ctx.Queue()
+    queues: Dict[str, Any] = {}
+    procs: List[Any] = []
+
+    def _start(name: str) -> None:
+        queues[name] = ctx.Queue()
+        proc = ctx.Process(
+            target=_sim_worker,
+            args=(name, queues[name], results, doc_cache_kbs, answer_cache_size),
+            daemon=True,
+        )
+        proc.start()
+        procs.append(proc)
+
+    names = [f"node-{i}" for i in range(nodes)]
+    for name in names:
+        _start(name)
+    ring = HashRing(names, vnodes)
+    rnd = random.Random(seed + 1)
+    moved = None
+    switch_at = int(tickets * add_node_at) if add_node_at > 0 else -1
+    keys = [f"kb:KBSIM{i:05d}" for i in range(kbs)]
+
+    start = time.perf_counter()
+    for i, (kb_id, question) in enumerate(workload):
+        if i == switch_at:
+            new_name = f"node-{len(names)}"
+            names.append(new_name)
+            _start(new_name)
+            new_ring = HashRing(names, vnodes)
+            moved = moved_fraction(ring, new_ring, keys)
+            ring = new_ring
+        target = ring.owner(f"kb:{kb_id}") if policy == "ring" else rnd.choice(names)
+        queues[target].put((kb_id, question))
+    for name in names:
+        queues[name].put(None)
+
+    per_node: Dict[str, Dict[str, Any]] = {}
+    copies: Counter = Counter()
+    for _ in names:
+        name, counts, cached_kbs, cached_chars = results.get()
+        copies.update(cached_kbs)
+        per_node[name] = {**counts, "cached_kbs": len(cached_kbs), "cached_chars": cached_chars}
+    for proc in procs:
+        proc.join(timeout=10)
+
+    totals: Counter = Counter()
+    for counts in per_node.values():
+        totals.update(counts)
+    served = totals["tickets"] or 1
+    lookups = (totals["doc_hits"] + totals["doc_misses"]) or 1
+    return {
+        "policy": policy,
+        "nodes": len(names),
+        "tickets": totals["tickets"],
+        "answer_hit_rate": round(totals["answer_hits"] / served, 4),
+        "doc_hit_rate": round(totals["doc_hits"] / lookups, 4),
+        "distinct_cached_kbs": len(copies),
+        "kb_copies_per_cached_kb": round(sum(copies.values()) / max(1, len(copies)), 3),
+        "cached_chars": totals["cached_chars"],
+        "moved_fraction_on_add": None if moved is None else round(moved, 4),
+        "seconds": round(time.perf_counter() - start, 2),
+        "per_node": per_node,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Afinidade por KB (hash consistente) do M1.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sim = sub.add_parser("simulate", help="Simulador multiprocesso: anel x aleatório.")
+    sim.add_argument("--nodes", type=int, default=4)
+    sim.add_argument("--tickets", type=int, default=20000)
+    sim.add_argument("--policy", choices=("ring", "random", "both"), default="both")
+    sim.add_argument("--add-node-at", type=float, default=0.5, help="Fração da carga (0 = não adiciona).")
+    sim.add_argument("--kbs", type=int, default=500, help="KBs sintéticos na carga.")
+    sim.add_argument("--questions-per-kb", type=int, default=20)
+    sim.add_argument("--doc-cache-kbs", type=int, default=50, help="KBs no cache de cada nó.")
+    sim.add_argument("--answer-cache", type=int, default=500, help="Respostas no cache de cada nó.")
+    sim.add_argument("--skew", type=float, default=1.0, help="Expoente da popularidade dos KBs.")
+    sim.add_argument("--seed", type=int, default=7)
+    sim.add_argument("--vnodes", type=int, default=RING_VNODES)
+
+    own = sub.add_parser("owner", help="Mostra a chave e o dono de uma pergunta.")
+    own.add_argument("user_query")
+    own.add_argument("--kb-id", help="KB já conhecido (dispensa o roteamento por palavra-chave).")
+
+    args = parser.parse_args(argv)
+    if args.command == "owner":
+        key = affinity_key(args.user_query, args.kb_id)
+        members = parse_members(RING_NODES) or {f"node-{i}": "" for i in range(4)}
+        print(f"chave: {key}")
+        print("preferência:", " → ".join(HashRing(members).preference_list(key)))
+        return
+
+    policies = ("ring", "random") if args.policy == "both" else (args.policy,)
+    for policy in policies:
+        report = simulate(
+            nodes=args.nodes,
+            tickets=args.tickets,
+            policy=policy,
+            add_node_at=args.add_node_at,
+            kbs=args.kbs,
+            questions_per_kb=args.questions_per_kb,
+            doc_cache_kbs=args.doc_cache_kbs,
+            answer_cache_size=args.answer_cache,
+            skew=args.skew,
+            seed=args.seed,
+            vnodes=args.vnodes,
+        )
+        print(
+            f"{policy:>6}: {report['nodes']} nós, {report['tickets']} tickets | "
+            f"acerto respostas {report['answer_hit_rate']:.1%} | "
+            f"acerto KB {report['doc_hit_rate']:.1%} | "
+            f"cópias por KB {report['kb_copies_per_cached_kb']:.2f} | "
+            f"{report['cached_chars'] / 1e6:.1f} M caracteres em cache"
+            + (
+                f" | chaves movidas ao entrar um nó {report['moved_fraction_on_add']:.1%}"
+                if policy == "ring" and report["moved_fraction_on_add"] is not None
+                else ""
+            )
+        )
+        for name, counts in sorted(report["per_node"].items()):
+            print(
+                f"        {name}: {counts.get('tickets', 0)} tickets, "
+                f"{counts['cached_kbs']} KBs em cache ({counts['cached_chars'] / 1e3:.0f} mil caracteres)"
+            )
+
+
+if __name__ == "__main__":
+    main()
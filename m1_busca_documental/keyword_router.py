@@ -0,0 +1,208 @@
+"""
+Roteamento direto por palavra-chave — Módulo M1 N1 Chamados
+
+Muitos chamados já citam o KB ("KB0019150"), o número da rejeição
+("rejeição 215") ou um termo exclusivo de um KB ("não emite CTe"). Para esses, a busca
+vetorial remota é desnecessária: o nó route_by_keyword (antes do
+call_libindexr) procura esses termos na pergunta e, com um acerto confiável,
+preenche doc_reference/kb_id e o grafo segue direto para o fetch_local_document.
+
+Os termos vêm de três fontes:
+- códigos KB (nomes dos arquivos em DOCS_REPO_PATH e tabela n1_chamados);
+- títulos dos documentos (nome do arquivo sem código e sem "(1)");
+- apelidos curados em kb_aliases.yaml (M1_KB_ALIASES).
+
+Todos são normalizados (normalize_query) e compilados num autômato
+Aho–Corasick, então a pergunta é varrida uma única vez, independentemente do
+número de termos. Só contam ocorrências de palavras inteiras.
+
+Um acerto é confiável quando todos os termos encontrados apontam para o mesmo
+KB, ou quando a pergunta cita explicitamente um único código KB (o código
+prevalece sobre apelidos de outros KBs). Nos demais casos o roteamento
+desiste e a busca normal decide. Se a resposta do KB roteado vier irrelevante,
+o grafo ainda tenta a busca normal (graph.decide_next_node).
+"""
+
+import os
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from m1_busca_documental.config import DOCS_REPO_PATH, KB_ALIASES_PATH
+from m1_busca_documental.kb_catalog import extract_kb_code, kb_title, list_kb_files
+from m1_busca_documental.text_normalization import normalize_query
+
+KIND_CODE = "code"
+KIND_TITLE = "title"
+KIND_ALIAS = "alias"
+
+_TITLE_SUFFIX_RE = re.compile(r"\s*\(\d+\)\s*$")
+
+
+class AhoCorasick:
+    """
+    Autômato Aho–Corasick simples: goto em dicionários por estado, links de falha
+    calculados em BFS e saídas acumuladas ao longo dos links.
+    """
+
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, Any]]] = [[]]
+
+    def add(self, pattern: str, payload: Any) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((pattern, payload))
+
+    def build(self) -> "AhoCorasick":
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def find(self, text: str) -> List[Tuple[int, int, str, Any]]:
+        """Todas as ocorrências: [(início, fim, padrão, payload)]."""
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for pattern, payload in self._out[state]:
+                matches.append((i - len(pattern) + 1, i + 1, pattern, payload))
+        return matches
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+
+def _clean_title(path: str) -> str:
+    """'KB0034986 - Como consultar ... (2)' → 'como consultar ...' (normalizado)."""
+    title = kb_title(path)
+    code = extract_kb_code(title)
+    if code:
+        title = re.sub(re.escape(code), "", title, flags=re.IGNORECASE)
+    title = _TITLE_SUFFIX_RE.sub("", title).strip(" -")
+    return normalize_query(title)
+
+
+def _load_aliases(path: str) -> Dict[str, List[str]]:
+    if not path or not os.path.isfile(path):
+        return {}
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    return {
+        str(kb).upper(): [str(a) for a in (aliases or [])]
+        for kb, aliases in data.items()
+    }
+
+
+def build_matcher(
+    docs_path: str = DOCS_REPO_PATH,
+    aliases_path: str = KB_ALIASES_PATH,
+    db_records: Optional[List[Dict[str, Any]]] = None,
+) -> AhoCorasick:
+    """Compila os termos (código, título, apelidos) de todos os KBs conhecidos."""
+    terms: Dict[str, Set[Tuple[str, str]]] = {}
+
+    def _add(term: str, kb_id: str, kind: str) -> None:
+        term = normalize_query(term)
+        if len(term) >= 2:
+            terms.setdefault(term, set()).add((kb_id, kind))
+
+    for kb_id, paths in list_kb_files(docs_path).items():
+        _add(kb_id, kb_id, KIND_CODE)
+        for path in paths:
+            _add(_clean_title(path), kb_id, KIND_TITLE)
+    for record in db_records or []:
+        if record.get("kb_id"):
+            _add(record["kb_id"], str(record["kb_id"]).upper(), KIND_CODE)
+    for kb_id, aliases in _load_aliases(aliases_path).items():
+        for alias in aliases:
+            _add(alias, kb_id, KIND_ALIAS)
+
+    matcher = AhoCorasick()
+    for term, targets in terms.items():
+        matcher.add(term, sorted(targets))
+    return matcher.build()
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def match_kb(text: str, matcher: AhoCorasick) -> Dict[str, Any]:
+    """
+    Procura os termos na pergunta.
+
+    Retorna {"kb_id": str|None, "confident": bool, "matches": [{term, kb_id, kind}],
+             "candidates": [kb_id, ...]}.
+    """
+    normalized = normalize_query(text)
+    matches = []
+    for start, end, term, targets in matcher.find(normalized):
+        if not _is_word_boundary(normalized, start, end):
+            continue
+        for kb_id, kind in targets:
+            matches.append({"term": term, "kb_id": kb_id, "kind": kind})
+
+    candidates = sorted({m["kb_id"] for m in matches})
+    coded = sorted({m["kb_id"] for m in matches if m["kind"] == KIND_CODE})
+    if len(candidates) == 1:
+        kb_id: Optional[str] = candidates[0]
+    elif len(coded) == 1:
+        kb_id = coded[0]
+    else:
+        kb_id = None
+    return {
+        "kb_id": kb_id,
+        "confident": kb_id is not None,
+        "matches": matches,
+        "candidates": candidates,
+    }
+
+
+_matcher_lock = threading.Lock()
+_matcher_cache: Optional[Tuple[Any, AhoCorasick]] = None
+
+
+def get_matcher(db_records: Optional[List[Dict[str, Any]]] = None) -> AhoCorasick:
+    """
+    Autômato do processo, recompilado quando a pasta de documentos ou o arquivo
+    de apelidos mudam.
+    """
+    global _matcher_cache
+    docs_mtime = os.stat(DOCS_REPO_PATH).st_mtime if os.path.isdir(DOCS_REPO_PATH) else None
+    aliases_mtime = (
+        os.stat(KB_ALIASES_PATH).st_mtime if os.path.isfile(KB_ALIASES_PATH) else None
+    )
+    db_key = tuple(sorted({str(r.get("kb_id")) for r in db_records or []}))
+    signature = (docs_mtime, aliases_mtime, db_key)
+    with _matcher_lock:
+        if _matcher_cache and _matcher_cache[0] == signature:
+            return _matcher_cache[1]
+    matcher = build_matcher(db_records=db_records)
+    with _matcher_lock:
+        _matcher_cache = (signature, matcher)
+    return matcher
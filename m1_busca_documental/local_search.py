@@ -0,0 +1,124 @@
+"""
+Busca lexical local (BM25) sobre os KBs — Módulo M1 N1 Chamados
+
+Caminho degradado do call_libindexr: quando o circuito do libindexr está
+aberto, a pergunta é comparada diretamente com os .txt de DOCS_REPO_PATH.
+É menos precisa que a busca vetorial, mas não depende de rede e responde em
+milissegundos para o tamanho atual do acervo.
+
+O índice (termos por documento) é mantido em memória e reconstruído quando a
+listagem da pasta muda.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from m1_busca_documental.config import DOCS_REPO_PATH
+from m1_busca_documental.kb_catalog import list_kb_files, read_kb_text
+from m1_busca_documental.text_normalization import normalize_query
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Palavras muito frequentes em português que não ajudam a distinguir KBs
+STOPWORDS = frozenset(
+    "a o e de da do das dos em no na nos nas um uma para por com como que se "
+    "ao aos as os ou ja nao sim mais sua seu meu minha esta este isso qual "
+    "quando onde ser ter foi sao esta estou preciso consigo".split()
+)
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_index_lock = threading.Lock()
+# docs_path -> (assinatura da listagem, índice)
+_indexes: Dict[str, Tuple[Tuple[Tuple[str, float], ...], Dict[str, Any]]] = {}
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens normalizados (sem acento, minúsculos), sem stopwords."""
+    return [
+        t
+        for t in _TOKEN_RE.findall(normalize_query(text))
+        if t not in STOPWORDS and (len(t) > 1 or t.isdigit())
+    ]
+
+
+def _build_index(docs_path: str) -> Dict[str, Any]:
+    docs = []
+    for kb_code, paths in list_kb_files(docs_path).items():
+        for path in paths:
+            tf = Counter(tokenize(read_kb_text(path)))
+            docs.append({"kb_id": kb_code, "path": path, "tf": tf, "len": sum(tf.values())})
+
+    df: Counter = Counter()
+    for doc in docs:
+        df.update(doc["tf"].keys())
+    n_docs = len(docs)
+    idf = {term: math.log(1 + (n_docs - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+    avg_len = (sum(d["len"] for d in docs) / n_docs) if n_docs else 0.0
+    return {"docs": docs, "idf": idf, "avg_len": avg_len}
+
+
+def _get_index(docs_path: str) -> Dict[str, Any]:
+    listing = list_kb_files(docs_path)
+    signature = tuple(
+        (p, os.path.getmtime(p)) for paths in listing.values() for p in paths if os.path.exists(p)
+    )
+    with _index_lock:
+        cached = _indexes.get(docs_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+    index = _build_index(docs_path)
+    with _index_lock:
+        _indexes[docs_path] = (signature, index)
+    return index
+
+
+def search_local_documents(
+    user_query: str, docs_path: Optional[str] = None, top_k: int = 3
+) -> List[Dict[str, Any]]:
+    """
+    Ranqueia os KBs locais pela pergunta (BM25).
+
+    Retorno: lista (melhor primeiro) de
+        {"kb_id", "path", "score", "coverage"}
+    onde coverage é a fração dos termos da pergunta presentes no documento
+    (0..1, usada como "similaridade" no caminho degradado).
+    """
+    docs_path = docs_path or DOCS_REPO_PATH
+    query_terms = set(tokenize(user_query))
+    if not query_terms:
+        return []
+
+    index = _get_index(docs_path)
+    idf = index["idf"]
+    avg_len = index["avg_len"] or 1.0
+
+    scored = []
+    for doc in index["docs"]:
+        tf = doc["tf"]
+        score = 0.0
+        matched = 0
+        for term in query_terms:
+            freq = tf.get(term, 0)
+            if not freq:
+                continue
+            matched += 1
+            norm = freq + _BM25_K1 * (1 - _BM25_B + _BM25_B * doc["len"] / avg_len)
+            score += idf.get(term, 0.0) * freq * (_BM25_K1 + 1) / norm
+        if score > 0:
+            scored.append(
+                {
+                    "kb_id": doc["kb_id"],
+                    "path": doc["path"],
+                    "score": score,
+                    "coverage": matched / len(query_terms),
+                }
+            )
+
+    scored.sort(key=lambda d: d["score"], reverse=True)
+    return scored[:top_k]
@@ -0,0 +1,196 @@
+"""
+Métricas em processo — Módulo M1 N1 Chamados
+
+Registro simples (thread-safe) de contadores e resumos de observações
+(count/sum/max) usado pelos nós do grafo e pelas integrações.
+
+Cada métrica é identificada pelo nome + labels (ex.: tier="small"). O snapshot()
+devolve um dicionário serializável, para ser impresso, logado ou exposto por
+um endpoint HTTP.
+
+Uso:
+    from m1_busca_documental import metrics
+    metrics.incr("llm_calls", tier="small")
+    metrics.observe("llm_latency_seconds", 0.82, tier="small")
+    print(metrics.snapshot())
+"""
+
+import re
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[_LabelKey, float]] = {}
+_summaries: Dict[str, Dict[_LabelKey, Dict[str, float]]] = {}
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def _label_key(labels: Dict[str, Any]) -> _LabelKey:
+    """Normaliza os labels em uma tupla ordenada (chave do dicionário interno)."""
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _label_str(key: _LabelKey) -> str:
+    """Formata os labels como 'k=v,k2=v2' (vazio quando não há labels)."""
+    return ",".join(f"{k}={v}" for k, v in key)
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    """Incrementa o contador `name` (com os labels informados)."""
+    key = _label_key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """Registra uma observação (latência, tokens...) no resumo `name`."""
+    key = _label_key(labels)
+    with _lock:
+        series = _summaries.setdefault(name, {})
+        summary = series.get(key)
+        if summary is None:
+            series[key] = {"count": 1, "sum": value, "max": value}
+        else:
+            summary["count"] += 1
+            summary["sum"] += value
+            if value > summary["max"]:
+                summary["max"] = value
+
+
+def register_collector(name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Registra uma função que devolve métricas "ao vivo" (ex.: estado de um
+    circuit breaker ou profundidade de uma fila). É chamada a cada snapshot().
+    """
+    with _lock:
+        _collectors[name] = collector
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Retorna uma cópia das métricas atuais:
+        {"counters": {nome: {labels: valor}},
+         "summaries": {nome: {labels: {count, sum, max, avg}}},
+         "collectors": {nome: {...}}}
+    """
+    with _lock:
+        counters = {
+            name: {_label_str(k): v for k, v in series.items()}
+            for name, series in _counters.items()
+        }
+        summaries = {
+            name: {
+                _label_str(k): {**s, "avg": s["sum"] / s["count"] if s["count"] else 0.0}
+                for k, s in series.items()
+            }
+            for name, series in _summaries.items()
+        }
+        collectors = dict(_collectors)
+
+    collected: Dict[str, Any] = {}
+    for name, collector in collectors.items():
+        try:
+            collected[name] = collector()
+        except Exception as e:
+            collected[name] = {"error": str(e)}
+
+    return {"counters": counters, "summaries": summaries, "collectors": collected}
+
+
+def _prom_name(*parts: str) -> str:
+    name = "_".join(p for p in parts if p)
+    return "m1_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _prom_labels(label_str: str) -> str:
+    pairs = [p.split("=", 1) for p in label_str.split(",") if "=" in p]
+    rendered = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + rendered + "}" if rendered else ""
+
+
+def _flatten_numeric(prefix: str, value: Any, out: List[Tuple[str, float]]) -> None:
+    """Achata dicionários aninhados em (nome, valor) mantendo só folhas numéricas."""
+    if isinstance(value, (bool, int, float)):
+        out.append((prefix, float(value)))
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            _flatten_numeric(f"{prefix}_{k}", v, out)
+
+
+def render_prometheus() -> str:
+    """
+    Formata o snapshot() no formato texto do Prometheus:
+    contadores como m1_<nome>, resumos como m1_<nome>_count/_sum/_max e
+    collectors como gauges m1_<collector>_<chave...> (só valores numéricos).
+    Estados textuais (ex.: circuito "open") viram m1_<...>_state{value="open"} 1.
+    """
+    snap = snapshot()
+    lines: List[str] = []
+    for name, series in sorted(snap["counters"].items()):
+        lines.append(f"# TYPE {_prom_name(name)} counter")
+        for labels, value in sorted(series.items()):
+            lines.append(f"{_prom_name(name)}{_prom_labels(labels)} {value}")
+    for name, series in sorted(snap["summaries"].items()):
+        lines.append(f"# TYPE {_prom_name(name)} summary")
+        for labels, s in sorted(series.items()):
+            for field in ("count", "sum", "max"):
+                lines.append(f"{_prom_name(name, field)}{_prom_labels(labels)} {s[field]}")
+    for name, data in sorted(snap["collectors"].items()):
+        flat: List[Tuple[str, float]] = []
+        _flatten_numeric("", data, flat)
+        for key, value in flat:
+            lines.append(f"{_prom_name(name, key.lstrip('_'))} {value}")
+        if isinstance(data, dict):
+            for sub_name, sub in data.items():
+                if isinstance(sub, dict) and isinstance(sub.get("state"), str):
+                    label = f'value="{sub["state"]}"'
+                    lines.append(f"{_prom_name(name, sub_name, 'state')}{{{label}}} 1")
+    return "\n".join(lines) + "\n"
+
+
+def get_counter(name: str, **labels: Any) -> float:
+    """Valor atual de um contador (0 se nunca incrementado)."""
+    with _lock:
+        return _counters.get(name, {}).get(_label_key(labels), 0)
+
+
+def reset() -> None:
+    """Zera contadores e resumos (os collectors registrados são mantidos)."""
+    with _lock:
+        _counters.clear()
+        _summaries.clear()
+
+
+def merge_snapshots(snapshots: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combina snapshots de vários processos ({worker: snapshot()}) num só:
+    contadores somados, resumos com count/sum somados e max do maior, e os
+    collectors agrupados por worker.
+    """
+    counters: Dict[str, Dict[str, float]] = {}
+    summaries: Dict[str, Dict[str, Dict[str, float]]] = {}
+    collectors: Dict[str, Any] = {}
+    for worker, snap in snapshots.items():
+        for name, series in snap.get("counters", {}).items():
+            merged = counters.setdefault(name, {})
+            for labels, value in series.items():
+                merged[labels] = merged.get(labels, 0) + value
+        for name, series in snap.get("summaries", {}).items():
+            merged_s = summaries.setdefault(name, {})
+            for labels, s in series.items():
+                current = merged_s.get(labels)
+                if current is None:
+                    merged_s[labels] = {"count": s["count"], "sum": s["sum"], "max": s["max"]}
+                else:
+                    current["count"] += s["count"]
+                    current["sum"] += s["sum"]
+                    current["max"] = max(current["max"], s["max"])
+        if snap.get("collectors"):
+            collectors[str(worker)] = snap["collectors"]
+    for series in summaries.values():
+        for s in series.values():
+            s["avg"] = s["sum"] / s["count"] if s["count"] else 0.0
+    return {"counters": counters, "summaries": summaries, "collectors": collectors}
@@ -0,0 +1,129 @@
+"""
+Roteamento de modelo por ticket (model tiering) — Módulo M1 N1 Chamados
+
+O generate_answer não precisa usar sempre o GPT-4o. Tickets "fáceis" — pergunta
+curta, documento pequeno e alta similaridade no libindexr — são enviados a um
+modelo menor (LLM_MODEL_SMALL), mais barato e rápido. Os demais continuam no
+LLM_MODEL.
+
+Sinais usados (todos já presentes no AgentState):
+- best_similarity_score: confiança da busca (libindexr).
+- raw_text_content: tamanho do documento que vai no prompt.
+- user_query: tamanho da pergunta.
+- histórico do KB: quantas vezes o modelo menor já foi usado com sucesso
+  ou precisou ser escalado para aquele kb_id neste processo.
+
+Se a saída do modelo menor não vier no formato esperado (CLASSIFICACAO: ...),
+o nó generate_answer escala para o modelo maior e registra o resultado aqui,
+para que KBs problemáticos passem a ir direto para o modelo maior.
+"""
+
+import threading
+from typing import Any, Dict, List
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    LLM_MODEL,
+    LLM_MODEL_SMALL,
+    MODEL_ROUTING_ENABLED,
+    ROUTER_MAX_DOC_CHARS,
+    ROUTER_MAX_KB_ESCALATION_RATE,
+    ROUTER_MAX_QUERY_CHARS,
+    ROUTER_MIN_SIMILARITY,
+)
+from m1_busca_documental.state import AgentState
+
+TIER_SMALL = "small"
+TIER_LARGE = "large"
+
+# Número mínimo de usos do modelo menor num KB antes de confiar na taxa de escalonamento
+_MIN_KB_SAMPLES = 5
+
+_history_lock = threading.Lock()
+# kb_id -> {"small_ok": int, "escalated": int}
+_kb_history: Dict[str, Dict[str, int]] = {}
+
+
+def model_for_tier(tier: str) -> str:
+    """Nome do modelo OpenAI correspondente ao tier."""
+    return LLM_MODEL_SMALL if tier == TIER_SMALL else LLM_MODEL
+
+
+def _similarity(state: AgentState) -> float:
+    """Melhor similarityScore disponível no estado (0.0 se ausente)."""
+    score = state.get("best_similarity_score")
+    if score is None:
+        score = (state.get("retrieved_document") or {}).get("similarity_score")
+    try:
+        return float(score) if score is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def kb_escalation_rate(kb_id: str) -> float:
+    """
+    Fração de chamadas do modelo menor que precisaram ser escaladas para o KB.
+    Retorna 0.0 enquanto não houver amostras suficientes.
+    """
+    with _history_lock:
+        hist = _kb_history.get(kb_id)
+        if not hist:
+            return 0.0
+        total = hist["small_ok"] + hist["escalated"]
+        if total < _MIN_KB_SAMPLES:
+            return 0.0
+        return hist["escalated"] / total
+
+
+def choose_model_tier(state: AgentState) -> Dict[str, Any]:
+    """
+    Decide qual tier de modelo atende o ticket.
+
+    Retorno:
+        {"tier": "small" | "large", "model": str, "reasons": [str, ...]}
+        reasons lista os sinais que impediram o uso do modelo menor
+        (vazia quando o tier é "small").
+    """
+    if not MODEL_ROUTING_ENABLED or not LLM_MODEL_SMALL:
+        return {"tier": TIER_LARGE, "model": LLM_MODEL, "reasons": ["routing_disabled"]}
+
+    reasons: List[str] = []
+
+    similarity = _similarity(state)
+    if similarity < ROUTER_MIN_SIMILARITY:
+        reasons.append(f"similarity {similarity:.3f} < {ROUTER_MIN_SIMILARITY}")
+
+    doc_chars = len(state.get("raw_text_content") or "")
+    if doc_chars > ROUTER_MAX_DOC_CHARS:
+        reasons.append(f"doc_chars {doc_chars} > {ROUTER_MAX_DOC_CHARS}")
+
+    query_chars = len((state.get("user_query") or "").strip())
+    if query_chars > ROUTER_MAX_QUERY_CHARS:
+        reasons.append(f"query_chars {query_chars} > {ROUTER_MAX_QUERY_CHARS}")
+
+    kb_id = state.get("kb_id")
+    if kb_id:
+        rate = kb_escalation_rate(kb_id)
+        if rate > ROUTER_MAX_KB_ESCALATION_RATE:
+            reasons.append(f"kb_escalation_rate {rate:.2f} > {ROUTER_MAX_KB_ESCALATION_RATE}")
+
+    tier = TIER_LARGE if reasons else TIER_SMALL
+    return {"tier": tier, "model": model_for_tier(tier), "reasons": reasons}
+
+
+def record_outcome(kb_id: str, escalated: bool) -> None:
+    """Registra se o modelo menor atendeu o KB sozinho ou precisou ser escalado."""
+    if not kb_id:
+        return
+    with _history_lock:
+        hist = _kb_history.setdefault(kb_id, {"small_ok": 0, "escalated": 0})
+        hist["escalated" if escalated else "small_ok"] += 1
+
+
+def kb_history() -> Dict[str, Dict[str, int]]:
+    """Cópia do histórico por KB (para inspeção/métricas)."""
+    with _history_lock:
+        return {kb: dict(h) for kb, h in _kb_history.items()}
+
+
+metrics.register_collector("model_router_kb_history", kb_history)
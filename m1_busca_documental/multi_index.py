@@ -0,0 +1,185 @@
+"""
+Busca em vários índices do libindexr — Módulo M1 N1 Chamados
+
+A tabela n1_chamados associa os KBs a mais de um index_id, mas o call_libindexr
+consultava só M1_INDEX_ID. Com M1_INDEX_IDS configurado, a mesma pergunta é
+enviada a todos os índices em paralelo (pool de threads do processo + sessão
+HTTP compartilhada do LibIndexer) e as respostas são combinadas:
+
+- prazo total (M1_MULTI_INDEX_DEADLINE_SECONDS): entram só os índices que
+  responderam a tempo; os atrasados são registrados e descartados. Cada
+  requisição recebe como timeout HTTP o que resta do prazo, para que uma
+  chamada atrasada libere a thread do pool logo depois do prazo;
+- scores: os índices usam o mesmo modelo de embedding, então os scores brutos
+  são comparáveis e ficam como vieram. Não há reescala pelo melhor de cada
+  índice — ela esticaria um índice fraco (melhor chunk 0,3) até o topo e
+  deixaria os limiares do roteador de modelo sem sentido;
+- deduplicação: o mesmo chunk vindo de dois índices conta uma vez (maior score)
+  e source_ids diferentes do mesmo kb_id são agrupados sob o source_id melhor
+  colocado, para que o re-ranking veja o KB como um único documento.
+
+O resultado tem o formato da resposta do libindexr (results[]), mais um
+resumo por índice em "indexes".
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import MULTI_INDEX_MAX_WORKERS
+
+# query_fn(index_id, timeout_seconds)
+QueryFn = Callable[[str, float], Dict[str, Any]]
+
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool compartilhado do processo (não um pool por ticket)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MULTI_INDEX_MAX_WORKERS, thread_name_prefix="m1-index"
+            )
+        return _executor
+
+
+def fan_out(
+    query_fn: QueryFn, index_ids: Sequence[str], deadline_seconds: float
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Executa query_fn(index_id, timeout) para todos os índices em paralelo,
+    esperando no máximo deadline_seconds no total. timeout é o que resta do
+    prazo quando a chamada começa (uma chamada que esperou vaga no pool até
+    depois do prazo nem sai).
+
+    Retorna {index_id: {"status": "ok"|"error"|"timeout", "response", "error", "seconds"}}.
+    Chamadas que estouram o prazo ficam no pool no máximo até o timeout HTTP
+    delas, e o resultado é ignorado.
+    """
+    executor = _get_executor()
+    expires = time.monotonic() + deadline_seconds
+
+    def _timed(index_id: str) -> Dict[str, Any]:
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Prazo esgotado antes da busca no índice {index_id}.")
+        t0 = time.perf_counter()
+        response = query_fn(index_id, remaining)
+        return {"response": response, "seconds": time.perf_counter() - t0}
+
+    futures = {executor.submit(_timed, index_id): index_id for index_id in index_ids}
+    wait(futures, timeout=deadline_seconds)
+
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    for future, index_id in futures.items():
+        if not future.done():
+            future.cancel()
+            outcomes[index_id] = {"status": "timeout", "seconds": deadline_seconds}
+            metrics.incr("multi_index_requests", status="timeout")
+            continue
+        error = future.exception()
+        if error is not None:
+            outcomes[index_id] = {"status": "error", "error": error}
+            metrics.incr("multi_index_requests", status="error")
+            continue
+        result = future.result()
+        outcomes[index_id] = {"status": "ok", **result}
+        metrics.incr("multi_index_requests", status="ok")
+        metrics.observe("multi_index_seconds", result["seconds"], index_id=index_id)
+    return outcomes
+
+
+def merge_responses(
+    responses: Dict[str, Dict[str, Any]], kb_of_source: Dict[str, str]
+) -> Dict[str, Any]:
+    """
+    Combina as respostas {index_id: resposta do libindexr} num único results[].
+
+    kb_of_source mapeia source_id → kb_id (n1_chamados); source_ids fora do
+    mapa são tratados como um documento próprio.
+    """
+    per_index: Dict[str, List[Any]] = {}
+    for index_id, response in responses.items():
+        entries = per_index.setdefault(index_id, [])
+        for res in (response or {}).get("results") or []:
+            if not isinstance(res, dict) or not isinstance(res.get("chunks"), list):
+                continue
+            for ch in res["chunks"]:
+                chunk_data = ch.get("chunk") if isinstance(ch, dict) else None
+                if not isinstance(chunk_data, dict) or not chunk_data.get("sourceId"):
+                    continue
+                score = ch.get("similarityScore")
+                entries.append((res.get("fromDocument"), ch, float(score or 0.0)))
+
+    # (source_id, rawContent) → melhor ocorrência do chunk entre os índices
+    best_chunks: Dict[Any, Dict[str, Any]] = {}
+    for index_id, entries in per_index.items():
+        for from_doc, ch, score in entries:
+            chunk_data = ch["chunk"]
+            key = (str(chunk_data["sourceId"]), chunk_data.get("rawContent") or "")
+            current = best_chunks.get(key)
+            if current is None or score > current["similarityScore"]:
+                best_chunks[key] = {
+                    **ch,
+                    "similarityScore": score,
+                    "indexId": index_id,
+                    "fromDocument": from_doc,
+                }
+
+    # Documento canônico por kb_id: o source_id do chunk com maior score
+    ordered = sorted(best_chunks.values(), key=lambda c: -c["similarityScore"])
+    canonical: Dict[str, str] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+    for ch in ordered:
+        source_id = str(ch["chunk"]["sourceId"])
+        doc_key = kb_of_source.get(source_id, source_id)
+        canonical.setdefault(doc_key, source_id)
+        target = canonical[doc_key]
+        result = results.setdefault(
+            target, {"fromDocument": ch["fromDocument"], "indexId": ch["indexId"], "chunks": []}
+        )
+        entry = {k: v for k, v in ch.items() if k != "fromDocument"}
+        if source_id != target:
+            entry["chunk"] = {**ch["chunk"], "sourceId": target, "originalSourceId": source_id}
+        result["chunks"].append(entry)
+    return {"results": list(results.values())}
+
+
+def search_indexes(
+    query_fn: QueryFn,
+    index_ids: Sequence[str],
+    deadline_seconds: float,
+    kb_of_source: Dict[str, str],
+) -> Dict[str, Any]:
+    """
+    fan_out + merge_responses. Levanta a exceção do primeiro índice que falhou
+    quando nenhum índice respondeu (para o chamador decidir entre erro e modo
+    degradado) e TimeoutError quando todos estouraram o prazo.
+    """
+    outcomes = fan_out(query_fn, index_ids, deadline_seconds)
+    answered = {i: o["response"] for i, o in outcomes.items() if o["status"] == "ok"}
+    if not answered:
+        errors: List[BaseException] = [o["error"] for o in outcomes.values() if o["status"] == "error"]
+        if errors:
+            raise errors[0]
+        raise TimeoutError(
+            f"Nenhum índice do libindexr respondeu em {deadline_seconds:.1f}s."
+        )
+    if len(answered) < len(outcomes):
+        metrics.incr("multi_index_partial")
+
+    merged = merge_responses(answered, kb_of_source)
+    merged["indexes"] = {
+        index_id: {
+            "status": o["status"],
+            **({"seconds": round(o["seconds"], 3)} if "seconds" in o else {}),
+            **({"error": str(o["error"])} if o.get("error") is not None else {}),
+        }
+        for index_id, o in outcomes.items()
+    }
+    return merged
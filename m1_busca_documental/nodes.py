@@ -14,11 +14,16 @@ Por que essa separação é mais estável que um script sequencial?
 - Fácil adicionar ramificações (ex.: se não houver doc_reference, ir para um nó de fallback).
 """
 
+import hashlib
 import os
 import re
 import sys
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
 
 # Garante que a raiz do projeto está no path para importar integrations.libindexer
 _PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -26,73 +31,413 @@ if str(_PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(_PROJECT_ROOT))
 
 # Cliente de busca: usa estritamente o módulo integrations/libindexer.py (LibIndexer)
+from integrations.circuit_breaker import CircuitBreaker, CircuitOpenError
 from integrations.libindexer import LibIndexer
+from integrations.rate_limiter import PRIORITY_INTERACTIVE, RateLimitScheduler
 
 from m1_busca_documental.config import (
+    ADAPTIVE_RETRIEVAL_ENABLED,
+    CACHE_LIBINDEXR_TTL_SECONDS,
+    CHUNK_CHAIN_MAX_LINK,
+    CHUNK_CONTEXT_MIN_CHARS,
+    CHUNK_FAST_PATH,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    COALESCING_ENABLED,
     DEFAULT_QUANTITY,
     DEFAULT_THRESHOLD_SIMILARITY,
+    DEGRADED_MIN_COVERAGE,
     DOCS_REPO_PATH,
+    FAQ_ENABLED,
+    HANDOFF_ENABLED,
     INDEX_ID,
+    INDEX_IDS,
+    KB_STORE,
+    KEYWORD_ROUTING_ENABLED,
     LIBINDEXR_API_KEY,
     LIBINDEXR_BASE_URL,
+    LIBINDEXR_SLOW_CALL_SECONDS,
+    LIBINDEXR_TIMEOUT_SECONDS,
+    LLM_STOP_SEQUENCES,
+    MULTI_INDEX_DEADLINE_SECONDS,
+    MULTI_INDEX_MAX_WORKERS,
+    OPENAI_EXPECTED_OUTPUT_TOKENS,
+    OPENAI_RPM,
+    OPENAI_SLOW_CALL_SECONDS,
+    OPENAI_TIMEOUT_SECONDS,
+    OPENAI_TPM,
+    OUTPUT_TOKEN_CAPS,
+    RERANK_ENABLED,
+    RETRIEVAL_BACKEND,
+    STRUCTURED_OUTPUT,
+    VECTOR_MIN_SIMILARITY,
+)
+from m1_busca_documental import adaptive_retrieval, analytics, answer_cache, faq_store, handoff, metrics
+from m1_busca_documental.cache import get_cache
+from m1_busca_documental.chunk_context import build_chunk_context
+from m1_busca_documental.kb_catalog import canonical_path, kb_title, read_kb_text
+from m1_busca_documental.kb_pack import get_kb_pack
+from m1_busca_documental.keyword_router import get_matcher, match_kb
+from m1_busca_documental.local_search import search_local_documents
+from m1_busca_documental.rerank import rerank_documents
+from m1_busca_documental.multi_index import search_indexes
+from m1_busca_documental.model_router import (
+    TIER_LARGE,
+    TIER_SMALL,
+    choose_model_tier,
+    model_for_tier,
+    record_outcome,
 )
+from m1_busca_documental.singleflight import libindexr_flight, llm_flight
 from m1_busca_documental.state import AgentState
+from m1_busca_documental.structured_output import (
+    classification_of,
+    output_cap_for,
+    parse_structured,
+    parse_token_caps,
+    response_format_for,
+    structured_to_text,
+)
+from m1_busca_documental.text_normalization import normalize_query
+from m1_busca_documental.vector_store import get_vector_store
+
+# Scheduler RPM/TPM compartilhado por todas as chamadas à LLM do processo
+_OPENAI_SCHEDULER: Optional[RateLimitScheduler] = None
+_OPENAI_SCHEDULER_LOCK = threading.Lock()
+
+# Circuit breakers do processo: com o circuito aberto as chamadas falham na hora
+# (CircuitOpenError) e os nós seguem pelo modo degradado.
+_LIBINDEXR_BREAKER = CircuitBreaker(
+    "libindexr",
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    slow_call_seconds=LIBINDEXR_SLOW_CALL_SECONDS,
+    reset_timeout=CIRCUIT_RESET_SECONDS,
+)
+_OPENAI_BREAKER = CircuitBreaker(
+    "openai",
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    slow_call_seconds=OPENAI_SLOW_CALL_SECONDS,
+    reset_timeout=CIRCUIT_RESET_SECONDS,
+)
+_LIBINDEXER_CLIENT: Optional[LibIndexer] = None
+_LIBINDEXER_CLIENT_LOCK = threading.Lock()
+_N1_DB: Optional[Any] = None
+_N1_DB_LOCK = threading.Lock()
+
+metrics.register_collector(
+    "circuit_breakers",
+    lambda: {b.name: b.stats() for b in (_LIBINDEXR_BREAKER, _OPENAI_BREAKER)},
+)
+
+
+# ---------------------------------------------------------------------------
+# Nó 0a: lookup_faq — Respostas pré-computadas (faq_store.py)
+# ---------------------------------------------------------------------------
+def lookup_faq(state: AgentState) -> Dict[str, Any]:
+    """
+    Serve a resposta do FAQ pré-computado quando a pergunta normalizada é uma
+    pergunta canônica gerada com o conteúdo atual do KB.
+
+    Entrada (do estado): user_query
+    Saída (atualiza o estado): final_response, is_kb_relevant, kb_id, retrieved_document,
+    faq_question, retrieval_backend="faq" — ou nada, sem resposta válida.
+    """
+    if not FAQ_ENABLED:
+        return {}
+    hit = faq_store.lookup(state.get("user_query") or "")
+    if not hit:
+        return {}
+    return {
+        "final_response": hit["final_response"],
+        "is_kb_relevant": True,
+        "is_suggestion": False,
+        "needs_consultant": False,
+        "kb_id": hit["kb_id"],
+        "retrieved_document": {
+            "kb_id": hit["kb_id"],
+            "doc_title": hit["doc_title"],
+            "doc_path": hit["doc_path"],
+        },
+        "faq_question": hit["question"],
+        "llm_model": hit["llm_model"],
+        "token_usage": None,
+        "retrieval_backend": "faq",
+        "error": None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Nó 0b: route_by_keyword — Roteamento direto (código KB, título ou apelido)
+# ---------------------------------------------------------------------------
+def route_by_keyword(state: AgentState) -> Dict[str, Any]:
+    """
+    Procura na pergunta um código KB, título ou apelido curado (keyword_router.py).
+    Com um acerto confiável, resolve o source_id do KB em n1_chamados e o grafo
+    segue direto para o fetch_local_document, sem chamar o libindexr.
+
+    Entrada (do estado): user_query
+    Saída (atualiza o estado): doc_reference, doc_references, kb_id, keyword_match,
+    retrieval_backend="keyword" — ou nada, se não houver acerto confiável.
+    """
+    user_query = state.get("user_query") or ""
+    if not KEYWORD_ROUTING_ENABLED or not user_query.strip():
+        return {}
+
+    records = _get_n1_db().get_all_data()
+    result = match_kb(user_query, get_matcher(records))
+    if not result["confident"]:
+        metrics.incr("keyword_router", outcome="ambiguous" if result["candidates"] else "miss")
+        return {}
+
+    kb_id = result["kb_id"]
+    source_ids = [str(r["source_id"]) for r in records if r.get("kb_id") == kb_id]
+    if not source_ids:
+        # KB existe na pasta mas não na tabela: fetch_local_document não o resolveria
+        metrics.incr("keyword_router", outcome="unmapped")
+        return {}
+
+    kinds = sorted({m["kind"] for m in result["matches"] if m["kb_id"] == kb_id})
+    metrics.incr("keyword_router", outcome="hit", kind="+".join(kinds))
+    return {
+        "doc_reference": source_ids[0],
+        "doc_references": list(dict.fromkeys(source_ids)),
+        "kb_id": kb_id,
+        "keyword_match": {
+            "kb_id": kb_id,
+            "terms": sorted({m["term"] for m in result["matches"] if m["kb_id"] == kb_id}),
+            "kinds": kinds,
+        },
+        "retrieval_backend": "keyword",
+        "error": None,
+    }
 
 
 # ---------------------------------------------------------------------------
 # Nó 1: call_libindexr — Fase de Identificação (API via integrations/libindexer.py)
 # ---------------------------------------------------------------------------
+def _pooled_session() -> requests.Session:
+    """
+    Sessão HTTP do LibIndexer. O pool por host comporta a busca em vários índices
+    em paralelo (MULTI_INDEX_MAX_WORKERS) sem descartar conexões.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, MULTI_INDEX_MAX_WORKERS))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 def _get_libindexer_client() -> LibIndexer:
     """
     Retorna o cliente LibIndexer de integrations/libindexer.py configurado
     com as variáveis do M1 (LIBINDEXR_BASE_URL, LIBINDEXR_API_KEY).
     Toda chamada à API de busca do M1 passa por este cliente.
+
+    O cliente (e a requests.Session dele, com o pool de conexões) é criado uma
+    vez por processo e compartilhado entre os tickets.
     """
-    return LibIndexer(
-        base_url=LIBINDEXR_BASE_URL.rstrip("/"),
-        api_key=LIBINDEXR_API_KEY or None,
+    global _LIBINDEXER_CLIENT
+    with _LIBINDEXER_CLIENT_LOCK:
+        if _LIBINDEXER_CLIENT is None:
+            _LIBINDEXER_CLIENT = LibIndexer(
+                base_url=LIBINDEXR_BASE_URL.rstrip("/"),
+                api_key=LIBINDEXR_API_KEY or None,
+                timeout=LIBINDEXR_TIMEOUT_SECONDS,
+                breaker=_LIBINDEXR_BREAKER,
+                session=_pooled_session(),
+            )
+    return _LIBINDEXER_CLIENT
+
+
+def _get_n1_db() -> Any:
+    """
+    Instância de N1ChamadosDB (tabela n1_chamados) compartilhada pelo processo.
+    Antes cada nó criava a sua, várias vezes por ticket; com o banco real isso
+    seria uma conexão nova por chamada.
+    """
+    from database.n1_chamados import N1ChamadosDB
+
+    global _N1_DB
+    with _N1_DB_LOCK:
+        if _N1_DB is None:
+            _N1_DB = N1ChamadosDB()
+    return _N1_DB
+
+
+def _query_libindexr(
+    client: LibIndexer,
+    index_id: str,
+    search_query: str,
+    quantity: int,
+    threshold_similarity: float,
+    use_chunk_chain: bool = False,
+    max_chunk_chain_link: int = 0,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Chama LibIndexer.query com coalescência (single-flight): buscas concorrentes
+    com a mesma pergunta normalizada e os mesmos parâmetros compartilham uma
+    única requisição HTTP. Com M1_CACHE_LIBINDEXR_TTL_SECONDS > 0, a resposta
+    fica no cache do M1 (namespace "libindexr") pelo mesmo critério.
+    timeout (opcional) substitui o timeout HTTP do cliente nesta busca.
+    """
+
+    def _do_query() -> Dict[str, Any]:
+        return client.query(
+            index_id=index_id,
+            search_query=search_query,
+            quantity=quantity,
+            threshold_similarity=threshold_similarity,
+            use_chunk_chain=use_chunk_chain,
+            max_chunk_chain_link=max_chunk_chain_link,
+            timeout=timeout,
+        )
+
+    key = (
+        index_id,
+        normalize_query(search_query),
+        quantity,
+        threshold_similarity,
+        use_chunk_chain,
+        max_chunk_chain_link,
     )
+    cache = (
+        get_cache("libindexr", ttl=CACHE_LIBINDEXR_TTL_SECONDS)
+        if CACHE_LIBINDEXR_TTL_SECONDS > 0
+        else None
+    )
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
 
+    response = libindexr_flight.do(key, _do_query) if COALESCING_ENABLED else _do_query()
+    if cache is not None:
+        cache.set(key, response)
+    return response
 
-def call_libindexr(state: AgentState) -> Dict[str, Any]:
+
+def _query_vector_store(search_query: str, quantity: int) -> Dict[str, Any]:
     """
-    Consulta a API libindexr para identificar qual documento contém a resposta.
-    Delega a chamada POST /api/index/search ao cliente em integrations/libindexer.py (LibIndexer.query).
+    Backend "vector" (M1_RETRIEVAL_BACKEND=vector): consulta o índice vetorial local
+    e devolve a resposta no formato do libindexr. O kb_id de cada chunk é convertido
+    no source_id da tabela n1_chamados, que é o que o fetch_local_document espera.
+    """
+    source_ids: Dict[str, str] = {}
+    for record in _get_n1_db().get_all_data():
+        source_ids.setdefault(record["kb_id"], str(record["source_id"]))
+    start = time.perf_counter()
+    response = get_vector_store().query(
+        search_query,
+        quantity=quantity,
+        threshold_similarity=VECTOR_MIN_SIMILARITY,
+        source_ids=source_ids,
+    )
+    metrics.observe("vector_store_query_seconds", time.perf_counter() - start)
+    return response
+
+
+def _configured_index_ids() -> List[str]:
+    """Índices da busca multi-índice (M1_INDEX_IDS); "auto" = todos os de n1_chamados."""
+    if INDEX_IDS.strip().lower() == "auto":
+        ids: List[str] = []
+        for record in _get_n1_db().get_all_data():
+            if record.get("index_id") and record["index_id"] not in ids:
+                ids.append(record["index_id"])
+        return ids
+    return [i.strip() for i in INDEX_IDS.split(",") if i.strip()]
+
+
+def _query_multi_index(
+    client: LibIndexer,
+    index_ids: List[str],
+    search_query: str,
+    quantity: int = DEFAULT_QUANTITY,
+    threshold_similarity: float = DEFAULT_THRESHOLD_SIMILARITY,
+    use_chunk_chain: bool = CHUNK_FAST_PATH,
+) -> Dict[str, Any]:
+    """
+    Consulta todos os índices em paralelo (multi_index.search_indexes), com prazo
+    total MULTI_INDEX_DEADLINE_SECONDS (que vira o timeout HTTP de cada busca),
+    e devolve a resposta combinada.
+    """
+    kb_of_source = {
+        str(r["source_id"]): r["kb_id"] for r in _get_n1_db().get_all_data()
+    }
+    return search_indexes(
+        lambda index_id, timeout: _query_libindexr(
+            client,
+            index_id=index_id,
+            search_query=search_query,
+            quantity=quantity,
+            threshold_similarity=threshold_similarity,
+            use_chunk_chain=use_chunk_chain,
+            max_chunk_chain_link=CHUNK_CHAIN_MAX_LINK if use_chunk_chain else 0,
+            timeout=timeout,
+        ),
+        index_ids,
+        deadline_seconds=MULTI_INDEX_DEADLINE_SECONDS,
+        kb_of_source=kb_of_source,
+    )
 
-    Entrada (do estado): user_query
-    Saída (atualiza o estado): doc_reference, doc_references, api_response, eventualmente error
 
-    A API espera indexId, searchQuery, quantity, thresholdSimilarity. O retorno
-    traz uma lista de chunks/resultados; extraímos a referência do documento
-    (nome do arquivo ou ID) para a fase de recuperação local.
+def _degraded_local_retrieval(user_query: str, reason: str) -> Dict[str, Any]:
     """
-    user_query = state.get("user_query") or ""
-    if not user_query.strip():
+    Modo degradado do call_libindexr (circuito do libindexr aberto): escolhe o KB
+    pela busca lexical local e devolve o source_id dele (via n1_chamados), para que
+    fetch_local_document siga o fluxo normal.
+    """
+    metrics.incr("degraded_requests", stage="retrieval")
+    hits = [
+        h
+        for h in search_local_documents(user_query, DOCS_REPO_PATH)
+        if h["coverage"] >= DEGRADED_MIN_COVERAGE
+    ]
+    records = _get_n1_db().get_by_kb_id(hits[0]["kb_id"]) if hits else []
+    if not records:
         return {
-            "error": "user_query não pode ser vazia.",
+            "error": f"libindexr indisponível ({reason}) e nenhum KB local compatível.",
+            "api_response": None,
             "doc_reference": None,
             "doc_references": None,
+            "degraded": True,
+            "retrieval_backend": "local_lexical",
         }
 
-    client = _get_libindexer_client()
+    return {
+        "api_response": None,
+        "doc_reference": str(records[0]["source_id"]),
+        "doc_references": [str(records[0]["source_id"])],
+        "from_document": None,
+        "best_similarity_score": hits[0]["coverage"],
+        "best_chunks_snippet": None,
+        "error": None,
+        "degraded": True,
+        "retrieval_backend": "local_lexical",
+    }
 
-    try:
-        # POST /api/index/search — método query de integrations/libindexer.py
-        response = client.query(
-            index_id=INDEX_ID
-            or "0211f006-78fe-4df2-9b48-9471b0cbf70e",  # deve ser configurado (M1_INDEX_ID)
-            search_query=user_query,
-            quantity=DEFAULT_QUANTITY,
-            threshold_similarity=DEFAULT_THRESHOLD_SIMILARITY,
-        )
-    except Exception as e:
-        return {
-            "error": f"Erro ao chamar API libindexr: {e!s}",
-            "api_response": None,
-            "doc_reference": None,
-            "doc_references": None,
-        }
 
+def _build_snippet(chunks: list, limit: int = 500) -> Optional[str]:
+    """Concatena o rawContent dos chunks (na ordem recebida) até `limit` caracteres."""
+    parts = []
+    total = 0
+    for ch in chunks:
+        c = ch.get("chunk") if isinstance(ch, dict) else None
+        raw = (c.get("rawContent") or "").strip() if isinstance(c, dict) else ""
+        if raw and total < limit:
+            parts.append(raw[: limit - total])
+            total += len(parts[-1])
+            if total >= limit:
+                break
+    return " ".join(parts).strip()[:limit] if parts else None
+
+
+def _select_by_best_chunk(response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Seleção original: o documento escolhido é o do chunk com maior similarityScore.
+    Retorna doc_reference, doc_references, from_document, best_similarity_score e
+    best_chunks_snippet.
+    """
     # Formato da API: results[] com fromDocument e chunks[] com { chunk, similarityScore }
     # Escolhemos o documento cujo chunk tem o maior similarityScore
     doc_reference = None
@@ -128,30 +473,152 @@ def call_libindexr(state: AgentState) -> Dict[str, Any]:
 
         # Snippet: concatena rawContent dos chunks do melhor resultado (até ~500 chars)
         if best_result_chunks:
-            parts = []
-            total = 0
-            for ch in best_result_chunks:
-                c = ch.get("chunk") if isinstance(ch, dict) else None
-                raw = (c.get("rawContent") or "").strip() if isinstance(c, dict) else ""
-                if raw and total < 500:
-                    parts.append(raw[: 500 - total])
-                    total += len(parts[-1])
-                    if total >= 500:
-                        break
-            if parts:
-                best_chunks_snippet = " ".join(parts).strip()[:500]
+            best_chunks_snippet = _build_snippet(best_result_chunks)
 
     return {
-        "api_response": response,
         "doc_reference": doc_reference,
         "doc_references": doc_references if doc_references else None,
         "from_document": from_document,
         "best_similarity_score": best_similarity_score,
         "best_chunks_snippet": best_chunks_snippet,
+    }
+
+
+def _select_by_rerank(response: Dict[str, Any], user_query: str) -> Dict[str, Any]:
+    """
+    Seleção com re-ranking (rerank.py): agrega todos os chunks por documento
+    (max, média, top-k, sobreposição lexical) e escolhe o melhor score combinado.
+    best_similarity_score continua sendo o maior similarityScore do documento escolhido.
+    """
+    ranking = rerank_documents(response, user_query)
+    if not ranking:
+        return {
+            "doc_reference": None,
+            "doc_references": None,
+            "from_document": None,
+            "best_similarity_score": None,
+            "best_chunks_snippet": None,
+            "document_ranking": None,
+        }
+    best = ranking[0]
+    return {
+        "doc_reference": best["source_id"],
+        "doc_references": [d["source_id"] for d in ranking],
+        "from_document": best["from_document"],
+        "best_similarity_score": best["max"],
+        "best_chunks_snippet": _build_snippet(best["chunks"]),
+        "document_ranking": [
+            {k: v for k, v in d.items() if k != "chunks"} for d in ranking
+        ],
+    }
+
+
+def _select_document(response: Dict[str, Any], user_query: str, backend: str) -> Dict[str, Any]:
+    """Escolhe o documento da resposta (re-ranking ou melhor chunk) e monta a saída do nó."""
+    selection = (
+        _select_by_rerank(response, user_query)
+        if RERANK_ENABLED
+        else _select_by_best_chunk(response)
+    )
+    return {
+        "api_response": response,
+        **selection,
         "error": None,
+        "retrieval_backend": backend,
     }
 
 
+def call_libindexr(state: AgentState) -> Dict[str, Any]:
+    """
+    Consulta a API libindexr para identificar qual documento contém a resposta.
+    Delega a chamada POST /api/index/search ao cliente em integrations/libindexer.py (LibIndexer.query).
+
+    Entrada (do estado): user_query
+    Saída (atualiza o estado): doc_reference, doc_references, api_response, eventualmente error
+
+    A API espera indexId, searchQuery, quantity, thresholdSimilarity. O retorno
+    traz uma lista de chunks/resultados; extraímos a referência do documento
+    (nome do arquivo ou ID) para a fase de recuperação local.
+
+    Com M1_RETRIEVAL_BACKEND=vector a busca vai ao índice vetorial local
+    (vector_store.py) em vez da API, com a mesma resposta e a mesma seleção.
+
+    Com M1_ADAPTIVE_RETRIEVAL=1 a busca no libindexr começa pequena e só se
+    amplia se os scores forem ambíguos (adaptive_retrieval.py); os passos ficam
+    em retrieval_steps.
+    """
+    user_query = state.get("user_query") or ""
+    if not user_query.strip():
+        return {
+            "error": "user_query não pode ser vazia.",
+            "doc_reference": None,
+            "doc_references": None,
+        }
+    if state.get("retrieval_backend") == "keyword":
+        # O KB do roteamento por palavra-chave não respondeu: segunda chance na busca
+        metrics.incr("keyword_router", outcome="fallback")
+
+    if RETRIEVAL_BACKEND == "vector":
+        try:
+            response = _query_vector_store(user_query, DEFAULT_QUANTITY)
+        except Exception as e:
+            return {
+                "error": f"Erro ao consultar o índice vetorial local: {e!s}",
+                "api_response": None,
+                "doc_reference": None,
+                "doc_references": None,
+                "retrieval_backend": "vector",
+            }
+        return _select_document(response, user_query, backend="vector")
+
+    client = _get_libindexer_client()
+    index_ids = _configured_index_ids()
+
+    def _search(quantity: int, threshold: float, chain: bool) -> Dict[str, Any]:
+        if len(index_ids) > 1:
+            # M1_INDEX_IDS: todos os índices em paralelo, respostas combinadas
+            return _query_multi_index(client, index_ids, user_query, quantity, threshold, chain)
+        # POST /api/index/search — método query de integrations/libindexer.py
+        return _query_libindexr(
+            client,
+            index_id=(index_ids[0] if index_ids else INDEX_ID)
+            or "0211f006-78fe-4df2-9b48-9471b0cbf70e",  # deve ser configurado (M1_INDEX_ID)
+            search_query=user_query,
+            quantity=quantity,
+            threshold_similarity=threshold,
+            # Caminho rápido: pede também os chunks vizinhos de cada acerto
+            use_chunk_chain=chain,
+            max_chunk_chain_link=CHUNK_CHAIN_MAX_LINK if chain else 0,
+        )
+
+    steps = None
+    try:
+        if ADAPTIVE_RETRIEVAL_ENABLED:
+            # Com o caminho rápido ligado, todo passo pede a cadeia de chunks: sem
+            # ela o assemble_chunk_context não tem contexto e cai no KB inteiro
+            ladder = [
+                (quantity, threshold, chain or CHUNK_FAST_PATH)
+                for quantity, threshold, chain in adaptive_retrieval.parse_steps()
+            ]
+            response, steps = adaptive_retrieval.search(_search, ladder)
+        else:
+            response = _search(DEFAULT_QUANTITY, DEFAULT_THRESHOLD_SIMILARITY, CHUNK_FAST_PATH)
+    except CircuitOpenError as e:
+        return _degraded_local_retrieval(user_query, str(e))
+    except Exception as e:
+        return {
+            "error": f"Erro ao chamar API libindexr: {e!s}",
+            "api_response": None,
+            "doc_reference": None,
+            "doc_references": None,
+        }
+
+    result = _select_document(response, user_query, backend="libindexr")
+    if steps is not None:
+        result["retrieval_steps"] = steps
+    return result
+
+
 # ---------------------------------------------------------------------------
 # Nó 2: fetch_local_document — Fase de Recuperação Local (Fonte da Verdade)
 # ---------------------------------------------------------------------------
@@ -160,6 +627,8 @@ def _find_local_file(doc_reference: str, docs_path: str) -> Optional[str]:
     Encontra o arquivo .txt no repositório local correspondente à referência.
 
     Estratégias:
+    0) doc_reference é só o código KB → documento canônico do KB (manifest de
+       deduplicação, ver kb_dedup.py), sem depender da ordem da pasta.
     1) doc_reference já é um nome de arquivo (com ou sem extensão) → busca por nome.
     2) Contém um número de KB (ex.: KB0034986) → lista arquivos e filtra pelo KB.
     """
@@ -173,6 +642,12 @@ def _find_local_file(doc_reference: str, docs_path: str) -> Optional[str]:
     # Remove extensão se vier na referência
     base_ref = re.sub(r"\.(txt|pdf)$", "", doc_ref_clean, flags=re.IGNORECASE)
 
+    # 0) Código KB puro → documento canônico
+    if re.fullmatch(r"KB\d+", base_ref, re.IGNORECASE):
+        path = canonical_path(base_ref, docs_path)
+        if path:
+            return path
+
     # 1) Busca exata por nome (com .txt)
     for name in os.listdir(docs_path):
         if not name.endswith(".txt"):
@@ -202,8 +677,6 @@ def fetch_local_document(state: AgentState) -> Dict[str, Any]:
     Entrada (do estado): doc_reference (source_id), doc_references (lista de source_ids)
     Saída (atualiza o estado): raw_text_content, kb_id, eventualmente error
     """
-    from database.n1_chamados import N1ChamadosDB
-
     doc_reference = state.get("doc_reference")
     if not doc_reference:
         return {
@@ -211,7 +684,7 @@ def fetch_local_document(state: AgentState) -> Dict[str, Any]:
         }
 
     # 1. Consulta o "banco de dados" (versão beta) para converter source_id em kb_id
-    db = N1ChamadosDB()
+    db = _get_n1_db()
     records = db.get_by_source_id(str(doc_reference))
 
     if not records:
@@ -228,22 +701,32 @@ def fetch_local_document(state: AgentState) -> Dict[str, Any]:
 
     print(f"Resolvido: source_id {doc_reference} -> kb_id {kb_id}")
 
-    # 2. Busca o arquivo local (.txt) que contém o kb_id no nome
-    file_path = _find_local_file(kb_id, DOCS_REPO_PATH)
-
-    if not file_path or not os.path.isfile(file_path):
-        return {
-            "error": f"Documento local não encontrado para KB: {kb_id} (pasta: {DOCS_REPO_PATH})",
-        }
-
-    # 3. Leitura do conteúdo
-    try:
-        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
-            raw_text_content = f.read()
-    except Exception as e:
-        return {
-            "error": f"Erro ao ler arquivo local {file_path}: {e!s}",
-        }
+    # 2. Com M1_KB_STORE=pack, o texto vem do pack mapeado em memória (kb_pack.py)
+    pack = get_kb_pack() if KB_STORE == "pack" else None
+    pack_entry = pack.entry(str(kb_id).upper()) if pack is not None else None
+    if pack_entry is not None:
+        file_path = os.path.join(DOCS_REPO_PATH, pack_entry["file"])
+        raw_text_content = pack.get_text(str(kb_id).upper()) or ""
+        metrics.incr("kb_store_reads", store="pack")
+    else:
+        if KB_STORE == "pack":
+            metrics.incr("kb_store_reads", store="pack_miss")
+
+        # Busca o arquivo local (.txt) que contém o kb_id no nome
+        file_path = _find_local_file(kb_id, DOCS_REPO_PATH)
+
+        if not file_path or not os.path.isfile(file_path):
+            return {
+                "error": f"Documento local não encontrado para KB: {kb_id} (pasta: {DOCS_REPO_PATH})",
+            }
+
+        # 3. Leitura do conteúdo (em memória se o KB foi pré-carregado, ver prefork.py)
+        try:
+            raw_text_content = read_kb_text(file_path)
+        except Exception as e:
+            return {
+                "error": f"Erro ao ler arquivo local {file_path}: {e!s}",
+            }
 
     # 4. Documento retornado ao usuário (junto com a resposta da LLM)
     doc_title = os.path.splitext(os.path.basename(file_path))[0]
@@ -261,6 +744,49 @@ def fetch_local_document(state: AgentState) -> Dict[str, Any]:
         "raw_text_content": raw_text_content,
         "kb_id": kb_id,
         "retrieved_document": retrieved_document,
+        "context_source": "document",
+        "error": None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Nó 2b: assemble_chunk_context — Caminho rápido (só os chunks do libindexr)
+# ---------------------------------------------------------------------------
+def assemble_chunk_context(state: AgentState) -> Dict[str, Any]:
+    """
+    Monta o contexto do generate_answer com os chunks (e a cadeia de vizinhos) que
+    o libindexr devolveu para o documento escolhido, sem ler o KB inteiro.
+
+    Entrada (do estado): doc_reference, api_response, from_document, best_similarity_score
+    Saída (atualiza o estado): raw_text_content, kb_id, retrieved_document,
+    context_source="chunks". Se os chunks não formam contexto suficiente
+    (menos de CHUNK_CONTEXT_MIN_CHARS) ou o source_id não está em n1_chamados,
+    retorna context_source=None e o grafo segue para o fetch_local_document.
+    """
+    doc_reference = state.get("doc_reference")
+    context = build_chunk_context(state.get("api_response") or {}, str(doc_reference or ""))
+    records = _get_n1_db().get_by_source_id(str(doc_reference)) if doc_reference else []
+    kb_id = records[0].get("kb_id") if records else None
+    if len(context) < CHUNK_CONTEXT_MIN_CHARS or not kb_id:
+        metrics.incr("chunk_fast_path", outcome="skipped")
+        return {"context_source": None}
+
+    # Caminho do KB canônico pela listagem cacheada da pasta (sem ler o arquivo)
+    path = canonical_path(kb_id, DOCS_REPO_PATH)
+    retrieved_document = {
+        "kb_id": kb_id,
+        "doc_title": kb_title(path) if path else state.get("from_document"),
+        "doc_path": path,
+        "source_id": str(doc_reference),
+        "from_document": state.get("from_document"),
+        "similarity_score": state.get("best_similarity_score"),
+        "snippet": state.get("best_chunks_snippet"),
+    }
+    return {
+        "raw_text_content": context,
+        "kb_id": kb_id,
+        "retrieved_document": retrieved_document,
+        "context_source": "chunks",
         "error": None,
     }
 
@@ -268,8 +794,14 @@ def fetch_local_document(state: AgentState) -> Dict[str, Any]:
 # ---------------------------------------------------------------------------
 # Nó 3: generate_answer — Fase de Síntese (LLM)
 # ---------------------------------------------------------------------------
+_PROMPT_CACHE: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
 def _load_generate_answer_prompt(version: str = "v3") -> Dict[str, Any]:
-    """Carrega o prompt do agente generate_answer a partir de Agents/generate_answer_{version}.yaml."""
+    """
+    Carrega o prompt do agente generate_answer a partir de Agents/generate_answer_{version}.yaml.
+    O YAML é parseado uma vez por processo e relido só quando o mtime do arquivo muda.
+    """
     import yaml
 
     agents_dir = Path(__file__).resolve().parent / "Agents"
@@ -280,21 +812,41 @@ def _load_generate_answer_prompt(version: str = "v3") -> Dict[str, Any]:
 
     if not prompt_path.is_file():
         raise FileNotFoundError(f"Prompt não encontrado: {prompt_path}")
+    mtime = prompt_path.stat().st_mtime
+    cached = _PROMPT_CACHE.get(str(prompt_path))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
     with open(prompt_path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        prompt_config = yaml.safe_load(f)
+    _PROMPT_CACHE[str(prompt_path)] = (mtime, prompt_config)
+    return prompt_config
+
+
+# Limites de tokens de saída por classificação (M1_OUTPUT_TOKEN_CAPS)
+_OUTPUT_CAPS = parse_token_caps(OUTPUT_TOKEN_CAPS)
+
+_CLASSIFICATION_RE = re.compile(
+    r"CLASSIFICACAO:\s*(RELEVANTE|IRRELEVANTE|INSUFICIENTE)", re.IGNORECASE
+)
+
+
+def _is_insufficient(content: str) -> bool:
+    """True se a LLM classificou os trechos (caminho rápido) como INSUFICIENTE."""
+    match = _CLASSIFICATION_RE.search(content or "")
+    return bool(match) and match.group(1).upper() == "INSUFICIENTE"
 
 
 def _parse_llm_response(content: str) -> Tuple[bool, str]:
     """
-    Extrai a classificação (RELEVANTE/IRRELEVANTE) e limpa o texto da resposta.
+    Extrai a classificação (RELEVANTE/IRRELEVANTE; INSUFICIENTE no prompt de
+    trechos, tratada como não relevante) e limpa o texto da resposta.
+    RELEVANTE sem texto (saída cortada logo após a classificação) não é relevante.
     Esperado: 'CLASSIFICACAO: RELEVANTE\n\nResposta...'
     """
     is_relevant = True
     clean_content = content.strip()
 
-    match = re.search(
-        r"CLASSIFICACAO:\s*(RELEVANTE|IRRELEVANTE)", clean_content, re.IGNORECASE
-    )
+    match = _CLASSIFICATION_RE.search(clean_content)
     if match:
         label = match.group(1).upper()
         is_relevant = label == "RELEVANTE"
@@ -302,11 +854,44 @@ def _parse_llm_response(content: str) -> Tuple[bool, str]:
         clean_content = re.sub(
             r"CLASSIFICACAO:.*?\n+", "", clean_content, flags=re.IGNORECASE
         ).strip()
+        if _CLASSIFICATION_RE.search(clean_content):
+            # Só a linha da classificação, sem quebra depois dela
+            clean_content = ""
+        is_relevant = is_relevant and bool(clean_content)
 
     return is_relevant, clean_content
 
 
-def _call_llm_for_answer(state: AgentState) -> Tuple[str, Optional[Dict[str, int]]]:
+def _is_well_formed_response(content: str) -> bool:
+    """
+    Verifica se a saída da LLM segue o formato do prompt v3: linha
+    'CLASSIFICACAO: RELEVANTE|IRRELEVANTE' seguida de uma resposta não vazia.
+    Usado para decidir o escalonamento do modelo menor para o maior.
+    """
+    if not content or not _CLASSIFICATION_RE.search(content):
+        return False
+    _, clean_content = _parse_llm_response(content)
+    return bool(clean_content)
+
+
+def _get_openai_scheduler() -> Optional[RateLimitScheduler]:
+    """
+    Scheduler RPM/TPM único do processo (integrations/rate_limiter.py), criado na
+    primeira chamada. Retorna None se M1_OPENAI_RPM e M1_OPENAI_TPM forem 0.
+    """
+    global _OPENAI_SCHEDULER
+    if not (OPENAI_RPM or OPENAI_TPM):
+        return None
+    with _OPENAI_SCHEDULER_LOCK:
+        if _OPENAI_SCHEDULER is None:
+            _OPENAI_SCHEDULER = RateLimitScheduler(rpm=OPENAI_RPM, tpm=OPENAI_TPM)
+            metrics.register_collector("openai_rate_limiter", _OPENAI_SCHEDULER.stats)
+    return _OPENAI_SCHEDULER
+
+
+def _call_llm_for_answer(
+    state: AgentState, model: Optional[str] = None
+) -> Tuple[str, Optional[Dict[str, int]]]:
     """Faz a chamada à LLM usando o prompt v3 que inclui classificação."""
     from m1_busca_documental.config import OPENAI_API_KEY, LLM_MODEL
     from integrations.openai import OpenAIIntegration
@@ -314,7 +899,11 @@ def _call_llm_for_answer(state: AgentState) -> Tuple[str, Optional[Dict[str, int
     user_query = (state.get("user_query") or "").strip()
     raw_text_content = state.get("raw_text_content") or ""
 
-    prompt_config = _load_generate_answer_prompt("v3")
+    # Caminho rápido: prompt próprio para trechos, com a classificação INSUFICIENTE
+    prompt_version = "v4_json" if STRUCTURED_OUTPUT else "v3"
+    if state.get("context_source") == "chunks":
+        prompt_version += "_chunks"
+    prompt_config = _load_generate_answer_prompt(prompt_version)
     system_prompt = (prompt_config.get("system_prompt") or "").strip()
     user_template = (prompt_config.get("user_prompt_template") or "").strip()
     max_chars = int(prompt_config.get("max_context_chars") or 120000)
@@ -326,19 +915,145 @@ def _call_llm_for_answer(state: AgentState) -> Tuple[str, Optional[Dict[str, int
 
     client = OpenAIIntegration(
         api_key=OPENAI_API_KEY,
-        model=LLM_MODEL,
+        model=model or LLM_MODEL,
         temperature=0,
+        scheduler=_get_openai_scheduler(),
+        priority=state.get("priority") or PRIORITY_INTERACTIVE,
+        expected_output_tokens=OPENAI_EXPECTED_OUTPUT_TOKENS,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        breaker=_OPENAI_BREAKER,
     )
-    return client.invoke(system_prompt=system_prompt, user_prompt=user_prompt)
+
+    response_format = response_format_for(prompt_config) if STRUCTURED_OUTPUT else None
+
+    def _do_invoke() -> Tuple[str, Optional[Dict[str, int]]]:
+        content, usage = client.invoke(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            max_tokens=max(_OUTPUT_CAPS.values()) if _OUTPUT_CAPS else None,
+            stop=LLM_STOP_SEQUENCES or None,
+            response_format=response_format,
+            output_cap=output_cap_for(_OUTPUT_CAPS),
+        )
+        if response_format is None:
+            return content, usage
+        # Saída JSON → formato de texto do v3 (o resto do generate_answer não muda)
+        parsed = parse_structured(content)
+        if parsed is None:
+            metrics.incr("structured_output", outcome="unparsed")
+            return content, usage
+        metrics.incr("structured_output", outcome="json" if parsed["complete"] else "salvaged")
+        return structured_to_text(parsed), usage
+
+    if not COALESCING_ENABLED:
+        return _do_invoke()
+    # Mesma pergunta normalizada + mesmo contexto + mesmo modelo → uma única chamada
+    context_hash = hashlib.sha1(
+        (system_prompt + "\n" + raw_slice).encode("utf-8", errors="replace")
+    ).hexdigest()
+    key = (client.model, context_hash, normalize_query(user_query))
+    return llm_flight.do(key, _do_invoke)
+
+
+def _sum_token_usage(
+    first: Optional[Dict[str, int]], second: Optional[Dict[str, int]]
+) -> Optional[Dict[str, int]]:
+    """
+    Soma dois dicionários de uso de tokens (escalonamento para o modelo maior e
+    execuções repetidas do generate_answer no mesmo ticket).
+    """
+    if not first:
+        return second
+    if not second:
+        return first
+    return {k: int(first.get(k, 0)) + int(second.get(k, 0)) for k in set(first) | set(second)}
+
+
+def _call_llm_with_accounting(
+    state: AgentState, tier: str
+) -> Tuple[str, Optional[Dict[str, int]]]:
+    """
+    Chama a LLM com o modelo do tier e contabiliza latência e tokens por tier
+    (métricas llm_calls, llm_errors, llm_latency_seconds, llm_input_tokens, llm_output_tokens)
+    e por classificação (llm_generation_seconds, llm_output_tokens_by_classification,
+    llm_output_capped).
+    """
+    model = model_for_tier(tier)
+    metrics.incr("llm_calls", tier=tier, model=model)
+    start = time.perf_counter()
+    try:
+        raw_response, token_usage = _call_llm_for_answer(state, model=model)
+    except Exception:
+        metrics.incr("llm_errors", tier=tier, model=model)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("llm_latency_seconds", elapsed, tier=tier)
+    classification = (classification_of(raw_response) or "none").lower()
+    metrics.observe("llm_generation_seconds", elapsed, classification=classification)
+    if token_usage:
+        output_tokens = token_usage.get("output_tokens", 0)
+        metrics.observe("llm_input_tokens", token_usage.get("input_tokens", 0), tier=tier)
+        metrics.observe("llm_output_tokens", output_tokens, tier=tier)
+        metrics.observe(
+            "llm_output_tokens_by_classification", output_tokens, classification=classification
+        )
+        cap = _OUTPUT_CAPS.get(classification.upper())
+        if cap and output_tokens >= cap:
+            metrics.incr("llm_output_capped", classification=classification)
+    return raw_response, token_usage
+
+
+def _degraded_answer(
+    state: AgentState, reason: str, spent: Optional[Dict[str, int]] = None
+) -> Dict[str, Any]:
+    """
+    Modo degradado do generate_answer (circuito da OpenAI aberto): devolve a
+    resposta em cache para o mesmo KB + pergunta, se houver; senão encaminha
+    o chamado imediatamente ao atendente. spent é o uso de tokens já pago
+    neste nó (o modelo menor, antes de escalar), somado ao token_usage do estado.
+    """
+    metrics.incr("degraded_requests", stage="generation")
+    token_usage = _sum_token_usage(state.get("token_usage"), spent)
+    cached = answer_cache.get_answer(state.get("kb_id") or "", state.get("user_query") or "")
+    if cached:
+        metrics.incr("degraded_cache_hits")
+        is_relevant = bool(cached.get("is_kb_relevant"))
+        return {
+            "final_response": cached.get("final_response"),
+            "is_kb_relevant": is_relevant,
+            "is_suggestion": not is_relevant,
+            "needs_consultant": not is_relevant,
+            "retrieved_document": state.get("retrieved_document"),
+            "token_usage": token_usage,
+            "degraded": True,
+            "chunk_context_insufficient": False,
+        }
+    return {
+        "final_response": (
+            "O serviço de IA está temporariamente indisponível. "
+            "Seu chamado foi encaminhado a um atendente."
+        ),
+        "is_kb_relevant": False,
+        "is_suggestion": False,
+        "needs_consultant": True,
+        "retrieved_document": state.get("retrieved_document"),
+        "token_usage": token_usage,
+        "degraded": True,
+        "error": reason,
+        "chunk_context_insufficient": False,
+    }
 
 
 def generate_answer(state: AgentState) -> Dict[str, Any]:
     """
-    Gera a resposta final usando a LLM (GPT-4o).
+    Gera a resposta final usando a LLM (GPT-4o ou o modelo menor, ver model_router.py).
     Agora avalia se o KB é coerente; se não for, gera uma sugestão e sinaliza para consultor.
 
-    Entrada (do estado): user_query, raw_text_content
-    Saída (atualiza o estado): final_response, is_kb_relevant, is_suggestion, needs_consultant
+    Entrada (do estado): user_query, raw_text_content, best_similarity_score, kb_id, context_source
+    Saída (atualiza o estado): final_response, is_kb_relevant, is_suggestion, needs_consultant,
+    model_tier, llm_model, model_escalated, chunk_context_insufficient, error (falha da LLM)
+    e token_usage (acumulado no ticket)
     """
     from m1_busca_documental.config import OPENAI_API_KEY
 
@@ -350,6 +1065,7 @@ def generate_answer(state: AgentState) -> Dict[str, Any]:
             "final_response": f"Não foi possível processar a solicitação: {err}",
             "is_kb_relevant": False,
             "needs_consultant": True,
+            "chunk_context_insufficient": False,
         }
 
     if not state.get("raw_text_content"):
@@ -358,35 +1074,86 @@ def generate_answer(state: AgentState) -> Dict[str, Any]:
             "is_kb_relevant": False,
             "is_suggestion": True,
             "needs_consultant": True,
+            "chunk_context_insufficient": False,
         }
 
     if not OPENAI_API_KEY:
         return {
             "final_response": "[Configuração] API Key ausente.",
             "error": "API Key ausente.",
+            "chunk_context_insufficient": False,
         }
 
-    try:
-        # 1. Chamada à LLM (delegada para função interna)
-        raw_response, token_usage = _call_llm_for_answer(state)
+    # 1. Escolha do modelo (tier) a partir dos sinais do estado
+    route = choose_model_tier(state)
+    tier = route["tier"]
+    llm_model = route["model"]
+    escalated = False
+    from_chunks = state.get("context_source") == "chunks"
+    chunk_insufficient = False
+    error: Optional[str] = None
+    # Uso já pago neste nó: sobrevive a uma falha do modelo maior depois de escalar
+    token_usage: Optional[Dict[str, int]] = None
 
-        # 2. Parse da resposta (delegada para função interna)
+    try:
+        # 2. Chamada à LLM (delegada para função interna)
+        raw_response, token_usage = _call_llm_with_accounting(state, tier)
+
+        # 3. Modelo menor com saída fora do formato → escala para o modelo maior
+        if tier == TIER_SMALL and not _is_well_formed_response(raw_response):
+            escalated = True
+            metrics.incr("llm_escalations", from_tier=TIER_SMALL, to_tier=TIER_LARGE)
+            tier = TIER_LARGE
+            llm_model = model_for_tier(TIER_LARGE)
+            raw_response, large_usage = _call_llm_with_accounting(state, tier)
+            token_usage = _sum_token_usage(token_usage, large_usage)
+        if route["tier"] == TIER_SMALL:
+            record_outcome(state.get("kb_id") or "", escalated)
+
+        # 4. Parse da resposta (delegada para função interna)
         is_relevant, final_response = _parse_llm_response(raw_response)
 
+        # Caminho rápido: trechos INSUFICIENTE → o grafo lê o KB inteiro e tenta de novo
+        if from_chunks:
+            chunk_insufficient = _is_insufficient(raw_response)
+            outcome = (
+                "insufficient"
+                if chunk_insufficient
+                else ("answered" if is_relevant else "irrelevant")
+            )
+            metrics.incr("chunk_fast_path", outcome=outcome)
+
+        # Guarda a resposta para o modo degradado (circuito da OpenAI aberto)
+        if not chunk_insufficient:
+            answer_cache.put_answer(
+                state.get("kb_id") or "",
+                state.get("user_query") or "",
+                {"final_response": final_response, "is_kb_relevant": is_relevant},
+            )
+
+    except CircuitOpenError as e:
+        return _degraded_answer(state, str(e), token_usage)
     except Exception as e:
         final_response = f"Erro ao gerar resposta com a LLM: {e!s}"
-        token_usage = None
         is_relevant = False
+        error = final_response
 
-    # 3. Retorno do estado com as novas flags de controle
+    # 5. Retorno do estado com as novas flags de controle
     return {
         "final_response": final_response,
         "is_kb_relevant": is_relevant,
         "is_suggestion": not is_relevant,
         "needs_consultant": not is_relevant,  # Se não for relevante, vai para o consultor
         "retrieved_document": state.get("retrieved_document"),
-        "token_usage": token_usage,
+        # Soma com as execuções anteriores do nó no mesmo ticket (trechos
+        # INSUFICIENTE → KB inteiro, roteamento por palavra-chave → busca)
+        "token_usage": _sum_token_usage(state.get("token_usage"), token_usage),
         "doc_path": doc_path,
+        "model_tier": tier,
+        "llm_model": llm_model,
+        "model_escalated": escalated,
+        "chunk_context_insufficient": chunk_insufficient,
+        "error": error,
     }
 
 
@@ -396,9 +1163,14 @@ def generate_answer(state: AgentState) -> Dict[str, Any]:
 def forward_to_user(state: AgentState) -> Dict[str, Any]:
     """
     Nó acionado quando a resposta foi encontrada no KB com sucesso.
-    Pode ser usado para logs, métricas ou integrações de saída direta.
+    Com M1_HANDOFF=1, enfileira a resposta para entrega ao sistema de chamados
+    (handoff.py); a entrega é feita em lote, fora do grafo. Com M1_ANALYTICS=1,
+    grava o registro de custo do ticket (analytics.py).
     """
     print(">>> Fluxo: Encaminhando resposta do KB para o usuário.")
+    if HANDOFF_ENABLED:
+        handoff.enqueue_result({**state, "status": "forwarded_to_user"}, "user")
+    analytics.record_run({**state, "status": "forwarded_to_user"})
     return {"status": "forwarded_to_user"}
 
 
@@ -408,7 +1180,11 @@ def forward_to_user(state: AgentState) -> Dict[str, Any]:
 def forward_to_attendant(state: AgentState) -> Dict[str, Any]:
     """
     Nó acionado quando a pergunta não foi respondida pelo KB.
-    Encaminha para um consultor/atendente humano.
+    Encaminha para um consultor/atendente humano (com M1_HANDOFF=1, pela fila
+    de hand-off, como o forward_to_user).
     """
     print(">>> Fluxo: Pergunta sem resposta no KB. Encaminhando para atendente.")
+    if HANDOFF_ENABLED:
+        handoff.enqueue_result({**state, "status": "forwarded_to_attendant"}, "attendant")
+    analytics.record_run({**state, "status": "forwarded_to_attendant"})
     return {"status": "forwarded_to_attendant"}
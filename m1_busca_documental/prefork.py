@@ -0,0 +1,348 @@
+"""
+Runner multiprocesso (pre-fork) — Módulo M1 N1 Chamados
+
+Um processo Python só usa um núcleo para o trabalho de CPU dos nós (parse de
+JSON, regex, normalização, tokenização) por causa do GIL. Este runner carrega
+uma vez, no processo pai, tudo o que é somente leitura:
+
+- a tabela n1_chamados (_get_n1_db) e o autômato do roteamento por palavra-chave;
+- a listagem dos KBs e o texto de todos os .txt (kb_catalog.preload_texts), ou
+  o mmap do pack de KBs com M1_KB_STORE=pack (kb_pack.py);
+- os prompts YAML do generate_answer e o grafo compilado;
+
+e então cria N filhos com fork(). Os filhos enxergam esses objetos sem copiá-los
+(copy-on-write). Antes do fork, gc.freeze() move os objetos já existentes para
+a geração permanente do coletor, que deixa de percorrê-los — senão a coleta
+nos filhos tocaria (e copiaria) as páginas compartilhadas.
+
+O despachante fala com cada worker por um Pipe próprio e mantém no máximo 2
+tickets com cada um (o menos ocupado recebe o próximo, o que equilibra a
+carga). Como sabe quais tickets estão com cada worker, o pai não trava se um
+filho morrer (OOM, segfault): ele espera ao mesmo tempo pelos pipes e pelos
+sentinels dos processos (multiprocessing.connection.wait). O ticket que estava
+rodando no worker morto sai com erro (repeti-lo poderia derrubar outro
+worker), os que esperavam vão para os outros, e um worker novo toma o lugar do
+morto. O worker escreve o resultado direto no pipe (sem a thread de envio de
+uma Queue), então um resultado já enviado não se perde se ele morrer logo
+depois.
+
+Ao terminar, cada worker envia o seu metrics.snapshot(), e o pai devolve as
+métricas agregadas (metrics.merge_snapshots); as de um worker morto se perdem.
+
+Requer o método de início "fork" (Linux/macOS). O pai não deve ter threads de
+trabalho ativas no momento do fork; por isso o pré-carregamento não chama a LLM
+nem o libindexr.
+
+Uso:
+  python -m m1_busca_documental.prefork tickets.jsonl --workers 8 --output resultados.jsonl
+  python -m m1_busca_documental.prefork tickets.jsonl --metrics metricas.json
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import analytics, metrics, nodes
+from m1_busca_documental.batch import RESULT_FIELDS, read_tickets
+from m1_busca_documental.config import KB_STORE, KEYWORD_ROUTING_ENABLED, PREFORK_WORKERS
+from m1_busca_documental.graph import invoke_coalesced, rag_graph
+from m1_busca_documental.kb_catalog import list_kb_files, preload_texts
+from m1_busca_documental.kb_pack import get_kb_pack
+from m1_busca_documental.keyword_router import get_matcher
+
+# Mensagens dos workers para o pai: (tipo, worker_id, dados)
+_MSG_RESULT = "result"
+_MSG_METRICS = "metrics"
+
+# Tickets enviados a cada worker e ainda sem resultado
+_MAX_OUTSTANDING = 2
+# Espera máxima por resultado antes de reconferir os workers
+_POLL_SECONDS = 1.0
+
+
+def preload() -> Dict[str, Any]:
+    """
+    Carrega no processo atual os dados somente leitura compartilhados com os
+    workers e congela o coletor de lixo. Retorna um resumo do que foi carregado.
+    """
+    start = time.perf_counter()
+    records = nodes._get_n1_db().get_all_data()
+    kb_files = list_kb_files()
+    pack = get_kb_pack() if KB_STORE == "pack" else None
+    if pack is not None:
+        # O mmap do pack é herdado pelos filhos; não há texto a copiar para o heap
+        text_bytes = pack.stats()["text_bytes"]
+    else:
+        text_bytes = preload_texts()
+    if KEYWORD_ROUTING_ENABLED:
+        get_matcher(records)
+    for version in ("v3", "v3_chunks", "v4_json", "v4_json_chunks"):
+        nodes._load_generate_answer_prompt(version)
+    gc.collect()
+    gc.freeze()
+    return {
+        "n1_records": len(records),
+        "kbs": len(kb_files),
+        "text_bytes": text_bytes,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def _result_row(ticket: Dict[str, Any], result: Dict[str, Any], worker_id: int) -> Dict[str, Any]:
+    row = {k: result.get(k) for k in RESULT_FIELDS}
+    row["ticket_id"] = str(ticket.get("ticket_id"))
+    row["worker"] = worker_id
+    return row
+
+
+def _worker_main(worker_id: int, conn: Any) -> None:
+    """Laço do worker: executa tickets (seq, ticket) recebidos no pipe até receber None."""
+    # Os contadores herdados do pai já são contados por ele
+    metrics.reset()
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        seq, ticket = task
+        state = {
+            "ticket_id": str(ticket["ticket_id"]),
+            "user_query": ticket.get("user_query") or "",
+            "priority": ticket.get("priority") or "batch",
+        }
+        try:
+            result = invoke_coalesced(state, rag_graph)
+        except Exception as e:
+            metrics.incr("prefork_ticket_errors")
+            result = {"user_query": state["user_query"], "error": f"{type(e).__name__}: {e!s}"}
+        conn.send((_MSG_RESULT, (seq, _result_row(ticket, result, worker_id))))
+    # O filho sai com os._exit (sem atexit): grava os registros de analytics pendentes
+    analytics.flush()
+    conn.send((_MSG_METRICS, metrics.snapshot()))
+
+
+class PreforkRunner:
+    """
+    Processo pai: pré-carrega os dados, cria os workers e distribui os tickets.
+
+    Uso:
+        runner = PreforkRunner(workers=8)
+        for row in runner.run(tickets):
+            ...
+        runner.metrics  # métricas agregadas dos workers
+    """
+
+    def __init__(self, workers: int = PREFORK_WORKERS):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("O runner pre-fork requer o método de início 'fork'.")
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.preloaded: Dict[str, Any] = {}
+        self.metrics: Dict[str, Any] = {}
+        self.worker_metrics: Dict[str, Dict[str, Any]] = {}
+
+    def run(self, tickets: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Executa os tickets nos workers e produz uma linha por ticket (na ordem
+        em que terminam). A leitura dos tickets é preguiçosa: cada worker tem no
+        máximo _MAX_OUTSTANDING tickets enviados e ainda sem resultado.
+        """
+        self.preloaded = preload()
+        self._ctx = multiprocessing.get_context("fork")
+        self._procs: List[Any] = []
+        self._conns: List[Any] = []
+        # worker_id -> {seq: ticket} ainda sem resultado (o menor seq é o que está rodando)
+        self._outstanding: List[Dict[int, Dict[str, Any]]] = []
+        self._retry: Deque[Dict[str, Any]] = deque()
+        self._idle_deaths = 0
+        for i in range(self.workers):
+            self._procs.append(None)
+            self._conns.append(None)
+            self._outstanding.append({})
+            self._spawn(i)
+
+        seq = 0
+        finished: set = set()
+        self.worker_metrics = {}
+        source = iter(tickets)
+        try:
+            while True:
+                # Tickets de um worker morto vão à frente dos novos
+                ticket = self._retry.popleft() if self._retry else next(source, None)
+                if ticket is None:
+                    if not any(self._outstanding):
+                        break
+                    yield from self._receive(finished)
+                    continue
+                # Todos ocupados: esvazia resultados (e detecta mortes) antes de enviar
+                worker_id = self._least_busy()
+                while worker_id is None:
+                    yield from self._receive(finished)
+                    worker_id = self._least_busy()
+                seq += 1
+                self._outstanding[worker_id][seq] = ticket
+                self._send(worker_id, (seq, ticket))
+            for worker_id in range(len(self._procs)):
+                self._send(worker_id, None)
+            while len(finished) < len(self._procs):
+                yield from self._receive(finished, closing=True)
+        finally:
+            for proc, conn in zip(self._procs, self._conns):
+                proc.join(timeout=5)
+                if proc.is_alive():
+                    proc.terminate()
+                conn.close()
+            self.metrics = metrics.merge_snapshots(self.worker_metrics)
+
+    def _spawn(self, worker_id: int) -> None:
+        """Cria (ou recria, no lugar de um morto) o worker worker_id com um pipe novo."""
+        conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, child_conn),
+            name=f"m1-prefork-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        child_conn.close()
+        self._procs[worker_id] = proc
+        self._conns[worker_id] = conn
+
+    def _send(self, worker_id: int, task: Any) -> None:
+        try:
+            self._conns[worker_id].send(task)
+        except (BrokenPipeError, OSError):
+            pass  # worker já morto: _reap trata os tickets pendentes dele
+
+    def _least_busy(self) -> Optional[int]:
+        """Worker com menos tickets pendentes, ou None se todos estão no limite."""
+        worker_id = min(range(len(self._procs)), key=lambda i: len(self._outstanding[i]))
+        if len(self._outstanding[worker_id]) >= _MAX_OUTSTANDING:
+            return None
+        return worker_id
+
+    def _receive(self, finished: set, closing: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Espera (até _POLL_SECONDS) por resultados ou pela morte de um worker e
+        produz as linhas prontas. Os tickets de um worker morto viram erro (o que
+        rodava) ou voltam à fila (self._retry); com closing=True, um worker morto
+        só conta como encerrado.
+        """
+        active = [i for i in range(len(self._procs)) if i not in finished]
+        ready = wait(
+            [self._conns[i] for i in active] + [self._procs[i].sentinel for i in active],
+            timeout=_POLL_SECONDS,
+        )
+        if not ready:
+            return
+        for worker_id in active:
+            yield from self._drain(worker_id, finished)
+        yield from self._reap(finished, closing)
+
+    def _drain(self, worker_id: int, finished: set) -> Iterator[Dict[str, Any]]:
+        """Lê tudo o que o worker já escreveu no pipe (inclusive antes de morrer)."""
+        conn = self._conns[worker_id]
+        try:
+            while worker_id not in finished and conn.poll():
+                kind, data = conn.recv()
+                if kind == _MSG_METRICS:
+                    self.worker_metrics[f"worker-{worker_id}"] = data
+                    finished.add(worker_id)
+                    continue
+                seq, row = data
+                self._outstanding[worker_id].pop(seq, None)
+                yield row
+        except (EOFError, OSError):
+            pass  # pipe fechado: o worker morreu e _reap cuida dele
+
+    def _reap(self, finished: set, closing: bool) -> Iterator[Dict[str, Any]]:
+        """Trata os workers mortos: erro no ticket em curso, reenvio do resto e recriação."""
+        for worker_id, proc in enumerate(self._procs):
+            if worker_id in finished or proc.exitcode is None:
+                continue
+            self._conns[worker_id].close()
+            metrics.incr("prefork_worker_deaths")
+            print(f"Worker {worker_id} morreu (exitcode {proc.exitcode}).")
+            if closing:
+                finished.add(worker_id)
+                continue
+            outstanding = self._outstanding[worker_id]
+            self._outstanding[worker_id] = {}
+            if outstanding:
+                running = min(outstanding)
+                ticket = outstanding.pop(running)
+                metrics.incr("prefork_ticket_errors")
+                row = _result_row(
+                    ticket,
+                    {
+                        "user_query": ticket.get("user_query") or "",
+                        "error": f"Worker morreu durante o ticket (exitcode {proc.exitcode}).",
+                    },
+                    worker_id,
+                )
+                self._retry.extend(outstanding[s] for s in sorted(outstanding))
+                yield row
+            else:
+                # Morreu sem ticket: limita as recriações para não girar em falso
+                self._idle_deaths += 1
+                if self._idle_deaths > len(self._procs):
+                    raise RuntimeError("Workers do pre-fork morrendo sem processar tickets.")
+            self._spawn(worker_id)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Runner multiprocesso (pre-fork) do M1.")
+    parser.add_argument("tickets", help="Arquivo JSONL com ticket_id e user_query por linha.")
+    parser.add_argument(
+        "--workers", type=int, default=PREFORK_WORKERS, help="Processos (0 = um por CPU)."
+    )
+    parser.add_argument("--output", help="Arquivo JSONL para gravar os resultados.")
+    parser.add_argument("--metrics", help="Arquivo JSON para gravar as métricas agregadas.")
+    args = parser.parse_args(argv)
+
+    runner = PreforkRunner(workers=args.workers)
+    start = time.perf_counter()
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    total = errors = 0
+    try:
+        for row in runner.run(read_tickets(args.tickets)):
+            total += 1
+            errors += bool(row.get("error"))
+            print(f"[worker {row['worker']}] ticket {row['ticket_id']}: {row.get('status')}")
+            if out is not None:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+    finally:
+        if out is not None:
+            out.close()
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"\nPré-carregado: {runner.preloaded.get('kbs')} KBs, "
+        f"{runner.preloaded.get('text_bytes', 0) / 1e6:.1f} MB de texto, "
+        f"{runner.preloaded.get('n1_records')} registros n1_chamados"
+    )
+    print(
+        f"Total: {total} | erros: {errors} | workers: {runner.workers} | "
+        f"{elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} tickets/s)"
+    )
+    if args.output:
+        print("Resultados gravados em:", args.output)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            json.dump(runner.metrics, f, ensure_ascii=False, indent=2)
+        print("Métricas agregadas gravadas em:", args.metrics)
+
+
+if __name__ == "__main__":
+    main()
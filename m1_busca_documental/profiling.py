@@ -0,0 +1,330 @@
+"""
+Profiling por ticket — Módulo M1 N1 Chamados
+
+Quando um ticket demora, queremos saber onde: carga do YAML do prompt,
+tokenização, parse do api_response, rede... Este módulo permite rodar tickets
+selecionados sob um profiler, com o tempo atribuído aos nós do grafo.
+
+Ativação:
+- M1_PROFILE=sample|cprofile liga o profiling; M1_PROFILE_RATE (0..1) é a
+  fração de tickets perfilados (ex.: 0.01 para deixar ligado em produção);
+- um ticket com "profile": true no estado (ou no corpo do POST /tickets) é
+  sempre perfilado, com o modo de M1_PROFILE ou "sample" se estiver desligado.
+
+Modos:
+- sample: uma thread amostra as pilhas das threads que estão executando nós
+  (sys._current_frames) a cada M1_PROFILE_INTERVAL_MS. Custo baixo e
+  independente do número de chamadas de função;
+- cprofile: cProfile ligado durante cada nó (só na thread do nó). Exato, mas
+  com overhead alto; útil para investigar um ticket específico.
+
+Saída (M1_PROFILE_DIR), por ticket perfilado:
+- <ticket>.collapsed   pilhas no formato "no;modulo:funcao;... contagem" (modo
+                       sample), pronto para flamegraph.pl ou speedscope;
+- <ticket>.prof        estatísticas pstats (modo cprofile);
+- <ticket>.summary.json  tempo de parede, nº de execuções e amostras por nó,
+                       e as funções mais frequentes de cada nó.
+
+Independente do profiling, todo nó instrumentado é um ponto de preempção do
+scheduler.py, registra a métrica node_seconds{node=...} e, com M1_ANALYTICS=1,
+soma tempo, tokens e acertos de cache do nó em run_stats no estado
+(analytics.py).
+"""
+
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from m1_busca_documental import analytics, metrics, scheduler
+from m1_busca_documental.config import (
+    ANALYTICS_ENABLED,
+    PROFILE_DIR,
+    PROFILE_INTERVAL_MS,
+    PROFILE_MODE,
+    PROFILE_RATE,
+)
+
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+
+_current_session: "contextvars.ContextVar[Optional[ProfileSession]]" = contextvars.ContextVar(
+    "m1_profile_session", default=None
+)
+
+
+class ProfileSession:
+    """Dados de profiling de um ticket (acumulados pelos nós e pelo amostrador)."""
+
+    def __init__(self, ticket_id: str, mode: str):
+        self.ticket_id = ticket_id
+        self.mode = mode
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.node_wall: Dict[str, float] = {}
+        self.node_calls: Counter = Counter()
+        self.stacks: Counter = Counter()
+        self._node_profiles: Dict[str, pstats.Stats] = {}
+
+    def add_node_time(self, node: str, seconds: float) -> None:
+        with self._lock:
+            self.node_wall[node] = self.node_wall.get(node, 0.0) + seconds
+            self.node_calls[node] += 1
+
+    def add_stack(self, collapsed: str) -> None:
+        with self._lock:
+            self.stacks[collapsed] += 1
+
+    def add_node_profile(self, node: str, profile: cProfile.Profile) -> None:
+        with self._lock:
+            if node in self._node_profiles:
+                self._node_profiles[node].add(profile)
+            else:
+                self._node_profiles[node] = pstats.Stats(profile)
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        """Resumo por nó: tempo de parede, execuções, amostras e funções mais pesadas."""
+        with self._lock:
+            nodes: Dict[str, Dict[str, Any]] = {
+                node: {
+                    "calls": self.node_calls[node],
+                    "wall_seconds": round(self.node_wall[node], 6),
+                }
+                for node in self.node_wall
+            }
+            per_node_funcs: Dict[str, Counter] = {}
+            for stack, count in self.stacks.items():
+                node, _, rest = stack.partition(";")
+                nodes.setdefault(node, {"calls": 0, "wall_seconds": 0.0})
+                nodes[node]["samples"] = nodes[node].get("samples", 0) + count
+                leaf = rest.rsplit(";", 1)[-1] if rest else node
+                per_node_funcs.setdefault(node, Counter())[leaf] += count
+            for node, funcs in per_node_funcs.items():
+                nodes[node]["top_functions"] = [
+                    {"function": f, "samples": c} for f, c in funcs.most_common(top)
+                ]
+            for node, stats in self._node_profiles.items():
+                nodes.setdefault(node, {"calls": 0, "wall_seconds": 0.0})
+                nodes[node]["top_functions"] = [
+                    {
+                        "function": f"{func[0]}:{func[1]}({func[2]})",
+                        "calls": data[1],
+                        "cumulative_seconds": round(data[3], 6),
+                    }
+                    for func, data in sorted(
+                        stats.stats.items(), key=lambda item: -item[1][3]
+                    )[:top]
+                ]
+        return {
+            "ticket_id": self.ticket_id,
+            "mode": self.mode,
+            "started_at": self.started,
+            "wall_seconds": round(sum(n["wall_seconds"] for n in nodes.values()), 6),
+            "nodes": nodes,
+        }
+
+    def write(self, directory: str = PROFILE_DIR) -> Dict[str, str]:
+        """Grava os arquivos do ticket e devolve os caminhos."""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        safe_ticket = re.sub(r"[^A-Za-z0-9_.-]", "_", self.ticket_id)[:80]
+        base = os.path.join(directory, f"{stamp}_{safe_ticket}")
+        files = {"summary": base + ".summary.json"}
+        if self.stacks:
+            files["collapsed"] = base + ".collapsed"
+            with open(files["collapsed"], "w", encoding="utf-8") as f:
+                for stack, count in sorted(self.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+        if self._node_profiles:
+            files["pstats"] = base + ".prof"
+            combined = pstats.Stats()
+            for stats in self._node_profiles.values():
+                combined.add(stats)
+            combined.dump_stats(files["pstats"])
+        with open(files["summary"], "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        return files
+
+
+# ---------------------------------------------------------------------------
+# Amostrador (modo sample)
+# ---------------------------------------------------------------------------
+class _Sampler:
+    """
+    Thread única do processo que amostra as threads registradas (executando um
+    nó de um ticket perfilado). Fica parada enquanto não há threads ativas.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._lock = threading.Lock()
+        # thread_id -> (sessão, nome do nó)
+        self._active: Dict[int, Any] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, session: ProfileSession, node: str) -> None:
+        with self._lock:
+            self._active[threading.get_ident()] = (session, node)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="m1-profile-sampler", daemon=True
+                )
+                self._thread.start()
+            self._wake.set()
+
+    def unregister(self) -> None:
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                active = dict(self._active)
+                if not active:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            for thread_id, (session, node) in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    session.add_stack(_collapse(node, frame))
+            time.sleep(self.interval)
+
+    def _after_fork(self) -> None:
+        # No filho só existe a thread que chamou fork(): a do amostrador não foi copiada
+        self._lock = threading.Lock()
+        self._active.clear()
+        self._wake = threading.Event()
+        self._thread = None
+
+
+def _collapse(node: str, frame: Any) -> str:
+    """Pilha da thread, da entrada do nó até o frame atual: 'no;mod:func;...'."""
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        if code is _INSTRUMENTED_CODE:
+            break
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    names.append(node)
+    return ";".join(reversed(names))
+
+
+_sampler = _Sampler(max(0.001, PROFILE_INTERVAL_MS / 1000.0))
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_sampler._after_fork)
+
+
+# ---------------------------------------------------------------------------
+# Instrumentação dos nós e sessão por ticket
+# ---------------------------------------------------------------------------
+def instrument(node: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Envolve um nó do grafo: mede o tempo (métrica node_seconds) e, se o ticket
+    atual está sendo perfilado, atribui as amostras / o cProfile a este nó.
+    Com M1_ANALYTICS=1, acrescenta ao resultado o run_stats atualizado. Antes do
+    nó, um ticket de lote do scheduler pode ceder a vaga (preempção).
+    """
+
+    @functools.wraps(fn)
+    def _instrumented(*args: Any, **kwargs: Any) -> Any:
+        scheduler.checkpoint()
+        session = _current_session.get()
+        start = time.perf_counter()
+        profile = None
+        if session is not None:
+            if session.mode == MODE_CPROFILE:
+                profile = cProfile.Profile()
+                profile.enable()
+            else:
+                _sampler.register(session, node)
+        try:
+            if not ANALYTICS_ENABLED:
+                return fn(*args, **kwargs)
+            with analytics.node_scope() as hits:
+                result = fn(*args, **kwargs)
+            state = args[0] if args and isinstance(args[0], dict) else {}
+            if isinstance(result, dict):
+                result = {
+                    **result,
+                    "run_stats": analytics.merge_run_stats(
+                        state.get("run_stats"),
+                        node,
+                        time.perf_counter() - start,
+                        hits,
+                        result.get("token_usage"),
+                    ),
+                }
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe("node_seconds", elapsed, node=node)
+            if session is not None:
+                if profile is not None:
+                    profile.disable()
+                    session.add_node_profile(node, profile)
+                else:
+                    _sampler.unregister()
+                session.add_node_time(node, elapsed)
+
+    return _instrumented
+
+
+# Code object do wrapper (o mesmo para todos os nós): o amostrador corta a pilha nele
+_INSTRUMENTED_CODE = instrument("", lambda: None).__code__
+
+
+def _should_profile(state: Dict[str, Any]) -> Optional[str]:
+    """Modo de profiling deste ticket, ou None."""
+    if state.get("profile"):
+        return PROFILE_MODE if PROFILE_MODE in (MODE_SAMPLE, MODE_CPROFILE) else MODE_SAMPLE
+    if PROFILE_MODE in (MODE_SAMPLE, MODE_CPROFILE) and random.random() < PROFILE_RATE:
+        return PROFILE_MODE
+    return None
+
+
+@contextmanager
+def profile_ticket(state: Dict[str, Any]) -> Iterator[Optional[ProfileSession]]:
+    """
+    Abre uma sessão de profiling para o ticket (se selecionado) durante o bloco.
+    Ao sair, grava os arquivos em M1_PROFILE_DIR. Produz None se o ticket não
+    foi selecionado.
+    """
+    mode = _should_profile(state or {})
+    if mode is None:
+        yield None
+        return
+    ticket_id = str((state or {}).get("ticket_id") or f"ticket-{int(time.time() * 1000)}")
+    session = ProfileSession(ticket_id, mode)
+    token = _current_session.set(session)
+    metrics.incr("profiled_tickets", mode=mode)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+        try:
+            files = session.write()
+            print(f"Profiling do ticket {ticket_id}: {files['summary']}")
+        except OSError as e:
+            print(f"Falha ao gravar o profiling do ticket {ticket_id}: {e!s}")
+
+
+def invoke_profiled(graph: Any, state: Any, config: Optional[Dict[str, Any]] = None) -> Any:
+    """graph.invoke(state, config) dentro de profile_ticket(state)."""
+    with profile_ticket(state if isinstance(state, dict) else {}):
+        return graph.invoke(state, config)
@@ -0,0 +1,137 @@
+"""
+Re-ranking local dos chunks do libindexr (NumPy) — Módulo M1 N1 Chamados
+
+A seleção original escolhe o documento do chunk com maior similarityScore:
+um único chunk "sortudo" pode vencer um documento com vários chunks fortes.
+Aqui todos os chunks retornados são agregados por documento (sourceId) com
+operações vetorizadas:
+
+- max:      maior similarityScore do documento;
+- mean:     média dos scores dos chunks do documento;
+- topk:     soma dos k melhores chunks dividida por k (RERANK_TOP_K); um
+            documento com menos de k chunks conta os que faltam como 0, então
+            vários chunks fortes valem mais que um só. Dividir pelo k fixo não
+            muda a ordem da soma e mantém o sinal na escala dos outros;
+- lexical:  fração dos termos da pergunta que aparecem em algum chunk do documento.
+
+O score final é a combinação linear desses sinais (pesos em RERANK_WEIGHTS).
+O custo é dominado pela tokenização dos chunks; as agregações são O(n) em
+NumPy, então aumentar DEFAULT_QUANTITY não pesa no nó.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from m1_busca_documental.config import RERANK_TOP_K, RERANK_WEIGHTS
+from m1_busca_documental.local_search import tokenize
+
+SIGNALS = ("max", "mean", "topk", "lexical")
+
+
+def _flatten_chunks(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lista plana de chunks válidos: {source_id, from_document, score, raw, entry}."""
+    flat = []
+    results = response.get("results") if isinstance(response, dict) else None
+    if not isinstance(results, list):
+        return flat
+    for res in results:
+        if not isinstance(res, dict) or not isinstance(res.get("chunks"), list):
+            continue
+        from_doc = res.get("fromDocument")
+        for ch in res["chunks"]:
+            chunk_data = ch.get("chunk") if isinstance(ch, dict) else None
+            if not isinstance(chunk_data, dict) or not chunk_data.get("sourceId"):
+                continue
+            score = ch.get("similarityScore")
+            flat.append(
+                {
+                    "source_id": str(chunk_data["sourceId"]),
+                    "from_document": str(from_doc) if from_doc else None,
+                    "score": float(score) if score is not None else 0.0,
+                    "raw": chunk_data.get("rawContent") or "",
+                    "entry": ch,
+                }
+            )
+    return flat
+
+
+def rerank_documents(
+    response: Dict[str, Any],
+    user_query: str,
+    weights: Optional[Sequence[float]] = None,
+    top_k: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Agrega os chunks da resposta do libindexr por documento e ordena pelo score combinado.
+
+    Retorno (melhor primeiro):
+        [{"source_id", "from_document", "score", "max", "mean", "topk", "lexical",
+          "n_chunks", "chunks": [entradas originais do chunk, melhor primeiro]}, ...]
+    """
+    weights = np.asarray(weights if weights is not None else RERANK_WEIGHTS, dtype=np.float64)
+    if weights.shape != (len(SIGNALS),):
+        raise ValueError(f"rerank: esperados {len(SIGNALS)} pesos ({', '.join(SIGNALS)}), recebidos {weights.size}.")
+    top_k = max(1, int(top_k or RERANK_TOP_K))
+
+    flat = _flatten_chunks(response)
+    if not flat:
+        return []
+
+    # Índice do documento de cada chunk (ordem de primeira aparição)
+    doc_ids: Dict[str, int] = {}
+    for c in flat:
+        doc_ids.setdefault(c["source_id"], len(doc_ids))
+    n_docs = len(doc_ids)
+    idx = np.fromiter((doc_ids[c["source_id"]] for c in flat), dtype=np.int64, count=len(flat))
+    scores = np.fromiter((c["score"] for c in flat), dtype=np.float64, count=len(flat))
+
+    counts = np.bincount(idx, minlength=n_docs)
+    max_score = np.full(n_docs, -np.inf)
+    np.maximum.at(max_score, idx, scores)
+    mean_score = np.bincount(idx, weights=scores, minlength=n_docs) / counts
+
+    # Top-k por documento: ordena por (documento, -score) e mantém os k primeiros de cada grupo
+    order = np.lexsort((-scores, idx))
+    sorted_idx = idx[order]
+    group_start = np.searchsorted(sorted_idx, np.arange(n_docs))
+    rank = np.arange(len(order)) - group_start[sorted_idx]
+    keep = rank < top_k
+    topk_score = np.bincount(sorted_idx[keep], weights=scores[order][keep], minlength=n_docs) / top_k
+
+    # Sobreposição lexical: presença de cada termo da pergunta em cada chunk → OR por documento
+    query_terms = sorted(set(tokenize(user_query)))
+    if query_terms:
+        term_pos = {t: j for j, t in enumerate(query_terms)}
+        presence = np.zeros((len(flat), len(query_terms)), dtype=bool)
+        for i, c in enumerate(flat):
+            for t in set(tokenize(c["raw"])):
+                j = term_pos.get(t)
+                if j is not None:
+                    presence[i, j] = True
+        doc_presence = np.zeros((n_docs, len(query_terms)), dtype=bool)
+        np.logical_or.at(doc_presence, idx, presence)
+        lexical = doc_presence.mean(axis=1)
+    else:
+        lexical = np.zeros(n_docs)
+
+    signals = np.stack([max_score, mean_score, topk_score, lexical], axis=1)
+    combined = signals @ weights
+
+    ranked_docs = np.argsort(-combined, kind="stable")
+    source_ids = list(doc_ids)
+    ranking = []
+    for d in ranked_docs:
+        chunk_pos = order[sorted_idx == d]
+        first = flat[chunk_pos[0]]
+        ranking.append(
+            {
+                "source_id": source_ids[d],
+                "from_document": first["from_document"],
+                "score": float(combined[d]),
+                **{name: float(signals[d, j]) for j, name in enumerate(SIGNALS)},
+                "n_chunks": int(counts[d]),
+                "chunks": [flat[p]["entry"] for p in chunk_pos],
+            }
+        )
+    return ranking
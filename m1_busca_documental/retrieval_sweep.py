@@ -0,0 +1,407 @@
+"""
+Varredura dos parâmetros de busca — Módulo M1 N1 Chamados
+
+M1_QUANTITY (3), M1_THRESHOLD_SIMILARITY (0.4) e o uso da cadeia de chunks
+(M1_CHUNK_FAST_PATH) foram escolhidos no chute. Este benchmark mede, para cada
+combinação de uma grade, a qualidade e o custo do pipeline sobre um conjunto
+rotulado (pergunta → KB esperado):
+
+- acerto top-1 (KB escolhido = esperado) e top-k (esperado entre os candidatos);
+- latência do pipeline (rag_graph de ponta a ponta, sem rede) e a latência
+  gravada da busca;
+- tokens de entrada/saída da LLM (média só das execuções sem erro) e o total
+  de falhas da LLM; uma combinação com falhas não entra na recomendação.
+
+Duas etapas, para não chamar o libindexr uma vez por combinação:
+
+1. record: para cada pergunta, uma busca "larga" (maior quantity da grade,
+   threshold 0, cadeia ligada) no libindexr — ou no índice vetorial local,
+   com --source vector — gravada em JSONL junto com a latência;
+2. run: para cada combinação, a resposta gravada é filtrada (score >= threshold,
+   os `quantity` melhores chunks, cadeia removida quando desligada) e o grafo
+   roda com ela. A LLM é um stub que conta os tokens do prompt real e responde
+   RELEVANTE; com --live-llm a LLM de verdade é chamada (custa tokens).
+
+O roteamento por palavra-chave e o FAQ ficam desligados durante a varredura
+(eles pulariam a busca); --with-routers os mantém.
+
+Conjunto rotulado: JSONL com {"question": "...", "expected_kb": "KB..."} por
+linha, ou um YAML no formato do faq_questions.yaml (o default).
+
+Uso:
+  python -m m1_busca_documental.retrieval_sweep record --out sweep_recorded.jsonl
+  python -m m1_busca_documental.retrieval_sweep run sweep_recorded.jsonl \\
+      --quantity 1,3,5,10 --threshold 0.2,0.3,0.4,0.5 --json sweep.json
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from contextlib import ExitStack, redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from unittest import mock
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import config, nodes
+from m1_busca_documental import graph as graph_module
+from m1_busca_documental.chunk_context import _CHAIN_KEYS
+from m1_busca_documental.config import CHUNK_CHAIN_MAX_LINK, FAQ_QUESTIONS_PATH, INDEX_ID
+
+DEFAULT_QUANTITIES = (1, 3, 5, 10)
+DEFAULT_THRESHOLDS = (0.2, 0.3, 0.4, 0.5, 0.6)
+
+
+# ---------------------------------------------------------------------------
+# Conjunto rotulado e gravação
+# ---------------------------------------------------------------------------
+def load_labeled(path: str = FAQ_QUESTIONS_PATH) -> List[Dict[str, str]]:
+    """[{"question", "expected_kb"}] de um JSONL ou de um YAML {kb: [perguntas]}."""
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return [
+            {"question": str(q), "expected_kb": str(kb).upper()}
+            for kb, questions in data.items()
+            for q in questions or []
+        ]
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                row = json.loads(line)
+                items.append(
+                    {
+                        "question": row.get("question") or row.get("user_query") or "",
+                        "expected_kb": str(row.get("expected_kb") or row.get("kb_id")).upper(),
+                    }
+                )
+    return items
+
+
+def record(
+    labeled: Sequence[Dict[str, str]],
+    out_path: str,
+    quantity: int = max(DEFAULT_QUANTITIES),
+    source: str = "libindexr",
+) -> int:
+    """Grava uma resposta larga por pergunta (busca real) em JSONL. Retorna o total."""
+    client = nodes._get_libindexer_client() if source == "libindexr" else None
+    count = 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        for item in labeled:
+            start = time.perf_counter()
+            if client is not None:
+                response = client.query(
+                    index_id=INDEX_ID,
+                    search_query=item["question"],
+                    quantity=quantity,
+                    threshold_similarity=0.0,
+                    use_chunk_chain=True,
+                    max_chunk_chain_link=CHUNK_CHAIN_MAX_LINK,
+                )
+            else:
+                response = nodes._query_vector_store(item["question"], quantity)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            row = {**item, "source": source, "elapsed_ms": round(elapsed_ms, 2), "response": response}
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def load_recorded(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+def filter_response(
+    response: Dict[str, Any],
+    quantity: int,
+    threshold: float,
+    use_chunk_chain: bool,
+    max_chunk_chain_link: int = CHUNK_CHAIN_MAX_LINK,
+) -> Dict[str, Any]:
+    """
+    Simula a busca com outros parâmetros a partir de uma resposta larga: chunks
+    com score >= threshold, os `quantity` melhores, agrupados como na API.
+    """
+    scored: List[Tuple[float, int, str, Dict[str, Any]]] = []
+    for res in (response or {}).get("results") or []:
+        for entry in res.get("chunks") or []:
+            score = entry.get("similarityScore")
+            if score is None or float(score) < threshold:
+                continue
+            scored.append((float(score), len(scored), res.get("fromDocument"), entry))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    results: Dict[Any, Dict[str, Any]] = {}
+    for _, _, from_document, entry in scored[:quantity]:
+        entry = copy.deepcopy(entry)
+        for holder in (entry, entry.get("chunk") or {}):
+            for key in _CHAIN_KEYS:
+                if key not in holder:
+                    continue
+                if use_chunk_chain:
+                    holder[key] = list(holder[key] or [])[:max_chunk_chain_link]
+                else:
+                    del holder[key]
+        results.setdefault(from_document, {"fromDocument": from_document, "chunks": []})
+        results[from_document]["chunks"].append(entry)
+    return {"results": list(results.values())}
+
+
+def _stub_invoke(self: Any, system_prompt: str, user_prompt: str, **_: Any) -> Tuple[str, Dict[str, int]]:
+    """OpenAIIntegration.invoke falso: conta os tokens do prompt real e responde RELEVANTE."""
+    from integrations.openai import count_tokens
+
+    content = "CLASSIFICACAO: RELEVANTE\n\nResposta simulada pela varredura de parâmetros."
+    input_tokens = count_tokens(system_prompt + "\n" + user_prompt, self.model)
+    output_tokens = count_tokens(content, self.model)
+    return content, {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+def _settings_patches(stack: ExitStack, use_chunk_chain: bool, with_routers: bool, live_llm: bool) -> None:
+    from integrations.openai import OpenAIIntegration
+
+    stack.enter_context(mock.patch.object(nodes, "RETRIEVAL_BACKEND", "libindexr"))
+    stack.enter_context(mock.patch.object(nodes, "_configured_index_ids", lambda: [INDEX_ID]))
+    stack.enter_context(mock.patch.object(nodes, "COALESCING_ENABLED", False))
+    # Cada combinação da grade é uma busca fixa, sem a escada adaptativa
+    stack.enter_context(mock.patch.object(nodes, "ADAPTIVE_RETRIEVAL_ENABLED", False))
+    stack.enter_context(mock.patch.object(nodes, "CHUNK_FAST_PATH", use_chunk_chain))
+    stack.enter_context(mock.patch.object(graph_module, "CHUNK_FAST_PATH", use_chunk_chain))
+    if not with_routers:
+        stack.enter_context(mock.patch.object(nodes, "FAQ_ENABLED", False))
+        stack.enter_context(mock.patch.object(nodes, "KEYWORD_ROUTING_ENABLED", False))
+    if not live_llm:
+        stack.enter_context(mock.patch.object(OpenAIIntegration, "invoke", _stub_invoke))
+        if not config.OPENAI_API_KEY:
+            # O generate_answer exige a chave antes de chamar a LLM (aqui, o stub)
+            stack.enter_context(mock.patch.object(config, "OPENAI_API_KEY", "sweep-stub"))
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct * (len(ordered) - 1))))]
+
+
+def _llm_failed(result: Dict[str, Any]) -> bool:
+    """
+    Falha na geração: o documento chegou ao generate_answer, mas ele saiu com
+    erro (exceção da LLM, chave ausente, modo degradado). Erros da busca (nenhum
+    documento) não contam: são o no_result_rate.
+    """
+    return bool(result.get("error")) and bool(result.get("raw_text_content"))
+
+
+def run_setting(
+    recorded: Sequence[Dict[str, Any]],
+    quantity: int,
+    threshold: float,
+    use_chunk_chain: bool,
+    with_routers: bool = False,
+    live_llm: bool = False,
+    quiet: bool = True,
+) -> Dict[str, Any]:
+    """Roda o grafo para todas as perguntas gravadas com uma combinação de parâmetros."""
+    kb_of_source = {str(r["source_id"]): r["kb_id"] for r in nodes._get_n1_db().get_all_data()}
+    current: Dict[str, Any] = {}
+
+    def _replay(client: Any, **kwargs: Any) -> Dict[str, Any]:
+        return filter_response(
+            current["response"],
+            quantity=kwargs["quantity"],
+            threshold=kwargs["threshold_similarity"],
+            use_chunk_chain=kwargs.get("use_chunk_chain", False),
+            max_chunk_chain_link=kwargs.get("max_chunk_chain_link") or 0,
+        )
+
+    top1 = topk = empty = errors = 0
+    pipeline_ms: List[float] = []
+    retrieval_ms: List[float] = []
+    input_tokens: List[int] = []
+    output_tokens: List[int] = []
+    with ExitStack() as stack:
+        _settings_patches(stack, use_chunk_chain, with_routers, live_llm)
+        stack.enter_context(mock.patch.object(nodes, "DEFAULT_QUANTITY", quantity))
+        stack.enter_context(mock.patch.object(nodes, "DEFAULT_THRESHOLD_SIMILARITY", threshold))
+        stack.enter_context(mock.patch.object(nodes, "_query_libindexr", _replay))
+        if quiet:
+            # Os nós imprimem o fluxo de cada ticket; na varredura só interessa a tabela
+            stack.enter_context(redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        for item in recorded:
+            current["response"] = item["response"]
+            start = time.perf_counter()
+            result = graph_module.rag_graph.invoke({"user_query": item["question"]})
+            pipeline_ms.append((time.perf_counter() - start) * 1000)
+            retrieval_ms.append(float(item.get("elapsed_ms") or 0.0))
+
+            chosen = result.get("kb_id")
+            candidates = [
+                kb_of_source.get(str(s)) for s in result.get("doc_references") or []
+            ]
+            top1 += chosen == item["expected_kb"]
+            topk += item["expected_kb"] in candidates or chosen == item["expected_kb"]
+            empty += not result.get("doc_reference")
+            if _llm_failed(result):
+                # Sem token_usage não há custo medido: ficaria como 0 tokens na média
+                errors += 1
+                continue
+            usage = result.get("token_usage") or {}
+            input_tokens.append(int(usage.get("input_tokens", 0)))
+            output_tokens.append(int(usage.get("output_tokens", 0)))
+
+    n = max(1, len(recorded))
+    return {
+        "quantity": quantity,
+        "threshold": threshold,
+        "use_chunk_chain": use_chunk_chain,
+        "questions": len(recorded),
+        "top1_hit_rate": round(top1 / n, 4),
+        "topk_hit_rate": round(topk / n, 4),
+        "no_result_rate": round(empty / n, 4),
+        "llm_errors": errors,
+        "pipeline_ms_p50": round(_percentile(pipeline_ms, 0.5), 2),
+        "pipeline_ms_p95": round(_percentile(pipeline_ms, 0.95), 2),
+        "retrieval_ms_mean": round(statistics.fmean(retrieval_ms), 2) if retrieval_ms else 0.0,
+        "input_tokens_mean": round(statistics.fmean(input_tokens), 1) if input_tokens else 0.0,
+        "output_tokens_mean": round(statistics.fmean(output_tokens), 1) if output_tokens else 0.0,
+    }
+
+
+def sweep(
+    recorded: Sequence[Dict[str, Any]],
+    quantities: Sequence[int] = DEFAULT_QUANTITIES,
+    thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+    chain_options: Sequence[bool] = (False, True),
+    with_routers: bool = False,
+    live_llm: bool = False,
+    quiet: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """Uma linha de resultado por combinação da grade."""
+    for quantity, threshold, chain in itertools.product(quantities, thresholds, chain_options):
+        yield run_setting(recorded, quantity, threshold, chain, with_routers, live_llm, quiet)
+
+
+def recommend(rows: Sequence[Dict[str, Any]], tolerance: float = 0.0) -> Optional[Dict[str, Any]]:
+    """
+    Combinação mais barata (menos tokens de entrada, depois menor quantity e p50) entre as
+    que ficam a até `tolerance` do melhor acerto top-1. Combinações com falhas da LLM
+    ficam de fora: a média de tokens delas não mede o custo real.
+    """
+    rows = [r for r in rows if not r.get("llm_errors")]
+    if not rows:
+        return None
+    best = max(r["top1_hit_rate"] for r in rows)
+    eligible = [r for r in rows if r["top1_hit_rate"] >= best - tolerance]
+    return min(
+        eligible, key=lambda r: (r["input_tokens_mean"], r["quantity"], r["pipeline_ms_p50"])
+    )
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def _csv(cast: Any) -> Any:
+    return lambda text: [cast(v) for v in text.split(",") if v.strip()]
+
+
+def _print_table(rows: Sequence[Dict[str, Any]]) -> None:
+    header = f"{'qtd':>4} {'thr':>5} {'chain':>5} {'top1':>6} {'topk':>6} {'vazio':>6} {'p50ms':>7} {'p95ms':>7} {'tok_in':>8} {'tok_out':>7} {'erros':>5}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['quantity']:>4} {r['threshold']:>5.2f} {('sim' if r['use_chunk_chain'] else 'não'):>5} "
+            f"{r['top1_hit_rate']:>6.1%} {r['topk_hit_rate']:>6.1%} {r['no_result_rate']:>6.1%} "
+            f"{r['pipeline_ms_p50']:>7.1f} {r['pipeline_ms_p95']:>7.1f} "
+            f"{r['input_tokens_mean']:>8.0f} {r['output_tokens_mean']:>7.0f} {r['llm_errors']:>5}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Varredura de parâmetros da busca do M1.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Grava uma busca larga por pergunta rotulada.")
+    rec.add_argument("--labeled", default=FAQ_QUESTIONS_PATH, help="JSONL ou YAML rotulado.")
+    rec.add_argument("--out", required=True, help="Arquivo JSONL de saída.")
+    rec.add_argument("--quantity", type=int, default=max(DEFAULT_QUANTITIES))
+    rec.add_argument("--source", choices=("libindexr", "vector"), default="libindexr")
+
+    run = sub.add_parser("run", help="Roda a grade sobre as respostas gravadas.")
+    run.add_argument("recorded", help="JSONL gravado pelo comando record.")
+    run.add_argument("--quantity", type=_csv(int), default=list(DEFAULT_QUANTITIES))
+    run.add_argument("--threshold", type=_csv(float), default=list(DEFAULT_THRESHOLDS))
+    run.add_argument(
+        "--chain", type=_csv(lambda v: v.strip().lower() in ("1", "true", "sim", "on")),
+        default=[False, True], help="Ex.: 0,1",
+    )
+    run.add_argument("--tolerance", type=float, default=0.0, help="Perda de top-1 aceita.")
+    run.add_argument("--with-routers", action="store_true", help="Mantém FAQ e palavra-chave.")
+    run.add_argument("--live-llm", action="store_true", help="Usa a LLM real (custa tokens).")
+    run.add_argument("--json", help="Grava as linhas e a recomendação neste arquivo.")
+    run.add_argument("--verbose", action="store_true", help="Mostra a saída dos nós.")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        total = record(load_labeled(args.labeled), args.out, args.quantity, args.source)
+        print(f"{total} respostas gravadas em {args.out}")
+        return
+
+    recorded = load_recorded(args.recorded)
+    rows = []
+    for row in sweep(
+        recorded,
+        args.quantity,
+        args.threshold,
+        args.chain,
+        args.with_routers,
+        args.live_llm,
+        quiet=not args.verbose,
+    ):
+        rows.append(row)
+        print(
+            f"  qtd={row['quantity']} thr={row['threshold']} chain={row['use_chunk_chain']}: "
+            f"top1={row['top1_hit_rate']:.1%}",
+            file=sys.stderr,
+        )
+    _print_table(rows)
+    best = recommend(rows, args.tolerance)
+    if best:
+        print(
+            f"\nRecomendado: M1_QUANTITY={best['quantity']} "
+            f"M1_THRESHOLD_SIMILARITY={best['threshold']} "
+            f"M1_CHUNK_FAST_PATH={int(best['use_chunk_chain'])} "
+            f"(top-1 {best['top1_hit_rate']:.1%}, {best['input_tokens_mean']:.0f} tokens de entrada)"
+        )
+    elif rows:
+        print("\nSem recomendação: todas as combinações tiveram falhas da LLM.")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "recommended": best}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -45,6 +45,12 @@ def main():
             print("Relevância (similarity):", doc.get("similarity_score"))
     else:
         print("Documento referenciado:", result.get("doc_reference"))
+    for step in result.get("retrieval_steps") or []:
+        print(
+            f"Busca passo {step['step']}: quantity={step['quantity']} limiar={step['threshold']}",
+            f"top={step.get('top_score')} {step.get('outcome') or 'erro'}",
+            f"({step.get('reason') or 'claro'}, {step['seconds']:.2f}s)",
+        )
     usage = result.get("token_usage")
     if usage:
         print(
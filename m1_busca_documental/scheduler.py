@@ -0,0 +1,300 @@
+"""
+Escalonamento de tickets por prazo (SLA) — Módulo M1 N1 Chamados
+
+Tickets interativos e reprocessamentos em lote disputavam os mesmos workers do
+serviço (e, por eles, a mesma capacidade de libindexr e OpenAI) na ordem de
+chegada. O TicketScheduler fica na frente do rag_graph no serviço:
+
+- cada ticket tem uma classe (priority: interactive ou batch) e um prazo
+  (deadline) — o do pedido ou agora + o SLA da classe
+  (M1_SCHED_INTERACTIVE_SLA_SECONDS, M1_SCHED_BATCH_SLA_SECONDS);
+- a fila é EDF (earliest deadline first): quando um worker fica livre, roda o
+  ticket de prazo mais próximo. Os workers são M1_SERVICE_WORKERS vagas;
+- as filas são limitadas por classe (M1_SERVICE_MAX_QUEUE para interativos,
+  M1_SCHED_BATCH_MAX_QUEUE para lote). Fila cheia → Overloaded (503 com
+  Retry-After no serviço);
+- preempção de lote: se um interativo espera há mais de
+  M1_SCHED_PREEMPT_WAIT_SECONDS, o próximo ticket de lote a passar por uma
+  fronteira de nó (profiling.instrument chama checkpoint()) devolve a sua vaga e
+  volta à fila com o mesmo prazo; a thread dele fica parada até ser escalonado de
+  novo. No máximo M1_SCHED_MAX_PAUSED tickets ficam parados ao mesmo tempo
+  (0 desliga a preempção).
+  Um ticket líder de uma coalescência (singleflight.py) com seguidoras não é
+  parado: a seguidora ocupa uma vaga esperando por ele. Se a seguidora chega com
+  o líder já parado, o líder volta na hora, mesmo sem vaga livre (a vaga fica
+  devendo e o próximo ticket só sai quando ela for devolvida).
+
+Métricas: scheduler_completed{priority}, scheduler_deadline_misses{priority},
+scheduler_lateness_seconds{priority}, scheduler_queue_seconds{priority},
+scheduler_preemptions, scheduler_priority_inheritance (líder parado retomado por
+uma seguidora), scheduler_rejected{priority} e o coletor "scheduler"
+(fila, execução e pausados por classe, espera do interativo mais antigo).
+"""
+
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from integrations.rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from m1_busca_documental import metrics, singleflight
+from m1_busca_documental.config import (
+    SCHED_BATCH_MAX_QUEUE,
+    SCHED_BATCH_SLA_SECONDS,
+    SCHED_INTERACTIVE_SLA_SECONDS,
+    SCHED_MAX_PAUSED,
+    SCHED_PREEMPT_WAIT_SECONDS,
+    SERVICE_MAX_QUEUE,
+    SERVICE_WORKERS,
+)
+
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+
+class Overloaded(Exception):
+    """Fila do serviço cheia: o pedido deve ser rejeitado com 503."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Serviço sobrecarregado; tente em {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    """Um ticket na fila ou em execução."""
+
+    __slots__ = (
+        "fn", "args", "priority", "deadline", "enqueued_at", "queued_since",
+        "started_at", "future", "resume", "preemptions", "pinned",
+    )
+
+    def __init__(self, fn: Callable[..., Any], args: Tuple[Any, ...], priority: str, deadline: float):
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.deadline = deadline  # time.monotonic()
+        self.enqueued_at = time.monotonic()
+        self.queued_since = self.enqueued_at
+        self.started_at: Optional[float] = None
+        self.future: Future = Future()
+        # Evento do ticket pausado por preempção (None quando não está pausado)
+        self.resume: Optional[threading.Event] = None
+        self.preemptions = 0
+        # True quando outro ticket espera pela execução deste (não pode ser parado)
+        self.pinned = False
+
+
+# Ticket executando na thread atual (para checkpoint() nas fronteiras de nó)
+_current: "contextvars.ContextVar[Optional[Tuple[TicketScheduler, _Ticket]]]" = contextvars.ContextVar(
+    "m1_sched_ticket", default=None
+)
+
+
+def normalize_priority(priority: Optional[str]) -> str:
+    return priority if priority in PRIORITIES else PRIORITY_INTERACTIVE
+
+
+class TicketScheduler:
+    """
+    Fila EDF com `workers` vagas de execução e preempção cooperativa de lote.
+
+    O pool tem workers + max_paused threads: um ticket pausado continua dono da
+    sua thread, e as demais bastam para as vagas. max_paused=None usa `workers`;
+    0 desliga a preempção.
+    """
+
+    def __init__(
+        self,
+        workers: int = SERVICE_WORKERS,
+        max_queue: int = SERVICE_MAX_QUEUE,
+        batch_max_queue: int = SCHED_BATCH_MAX_QUEUE,
+        preempt_wait_seconds: float = SCHED_PREEMPT_WAIT_SECONDS,
+        max_paused: Optional[int] = SCHED_MAX_PAUSED,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = {PRIORITY_INTERACTIVE: max(0, max_queue), PRIORITY_BATCH: max(0, batch_max_queue)}
+        self.preempt_wait_seconds = preempt_wait_seconds
+        self.max_paused = self.workers if max_paused is None else max(0, max_paused)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers + self.max_paused, thread_name_prefix="m1-worker"
+        )
+        self._cond = threading.Condition()
+        # (prazo, seq, ticket, evento de retomada — None para ticket novo)
+        self._heap: List[Tuple[float, int, _Ticket, Optional[threading.Event]]] = []
+        self._seq = itertools.count()
+        self._free = self.workers
+        self._running = {p: 0 for p in PRIORITIES}
+        self._queued_new = {p: 0 for p in PRIORITIES}
+        self._paused = 0
+        # Média móvel (EWMA) da duração de um ticket, para estimar o Retry-After
+        self._avg_seconds = 5.0
+
+    # -- fila -------------------------------------------------------------
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        priority: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Future:
+        """
+        Enfileira fn(*args). `deadline` é um instante em time.time() (None = agora
+        + SLA da classe). Levanta Overloaded com a fila da classe cheia.
+        """
+        priority = normalize_priority(priority)
+        now = time.monotonic()
+        if deadline is None:
+            sla = SCHED_INTERACTIVE_SLA_SECONDS if priority == PRIORITY_INTERACTIVE else SCHED_BATCH_SLA_SECONDS
+            deadline_mono = now + sla
+        else:
+            deadline_mono = now + (float(deadline) - time.time())
+        ticket = _Ticket(fn, args, priority, deadline_mono)
+        with self._cond:
+            queued = self._queued_new[priority]
+            if self._free <= 0 and queued >= self.max_queue[priority]:
+                # Tempo aproximado para a fila atual escoar pelos workers
+                retry_after = math.ceil(max(1.0, (queued + 1) * self._avg_seconds / self.workers))
+                metrics.incr("scheduler_rejected", priority=priority)
+                raise Overloaded(retry_after)
+            self._push(ticket)
+            self._queued_new[priority] += 1
+            self._dispatch()
+        return ticket.future
+
+    def _push(self, ticket: _Ticket, resume: Optional[threading.Event] = None) -> None:
+        ticket.queued_since = time.monotonic()
+        heapq.heappush(self._heap, (ticket.deadline, next(self._seq), ticket, resume))
+
+    def _resume(self, ticket: _Ticket, resume: threading.Event) -> None:
+        """Devolve a vaga a um ticket parado (com o lock)."""
+        self._paused -= 1
+        self._free -= 1
+        self._running[ticket.priority] += 1
+        resume.set()
+
+    def _dispatch(self) -> None:
+        """Entrega vagas livres aos tickets de prazo mais próximo (com o lock)."""
+        while self._free > 0 and self._heap:
+            _, _, ticket, resume = heapq.heappop(self._heap)
+            if resume is not None:
+                # Ticket parado por preempção: a thread dele continua. Se já foi
+                # retomado por uma seguidora (_pin), a entrada é velha.
+                if not resume.is_set():
+                    self._resume(ticket, resume)
+                continue
+            self._queued_new[ticket.priority] -= 1
+            if not ticket.future.set_running_or_notify_cancel():
+                continue  # cancelado enquanto esperava (cliente desconectou)
+            self._free -= 1
+            self._running[ticket.priority] += 1
+            self.executor.submit(self._run, ticket)
+
+    def _run(self, ticket: _Ticket) -> None:
+        ticket.started_at = time.monotonic()
+        metrics.observe("scheduler_queue_seconds", ticket.started_at - ticket.enqueued_at, priority=ticket.priority)
+        token = _current.set((self, ticket))
+        hook_token = singleflight.follow_hook.set(lambda: self._pin(ticket))
+        try:
+            result = ticket.fn(*ticket.args)
+        except BaseException as e:
+            ticket.future.set_exception(e)
+        else:
+            ticket.future.set_result(result)
+        finally:
+            singleflight.follow_hook.reset(hook_token)
+            _current.reset(token)
+            self._finish(ticket)
+
+    def _finish(self, ticket: _Ticket) -> None:
+        now = time.monotonic()
+        metrics.incr("scheduler_completed", priority=ticket.priority)
+        if now > ticket.deadline:
+            metrics.incr("scheduler_deadline_misses", priority=ticket.priority)
+            metrics.observe("scheduler_lateness_seconds", now - ticket.deadline, priority=ticket.priority)
+        with self._cond:
+            self._free += 1
+            self._running[ticket.priority] -= 1
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (now - (ticket.started_at or now))
+            self._dispatch()
+
+    # -- preempção --------------------------------------------------------
+    def _pin(self, ticket: _Ticket) -> None:
+        """
+        Uma seguidora passou a esperar por este ticket: ele não é mais parado e,
+        se já estava parado, volta agora (sem esperar vaga — a seguidora segura
+        uma, e esperar por outra poderia travar os dois).
+        """
+        with self._cond:
+            ticket.pinned = True
+            resume = ticket.resume
+            if resume is not None and not resume.is_set():
+                self._resume(ticket, resume)
+                metrics.incr("scheduler_priority_inheritance")
+
+    def _oldest_wait(self, priority: str, now: float) -> float:
+        waits = [now - t.queued_since for _, _, t, r in self._heap if t.priority == priority and r is None]
+        return max(waits) if waits else 0.0
+
+    def _should_preempt(self, now: float) -> bool:
+        if self._paused >= self.max_paused or self._queued_new[PRIORITY_INTERACTIVE] == 0:
+            return False
+        return self._oldest_wait(PRIORITY_INTERACTIVE, now) >= self.preempt_wait_seconds
+
+    def checkpoint(self, ticket: _Ticket) -> None:
+        """
+        Fronteira de nó de um ticket de lote: com interativos esperando demais,
+        devolve a vaga, volta à fila EDF e bloqueia até ser escalonado de novo.
+        """
+        if ticket.priority != PRIORITY_BATCH:
+            return
+        with self._cond:
+            if ticket.pinned or not self._should_preempt(time.monotonic()):
+                return
+            resume = ticket.resume = threading.Event()
+            ticket.preemptions += 1
+            self._paused += 1
+            self._free += 1
+            self._running[ticket.priority] -= 1
+            self._push(ticket, resume)
+            self._dispatch()
+        metrics.incr("scheduler_preemptions")
+        resume.wait()
+        with self._cond:
+            ticket.resume = None
+
+    # -- estado -----------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "workers": self.workers,
+                "free": self._free,
+                "paused": self._paused,
+                "avg_ticket_seconds": self._avg_seconds,
+                "by_priority": {
+                    p: {
+                        "queued": self._queued_new[p],
+                        "running": self._running[p],
+                        "max_queue": self.max_queue[p],
+                        "oldest_wait_seconds": round(self._oldest_wait(p, now), 3),
+                    }
+                    for p in PRIORITIES
+                },
+            }
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(self._queued_new.values())
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+def checkpoint() -> None:
+    """Ponto de preempção: chamado antes de cada nó do grafo (profiling.instrument)."""
+    current = _current.get()
+    if current is not None:
+        current[0].checkpoint(current[1])
@@ -0,0 +1,420 @@
+"""
+Serviço HTTP (ASGI) do M1 — Módulo M1 N1 Chamados
+
+Expõe o grafo compilado (rag_graph) para o sistema de chamados:
+
+    POST /tickets          {"user_query": "...", "ticket_id": "...", "priority": "interactive",
+                            "sla_seconds": 30, "profile": false}
+                           → JSON compacto com a resposta final.
+    POST /tickets/stream   mesmo corpo; resposta NDJSON com uma linha por nó concluído
+                           e uma linha final {"event": "end", "result": {...}}.
+    GET  /metrics          métricas no formato texto do Prometheus.
+    GET  /health           {"status": "ok"}.
+
+Como o serviço se protege:
+- O grafo roda num pool de threads de tamanho fixo (M1_SERVICE_WORKERS); clientes
+  HTTP (libindexr, OpenAI), caches e circuit breakers são compartilhados pelo processo.
+- Pedidos além dos workers esperam numa fila limitada (M1_SERVICE_MAX_QUEUE). Com a
+  fila cheia o serviço responde 503 com Retry-After, em vez de acumular latência.
+- Com M1_SCHEDULER=1 (padrão) a fila é a do scheduler.py: por prazo (campo
+  "deadline" em epoch ou "sla_seconds" no corpo; senão o SLA da classe "priority"),
+  com fila própria para "batch" e preempção do lote quando interativos esperam.
+- Tickets idênticos e concorrentes são coalescidos (invoke_coalesced).
+- Com M1_RING_NODES/M1_RING_SELF, POST /tickets vai ao nó dono do KB (ou da
+  pergunta) no anel de hash consistente (kb_ring.py), para os caches de cada KB
+  ficarem num nó só. O streaming sempre roda no nó que recebeu o pedido.
+- Corpo inválido (JSON malformado, sem user_query, grande demais) → 400; qualquer
+  outra falha (resposta inválida de um nó do anel, configuração) → 500.
+
+Execução:
+  uvicorn m1_busca_documental.service:app --host 0.0.0.0 --port 8000
+  ou: python -m m1_busca_documental.service
+"""
+
+import asyncio
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    SCHEDULER_ENABLED,
+    SERVICE_HOST,
+    SERVICE_MAX_BODY_BYTES,
+    SERVICE_MAX_QUEUE,
+    SERVICE_PORT,
+    SERVICE_WORKERS,
+)
+from m1_busca_documental.graph import invoke_coalesced, rag_graph
+from m1_busca_documental.kb_ring import FORWARDED_HEADER, get_router
+from m1_busca_documental.profiling import profile_ticket
+from m1_busca_documental.scheduler import Overloaded, TicketScheduler
+
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str)
+
+    _loads = orjson.loads
+except ImportError:  # fallback para a biblioteca padrão
+    import json
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+
+    _loads = json.loads
+
+# Campos do estado devolvidos ao cliente (sem raw_text_content/api_response)
+RESULT_FIELDS = (
+    "ticket_id",
+    "user_query",
+    "status",
+    "final_response",
+    "is_kb_relevant",
+    "is_suggestion",
+    "needs_consultant",
+    "kb_id",
+    "best_similarity_score",
+    "model_tier",
+    "context_source",
+    "degraded",
+    "token_usage",
+    "error",
+)
+RETRIEVED_DOCUMENT_FIELDS = ("kb_id", "doc_title", "source_id", "similarity_score")
+
+
+def compact_result(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduz o estado do grafo ao que o sistema de chamados precisa."""
+    result = {k: state.get(k) for k in RESULT_FIELDS if state.get(k) is not None}
+    doc = state.get("retrieved_document")
+    if isinstance(doc, dict):
+        result["retrieved_document"] = {
+            k: doc.get(k) for k in RETRIEVED_DOCUMENT_FIELDS if doc.get(k) is not None
+        }
+    return result
+
+
+class TicketService:
+    """
+    Pool de workers com controle de admissão.
+
+    pending = pedidos em execução + na fila. Um pedido é rejeitado quando
+    pending já ocupa todos os workers e a fila (max_queue) está cheia.
+    Com M1_SCHEDULER=1, a fila e o pool são os do TicketScheduler (por prazo).
+    """
+
+    def __init__(
+        self,
+        workers: int = SERVICE_WORKERS,
+        max_queue: int = SERVICE_MAX_QUEUE,
+        use_scheduler: bool = SCHEDULER_ENABLED,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.scheduler = TicketScheduler(self.workers, self.max_queue) if use_scheduler else None
+        self.executor = (
+            self.scheduler.executor
+            if self.scheduler is not None
+            else ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="m1-worker")
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Média móvel (EWMA) da duração de um ticket, para estimar o Retry-After
+        self._avg_seconds = 5.0
+
+    def queue_depth(self) -> int:
+        if self.scheduler is not None:
+            return self.scheduler.queue_depth()
+        with self._lock:
+            return max(0, self._pending - self.workers)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.scheduler is not None:
+            stats = self.scheduler.stats()
+            return {
+                **stats,
+                "in_flight": self.workers - stats["free"],
+                "queue_depth": sum(p["queued"] for p in stats["by_priority"].values()),
+                "max_queue": self.max_queue,
+            }
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "in_flight": min(self._pending, self.workers),
+                "queue_depth": max(0, self._pending - self.workers),
+                "max_queue": self.max_queue,
+                "avg_ticket_seconds": self._avg_seconds,
+            }
+
+    def admit(self) -> None:
+        """Reserva uma vaga ou levanta Overloaded (com Retry-After estimado)."""
+        with self._lock:
+            queued = self._pending - self.workers
+            if queued >= self.max_queue:
+                # Tempo aproximado para a fila atual escoar pelos workers
+                retry_after = math.ceil(
+                    max(1.0, (queued + 1) * self._avg_seconds / self.workers)
+                )
+                metrics.incr("service_rejected")
+                raise Overloaded(retry_after)
+            self._pending += 1
+
+    def release(self, duration: float) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * duration
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        priority: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """
+        Executa fn(*args) no pool (após admit()) e libera a vaga ao final. Com o
+        scheduler, o ticket entra na fila EDF com a classe e o prazo dados.
+        """
+        if self.scheduler is not None:
+            future = self.scheduler.submit(fn, *args, priority=priority, deadline=deadline)
+            return await asyncio.wrap_future(future)
+        self.admit()
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+service = TicketService()
+metrics.register_collector("service", service.stats)
+
+
+# ---------------------------------------------------------------------------
+# Helpers ASGI
+# ---------------------------------------------------------------------------
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+async def _send_response(
+    send: Send,
+    status: int,
+    body: bytes,
+    content_type: bytes = b"application/json",
+    headers: Optional[Dict[bytes, bytes]] = None,
+) -> None:
+    raw_headers = [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]
+    raw_headers.extend((headers or {}).items())
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class BadRequest(Exception):
+    """Corpo do pedido inválido: responde 400. Só a leitura e validação do pedido a levantam."""
+
+
+async def _read_json(receive: Receive) -> Dict[str, Any]:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > SERVICE_MAX_BODY_BYTES:
+            raise BadRequest("Corpo da requisição muito grande.")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    try:
+        data = _loads(b"".join(chunks) or b"{}")
+    except ValueError as e:
+        raise BadRequest(f"Corpo não é um JSON válido: {e!s}") from e
+    if not isinstance(data, dict):
+        raise BadRequest("O corpo deve ser um objeto JSON.")
+    return data
+
+
+def _initial_state(payload: Dict[str, Any]) -> Dict[str, Any]:
+    user_query = payload.get("user_query")
+    if not isinstance(user_query, str) or not user_query.strip():
+        raise BadRequest("Campo 'user_query' é obrigatório.")
+    state: Dict[str, Any] = {"user_query": user_query}
+    if payload.get("ticket_id") is not None:
+        state["ticket_id"] = str(payload["ticket_id"])
+    if payload.get("priority") in ("interactive", "batch"):
+        state["priority"] = payload["priority"]
+    # Prazo do ticket: absoluto (epoch) ou relativo à chegada
+    if isinstance(payload.get("deadline"), (int, float)):
+        state["deadline"] = float(payload["deadline"])
+    elif isinstance(payload.get("sla_seconds"), (int, float)):
+        state["deadline"] = time.time() + float(payload["sla_seconds"])
+    if payload.get("profile") is True:
+        state["profile"] = True
+    return state
+
+
+# ---------------------------------------------------------------------------
+# Endpoints
+# ---------------------------------------------------------------------------
+async def _post_ticket(receive: Receive, send: Send, forwarded: bool = False) -> None:
+    payload = await _read_json(receive)
+    state = _initial_state(payload)
+    router = None if forwarded else get_router()
+    if router is not None:
+        # A espera pelo nó dono não ocupa um worker do grafo
+        loop = asyncio.get_running_loop()
+        remote = await loop.run_in_executor(None, router.dispatch, payload)
+        if remote is not None:
+            await _send_response(send, 200, _dumps(remote))
+            return
+    result = await service.run(
+        invoke_coalesced, state, priority=state.get("priority"), deadline=state.get("deadline")
+    )
+    await _send_response(send, 200, _dumps(compact_result(result)))
+
+
+def _stream_graph(
+    state: Dict[str, Any], loop: asyncio.AbstractEventLoop, queue: "asyncio.Queue[Any]"
+) -> None:
+    """Roda rag_graph.stream numa thread do pool e publica cada atualização na fila."""
+    final_state = dict(state)
+    try:
+        with profile_ticket(state):
+            for chunk in rag_graph.stream(state, stream_mode="updates"):
+                for node, update in chunk.items():
+                    update = update or {}
+                    final_state.update(update)
+                    event = {"event": "node", "node": node, "update": compact_result(update)}
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+        loop.call_soon_threadsafe(
+            queue.put_nowait, {"event": "end", "result": compact_result(final_state)}
+        )
+    except Exception as e:
+        loop.call_soon_threadsafe(queue.put_nowait, {"event": "error", "error": str(e)})
+    finally:
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+
+
+async def _post_ticket_stream(receive: Receive, send: Send) -> None:
+    state = _initial_state(await _read_json(receive))
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+    task = asyncio.ensure_future(
+        service.run(
+            _stream_graph,
+            state,
+            loop,
+            queue,
+            priority=state.get("priority"),
+            deadline=state.get("deadline"),
+        )
+    )
+    # Se a admissão falhar (503), a exceção aparece antes de enviar o cabeçalho
+    await asyncio.sleep(0)
+    if task.done() and task.exception():
+        raise task.exception()
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        }
+    )
+    while True:
+        event = await queue.get()
+        if event is None:
+            break
+        await send({"type": "http.response.body", "body": _dumps(event) + b"\n", "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+    await task
+
+
+async def _get_metrics(send: Send) -> None:
+    body = metrics.render_prometheus().encode("utf-8")
+    await _send_response(send, 200, body, content_type=b"text/plain; version=0.0.4")
+
+
+_ROUTES = {
+    ("POST", "/tickets"): "ticket",
+    ("POST", "/tickets/stream"): "ticket_stream",
+    ("GET", "/metrics"): "metrics",
+    ("GET", "/health"): "health",
+}
+
+
+async def app(scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+    """Aplicação ASGI (compatível com uvicorn/hypercorn)."""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                service.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    route = _ROUTES.get((scope["method"], scope["path"].rstrip("/") or "/"))
+    start = time.perf_counter()
+    status = 200
+    try:
+        if route == "ticket":
+            forwarded = any(name == FORWARDED_HEADER for name, _ in scope.get("headers") or ())
+            await _post_ticket(receive, send, forwarded)
+        elif route == "ticket_stream":
+            await _post_ticket_stream(receive, send)
+        elif route == "metrics":
+            await _get_metrics(send)
+        elif route == "health":
+            await _send_response(send, 200, _dumps({"status": "ok"}))
+        else:
+            status = 404
+            await _send_response(send, 404, _dumps({"error": "Rota não encontrada."}))
+    except Overloaded as e:
+        status = 503
+        await _send_response(
+            send,
+            503,
+            _dumps({"error": str(e)}),
+            headers={b"retry-after": str(e.retry_after).encode()},
+        )
+    except BadRequest as e:
+        status = 400
+        await _send_response(send, 400, _dumps({"error": str(e)}))
+    except Exception:
+        status = 500
+        raise
+    finally:
+        metrics.incr("service_requests", route=route or "unknown", status=status)
+        metrics.observe(
+            "service_request_seconds", time.perf_counter() - start, route=route or "unknown"
+        )
+
+
+def main() -> None:
+    try:
+        import uvicorn
+    except ImportError:
+        print("Instale o uvicorn para rodar o serviço: pip install uvicorn")
+        sys.exit(1)
+    uvicorn.run(app, host=SERVICE_HOST, port=SERVICE_PORT)
+
+
+if __name__ == "__main__":
+    main()
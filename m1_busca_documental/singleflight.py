@@ -0,0 +1,109 @@
+"""
+Single-flight (coalescência de requisições) — Módulo M1 N1 Chamados
+
+Durante incidentes, dezenas de usuários abrem o mesmo chamado em poucos
+segundos. Sem coalescência, cada um dispara a mesma busca no libindexr e a
+mesma chamada à LLM em paralelo.
+
+SingleFlight.do(key, fn) garante que, para uma mesma chave, apenas uma
+execução de fn esteja em andamento: a primeira thread (líder) executa, as
+demais (seguidoras) esperam e recebem o mesmo resultado — ou a mesma exceção.
+Quando a execução termina a chave é liberada; chamadas posteriores executam
+de novo (isto não é um cache).
+
+Quem executa a thread pode registrar em follow_hook uma função chamada quando
+uma seguidora passa a esperar pela execução dela. O escalonador (scheduler.py)
+usa isso para não deixar parado, por preempção, um ticket que outros esperam —
+a seguidora ocupa uma vaga de worker e o líder precisaria de outra para voltar.
+
+Métricas (ver metrics.py):
+- singleflight_executions{group}: execuções reais (líderes).
+- singleflight_coalesced{group}: chamadas atendidas pela execução de outra thread.
+"""
+
+import contextvars
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from m1_busca_documental import metrics
+
+# Aviso ao dono da execução líder de que há uma seguidora esperando (scheduler.py)
+follow_hook: "contextvars.ContextVar[Optional[Callable[[], None]]]" = contextvars.ContextVar(
+    "m1_singleflight_follow_hook", default=None
+)
+
+
+class _Call:
+    """Execução em andamento para uma chave."""
+
+    __slots__ = ("done", "result", "error", "on_follow")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        # follow_hook da thread líder
+        self.on_follow: Optional[Callable[[], None]] = follow_hook.get()
+
+
+class SingleFlight:
+    """
+    Grupo de deduplicação de chamadas concorrentes.
+
+    Args:
+        name: nome do grupo (label das métricas), ex.: "graph", "libindexr", "llm".
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Executa fn() uma única vez por chave entre as chamadas concorrentes.
+        Todas as threads que pediram a mesma chave recebem o mesmo retorno.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            metrics.incr("singleflight_coalesced", group=self.name)
+            if call.on_follow is not None:
+                call.on_follow()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr("singleflight_executions", group=self.name)
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        """Quantidade de chaves com execução em andamento."""
+        with self._lock:
+            return len(self._calls)
+
+
+# Grupos compartilhados pelo processo (entrada do grafo, busca libindexr e chamada LLM)
+graph_flight = SingleFlight("graph")
+libindexr_flight = SingleFlight("libindexr")
+llm_flight = SingleFlight("llm")
+
+metrics.register_collector(
+    "singleflight_in_flight",
+    lambda: {g.name: g.in_flight() for g in (graph_flight, libindexr_flight, llm_flight)},
+)
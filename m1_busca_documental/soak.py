@@ -0,0 +1,310 @@
+"""
+Teste de longa duração (soak) de memória — Módulo M1 N1 Chamados
+
+O RSS dos workers cresce ao longo dos dias. Este comando roda milhares de
+tickets pelo rag_graph (via invoke_coalesced, como o serviço) com a busca
+(LibIndexer) e a LLM substituídas por stubs determinísticos, tira snapshots
+do tracemalloc periodicamente e reporta:
+
+- bytes por ticket: inclinação (mínimos quadrados) da memória rastreada em
+  função do número de tickets, depois do aquecimento;
+- os sítios de alocação que mais cresceram entre o snapshot de base e o final;
+- o RSS do processo em cada ponto.
+
+Sai com código 1 se os bytes por ticket passarem de --max-bytes-per-ticket,
+para poder rodar em CI ou antes de um deploy.
+
+As perguntas variam a cada ticket (nº do chamado no texto), então caches por
+pergunta (answer_cache, FAQ, single-flight) são exercitados com chaves novas,
+como em produção: um cache sem limite aparece como crescimento linear. O
+aquecimento padrão passa do tamanho do answer_cache (M1_ANSWER_CACHE_SIZE),
+para que caches limitados já estejam cheios no snapshot de base.
+
+Uso:
+    python -m m1_busca_documental.soak --tickets 5000
+    python -m m1_busca_documental.soak --tickets 20000 --workers 8 --frames 10 \\
+        --json soak_report.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from unittest import mock
+
+from m1_busca_documental import config, nodes
+from m1_busca_documental.graph import invoke_coalesced, rag_graph
+
+# Perguntas de base (texto típico de chamado); o sufixo com o nº do ticket
+# torna cada pergunta única após a normalização.
+_QUERY_TEMPLATES = (
+    "Como solicitar acesso no UAM Services para o usuario {n}?",
+    "Nota fiscal {n} com rejeição 215 de validade do lote",
+    "Por que o CTe {n} não foi emitido?",
+    "Preciso subir manualmente o XML da nota {n} no VIM",
+    "Tipo de avaliação não existe para o material {n} no centro",
+    "Erro ao lançar pedido {n}, sistema trava na tela de aprovação",
+)
+
+# Filtros do tracemalloc: ignora o próprio tracemalloc e o import de módulos
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class _StubLibIndexer:
+    """LibIndexer falso: devolve chunks de um source_id sorteado da tabela n1_chamados."""
+
+    def __init__(self, seed: int, chunk_chars: int):
+        self._rng = random.Random(seed)
+        self._source_ids = sorted(
+            {str(r["source_id"]) for r in nodes._get_n1_db().get_all_data()}
+        )
+        self._chunk_chars = chunk_chars
+
+    def query(self, index_id: str, search_query: str, quantity: int = 5, **_: Any) -> Dict[str, Any]:
+        source_id = self._rng.choice(self._source_ids)
+        chunks = [
+            {
+                "chunk": {
+                    "sourceId": source_id,
+                    "position": i,
+                    # Conteúdo novo por chamada, como numa resposta HTTP real
+                    "rawContent": f"{search_query} trecho {i} " * (self._chunk_chars // 40 + 1),
+                },
+                "similarityScore": round(0.9 - 0.05 * i, 3),
+            }
+            for i in range(quantity)
+        ]
+        return {"results": [{"fromDocument": f"{source_id}.txt", "chunks": chunks}]}
+
+
+def _stub_llm(state: Dict[str, Any], model: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
+    """LLM falsa: resposta no formato do prompt v3, tamanho proporcional à pergunta."""
+    query = state.get("user_query") or ""
+    content = "CLASSIFICACAO: RELEVANTE\n\n" + ("Siga os passos do KB. " * 20) + query
+    return content, {"input_tokens": 1000, "output_tokens": 120, "total_tokens": 1120}
+
+
+@contextmanager
+def stubbed_backends(seed: int = 0, chunk_chars: int = 800) -> Iterator[None]:
+    """Substitui LibIndexer e LLM por stubs (o resto do grafo roda de verdade)."""
+    client = _StubLibIndexer(seed, chunk_chars)
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(nodes, "_get_libindexer_client", lambda: client))
+        stack.enter_context(mock.patch.object(nodes, "_call_llm_for_answer", _stub_llm))
+        if not config.OPENAI_API_KEY:
+            stack.enter_context(mock.patch.object(config, "OPENAI_API_KEY", "soak-stub"))
+        yield
+
+
+def _rss_bytes() -> Optional[int]:
+    """RSS atual do processo (Linux: /proc/self/statm), ou None."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _slope(points: List[Tuple[int, int]]) -> float:
+    """Inclinação por mínimos quadrados de [(tickets, bytes)]."""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    gc.collect()
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def _run_tickets(start: int, count: int, workers: int) -> None:
+    def _one(n: int) -> None:
+        state = {
+            "ticket_id": f"SOAK-{n}",
+            "user_query": _QUERY_TEMPLATES[n % len(_QUERY_TEMPLATES)].format(n=n),
+        }
+        invoke_coalesced(state, rag_graph)
+
+    if workers <= 1:
+        for n in range(start, start + count):
+            _one(n)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_one, range(start, start + count)))
+
+
+def run_soak(
+    tickets: int = 5000,
+    warmup: Optional[int] = None,
+    snapshots: int = 10,
+    workers: int = 1,
+    frames: int = 1,
+    top: int = 15,
+    seed: int = 0,
+    quiet: bool = True,
+) -> Dict[str, Any]:
+    """
+    Roda warmup + tickets pelo grafo com backends falsos e devolve o relatório
+    (com quiet, os prints dos nós vão para /dev/null):
+    bytes_per_ticket, growth_bytes, series [{tickets, traced_bytes, rss_bytes}]
+    e top_growth [{site, size_diff, count_diff, bytes_per_ticket}].
+    """
+    if warmup is None:
+        warmup = config.ANSWER_CACHE_SIZE + 500
+    snapshots = max(1, snapshots)
+    step = max(1, tickets // snapshots)
+    key_type = "traceback" if frames > 1 else "lineno"
+    tracemalloc.start(frames)
+    started = time.perf_counter()
+    try:
+        with stubbed_backends(seed=seed), ExitStack() as stack:
+            if quiet:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(redirect_stdout(devnull))
+            # Aquecimento: caches, autômatos, prompts e clientes são criados aqui
+            _run_tickets(0, warmup, workers)
+            baseline = _take_snapshot()
+            series = [
+                {
+                    "tickets": 0,
+                    "traced_bytes": tracemalloc.get_traced_memory()[0],
+                    "rss_bytes": _rss_bytes(),
+                }
+            ]
+            done = 0
+            while done < tickets:
+                batch = min(step, tickets - done)
+                _run_tickets(warmup + done, batch, workers)
+                done += batch
+                gc.collect()
+                series.append(
+                    {
+                        "tickets": done,
+                        "traced_bytes": tracemalloc.get_traced_memory()[0],
+                        "rss_bytes": _rss_bytes(),
+                    }
+                )
+                print(
+                    f"  {done}/{tickets} tickets  traced={series[-1]['traced_bytes'] / 1e6:.2f} MB"
+                    f"  rss={(series[-1]['rss_bytes'] or 0) / 1e6:.1f} MB",
+                    file=sys.stderr,
+                )
+            final = _take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    top_growth = []
+    for stat in final.compare_to(baseline, key_type):
+        if stat.size_diff <= 0:
+            continue
+        top_growth.append(
+            {
+                # Do frame que alocou para os chamadores
+                "site": [f"{fr.filename}:{fr.lineno}" for fr in reversed(stat.traceback)],
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "bytes_per_ticket": round(stat.size_diff / max(1, tickets), 2),
+            }
+        )
+        if len(top_growth) >= top:
+            break
+
+    return {
+        "tickets": tickets,
+        "warmup": warmup,
+        "workers": workers,
+        "elapsed_seconds": round(time.perf_counter() - started, 2),
+        "bytes_per_ticket": round(
+            _slope([(p["tickets"], p["traced_bytes"]) for p in series]), 2
+        ),
+        "growth_bytes": series[-1]["traced_bytes"] - series[0]["traced_bytes"],
+        "series": series,
+        "top_growth": top_growth,
+    }
+
+
+def _print_report(report: Dict[str, Any], max_bytes_per_ticket: float) -> None:
+    print(
+        f"Tickets: {report['tickets']} (+{report['warmup']} de aquecimento, "
+        f"{report['workers']} worker(s)) em {report['elapsed_seconds']}s"
+    )
+    print(
+        f"Crescimento: {report['growth_bytes'] / 1e6:.3f} MB; "
+        f"{report['bytes_per_ticket']:.1f} bytes/ticket (limite {max_bytes_per_ticket:g})"
+    )
+    rss = [p["rss_bytes"] for p in report["series"] if p["rss_bytes"] is not None]
+    if rss:
+        print(f"RSS: {rss[0] / 1e6:.1f} MB → {rss[-1] / 1e6:.1f} MB")
+    if report["top_growth"]:
+        print("Sítios de alocação que mais cresceram:")
+    for stat in report["top_growth"]:
+        print(
+            f"  +{stat['size_diff'] / 1024:.1f} KiB  +{stat['count_diff']} blocos  "
+            f"({stat['bytes_per_ticket']} B/ticket)  {stat['site'][0]}"
+        )
+        for frame in stat["site"][1:]:
+            print(f"      {frame}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Soak test de memória do M1 (tracemalloc).")
+    parser.add_argument("--tickets", type=int, default=5000, help="Tickets medidos")
+    parser.add_argument(
+        "--warmup", type=int, help="Tickets de aquecimento (default: M1_ANSWER_CACHE_SIZE + 500)"
+    )
+    parser.add_argument("--snapshots", type=int, default=10, help="Pontos de medição")
+    parser.add_argument("--workers", type=int, default=1, help="Threads concorrentes")
+    parser.add_argument(
+        "--frames", type=int, default=1, help="Profundidade das pilhas do tracemalloc"
+    )
+    parser.add_argument("--top", type=int, default=15, help="Sítios de alocação listados")
+    parser.add_argument(
+        "--max-bytes-per-ticket",
+        type=float,
+        default=512.0,
+        help="Falha (código 1) acima deste crescimento por ticket",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Mostra os prints dos nós")
+    parser.add_argument("--json", help="Grava o relatório completo neste arquivo")
+    args = parser.parse_args()
+
+    report = run_soak(
+        tickets=args.tickets,
+        warmup=args.warmup,
+        snapshots=args.snapshots,
+        workers=args.workers,
+        frames=args.frames,
+        top=args.top,
+        seed=args.seed,
+        quiet=not args.verbose,
+    )
+    _print_report(report, args.max_bytes_per_ticket)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["bytes_per_ticket"] > args.max_bytes_per_ticket:
+        print("FALHA: crescimento de memória por ticket acima do limite.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
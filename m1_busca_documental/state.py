@@ -23,26 +23,53 @@ class AgentState(TypedDict, total=False):
 
     Campos:
     - user_query: pergunta original do usuário (entrada do pipeline).
+    - ticket_id: identificador do chamado (thread_id do checkpoint em execuções em lote).
+    - priority: "interactive" (default) ou "batch"; prioridade na fila de chamadas à LLM
+      e classe no escalonamento do serviço (scheduler.py).
+    - deadline: prazo do ticket (epoch, segundos) na fila EDF do serviço.
+    - profile: True para perfilar este ticket (profiling.py), independente de M1_PROFILE_RATE.
     - doc_reference: sourceId do documento escolhido (API libindexr).
     - doc_references: lista de source_ids retornados pela API.
     - from_document: documentId/fromDocument do melhor resultado (API).
     - best_similarity_score: maior similarityScore do documento escolhido.
+    - document_ranking: documentos re-ranqueados (source_id, score combinado, max, mean, topk, lexical).
     - best_chunks_snippet: trecho opcional dos rawContent dos chunks (para exibição).
     - raw_text_content: conteúdo integral do documento lido da pasta local (fonte da verdade).
     - kb_id: identificador KB do documento (mapeado via n1_chamados).
     - retrieved_document: documento retornado ao usuário (kb_id, título, path, score, etc.).
     - final_response: resposta gerada pela LLM com base apenas no contexto.
-    - token_usage: uso de tokens da chamada LLM (input_tokens, output_tokens, total_tokens).
+    - token_usage: uso de tokens das chamadas LLM do ticket, somado entre escalonamento e
+      novas execuções do generate_answer (input_tokens, output_tokens, total_tokens).
     - error: mensagem de erro, se algum nó falhar (útil para debugging).
     - api_response: resposta bruta da API (opcional, para inspeção).
+    - retrieval_backend: origem do documento ("libindexr", "vector" no índice local,
+      "faq" no FAQ pré-computado, "keyword" no roteamento direto ou "local_lexical" no modo degradado).
+    - faq_question: pergunta canônica do FAQ pré-computado que respondeu o chamado.
+    - keyword_match: acerto do roteamento por palavra-chave (kb_id, termos, tipos).
+    - degraded: True se algum nó usou o modo degradado (circuito de libindexr/OpenAI aberto).
+    - model_tier: tier do modelo usado no generate_answer ("small" ou "large").
+    - llm_model: nome do modelo que produziu a resposta final.
+    - model_escalated: True se o modelo menor falhou no formato e a resposta veio do maior.
+    - context_source: origem do raw_text_content ("chunks" no caminho rápido ou "document").
+    - chunk_context_insufficient: True se a LLM classificou os trechos como INSUFICIENTE
+      (o grafo então lê o KB inteiro e gera a resposta de novo).
+    - retrieval_steps: passos da busca adaptativa (parâmetros, scores, segundos e motivo
+      de escalar), com M1_ADAPTIVE_RETRIEVAL=1.
+    - run_stats: segundos por nó, tokens somados e acertos de cache da execução
+      (analytics.py), com M1_ANALYTICS=1.
     """
 
     user_query: str
+    ticket_id: Optional[str]
+    priority: Optional[str]
+    deadline: Optional[float]
+    profile: Optional[bool]
     doc_reference: Optional[str]
     doc_references: Optional[List[Any]]
     from_document: Optional[str]
     best_similarity_score: Optional[float]
     best_chunks_snippet: Optional[str]
+    document_ranking: Optional[List[Dict[str, Any]]]
     raw_text_content: Optional[str]
     kb_id: Optional[str]
     retrieved_document: Optional[Dict[str, Any]]
@@ -54,3 +81,14 @@ class AgentState(TypedDict, total=False):
     is_suggestion: Optional[bool]
     needs_consultant: Optional[bool]
     status: Optional[str]
+    retrieval_backend: Optional[str]
+    keyword_match: Optional[Dict[str, Any]]
+    faq_question: Optional[str]
+    degraded: Optional[bool]
+    model_tier: Optional[str]
+    llm_model: Optional[str]
+    model_escalated: Optional[bool]
+    context_source: Optional[str]
+    chunk_context_insufficient: Optional[bool]
+    retrieval_steps: Optional[List[Dict[str, Any]]]
+    run_stats: Optional[Dict[str, Any]]
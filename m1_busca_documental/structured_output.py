@@ -0,0 +1,157 @@
+"""
+Saída estruturada e limitada do generate_answer — Módulo M1 N1 Chamados
+
+Com M1_STRUCTURED_OUTPUT=1, o generate_answer usa os prompts v4_json: a API
+recebe um response_format json_schema e devolve
+{"classification": ..., "source": ..., "answer": ...}. O JSON é lido aqui
+(orjson se instalado) e convertido para o formato de texto do v3
+("CLASSIFICACAO: X\\n\\nresposta"), então o restante do nó (parse,
+escalonamento, caminho rápido) não muda.
+
+Limites de saída por classificação (M1_OUTPUT_TOKEN_CAPS): nos dois formatos
+a classificação é a primeira coisa que o modelo escreve. A resposta é lida em
+streaming; assim que a classificação aparece, o limite dela passa a valer e a
+leitura é interrompida ao atingi-lo. O max_tokens da API é o maior dos limites.
+Um JSON cortado no limite é recuperado por regex (classificação e o trecho da
+resposta já recebido). RELEVANTE sem nenhum texto de resposta (corte logo após
+a classificação) vira INSUFICIENTE: não há o que entregar ao usuário.
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+
+    _loads: Callable[[Any], Any] = orjson.loads
+except ImportError:  # fallback para a biblioteca padrão
+    _loads = json.loads
+
+_TEXT_CLASSIFICATION_RE = re.compile(
+    r"CLASSIFICACAO:\s*(RELEVANTE|IRRELEVANTE|INSUFICIENTE)", re.IGNORECASE
+)
+_JSON_CLASSIFICATION_RE = re.compile(
+    r'"classification"\s*:\s*"(RELEVANTE|IRRELEVANTE|INSUFICIENTE)"', re.IGNORECASE
+)
+_JSON_SOURCE_RE = re.compile(r'"source"\s*:\s*"(\w+)"')
+_JSON_ANSWER_RE = re.compile(r'"answer"\s*:\s*"((?:[^"\\]|\\.)*)', re.DOTALL)
+# "\u" incompleto no fim (precedido de um número par de barras, que são escapes "\\")
+_PARTIAL_ESCAPE_RE = re.compile(r"(?<!\\)((?:\\\\)*)\\u[0-9a-fA-F]{0,3}$")
+
+# Sem classificação nos primeiros caracteres, o limite passa a ser o maior de todos
+_CLASSIFICATION_WINDOW_CHARS = 200
+
+SOURCE_LABELS = {
+    "DOCUMENTACAO": "FONTE: DOCUMENTAÇÃO",
+    "SUGESTAO_IA": "FONTE: SUGESTÃO IA",
+}
+
+
+def parse_token_caps(spec: str) -> Dict[str, int]:
+    """'RELEVANTE:600,IRRELEVANTE:250' → {"RELEVANTE": 600, "IRRELEVANTE": 250}."""
+    caps: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        label, _, value = item.partition(":")
+        if label.strip() and value.strip().isdigit() and int(value) > 0:
+            caps[label.strip().upper()] = int(value)
+    return caps
+
+
+def classification_of(content: str) -> Optional[str]:
+    """Classificação (maiúscula) no texto v3 ou no JSON, mesmo parcial; ou None."""
+    match = _JSON_CLASSIFICATION_RE.search(content or "") or _TEXT_CLASSIFICATION_RE.search(
+        content or ""
+    )
+    return match.group(1).upper() if match else None
+
+
+def output_cap_for(caps: Dict[str, int]) -> Optional[Callable[[str], Optional[int]]]:
+    """
+    Função output_cap para OpenAIIntegration.invoke: devolve o limite da
+    classificação assim que ela aparece no texto parcial. None se não há limites.
+    """
+    if not caps:
+        return None
+    largest = max(caps.values())
+
+    def _cap(partial: str) -> Optional[int]:
+        label = classification_of(partial)
+        if label is not None:
+            return caps.get(label, largest)
+        if len(partial) > _CLASSIFICATION_WINDOW_CHARS:
+            return largest
+        return None
+
+    return _cap
+
+
+def response_format_for(prompt_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """response_format json_schema (strict) a partir da chave json_schema do YAML."""
+    schema = prompt_config.get("json_schema")
+    if not schema:
+        return None
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": schema.get("name") or "m1_answer",
+            "strict": True,
+            "schema": schema["schema"],
+        },
+    }
+
+
+def _salvage(content: str) -> Optional[Dict[str, str]]:
+    """Recupera classificação/fonte/resposta de um JSON incompleto (cortado no limite)."""
+    label = classification_of(content)
+    if label is None:
+        return None
+    source = _JSON_SOURCE_RE.search(content)
+    answer = _JSON_ANSWER_RE.search(content)
+    text = ""
+    if answer:
+        raw = _PARTIAL_ESCAPE_RE.sub(r"\1", answer.group(1))
+        try:
+            text = json.loads('"' + raw + '"')
+        except ValueError:
+            text = raw
+    return {
+        "classification": label,
+        "source": source.group(1) if source else "",
+        "answer": text,
+    }
+
+
+def parse_structured(content: str) -> Optional[Dict[str, str]]:
+    """
+    Lê a resposta JSON. Retorna {"classification", "source", "answer", "complete"}
+    ou None se nem a classificação pôde ser lida.
+    """
+    try:
+        data = _loads(content)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and data.get("classification"):
+        parsed = {
+            "classification": str(data["classification"]).upper(),
+            "source": str(data.get("source") or ""),
+            "answer": str(data.get("answer") or ""),
+            "complete": True,
+        }
+    else:
+        salvaged = _salvage(content or "")
+        if salvaged is None:
+            return None
+        parsed = {**salvaged, "complete": False}
+    if parsed["classification"] == "RELEVANTE" and not parsed["answer"].strip():
+        parsed["classification"] = "INSUFICIENTE"
+    return parsed
+
+
+def structured_to_text(parsed: Dict[str, Any]) -> str:
+    """Converte a resposta estruturada para o formato de texto do prompt v3."""
+    answer = (parsed.get("answer") or "").strip()
+    label = SOURCE_LABELS.get((parsed.get("source") or "").upper())
+    if label and label not in answer:
+        answer = f"{answer}\n\n{label}" if answer else label
+    return f"CLASSIFICACAO: {parsed['classification']}\n\n{answer}"
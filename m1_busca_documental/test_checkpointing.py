@@ -0,0 +1,98 @@
+# m1_busca_documental/test_checkpointing.py
+"""
+Testes do serializer compacto dos checkpoints (checkpointing.py) — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_checkpointing.py
+"""
+
+import sys
+from pathlib import Path
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental.checkpointing import CompactStateSerializer
+from m1_busca_documental.chunk_context import build_chunk_context
+
+
+def _chunk(source_id, text, index):
+    return {"chunk": {"sourceId": source_id, "rawContent": text, "chunkIndex": index}}
+
+
+def _api_response():
+    return {
+        "results": [
+            {
+                "fromDocument": "KB0019150 Não Emissão de Cte - Causas",
+                "chunks": [
+                    {
+                        **_chunk("101", "Verifique o status da SEFAZ.", 2),
+                        "similarityScore": 0.82,
+                        "chunkChain": [
+                            _chunk("101", "Causas da não emissão.", 1),
+                            _chunk("101", "Reenvie o lote.", 3),
+                        ],
+                    }
+                ],
+            },
+            {
+                "fromDocument": "KB0018415 REJEIÇÃO 215",
+                "chunks": [
+                    {**_chunk("202", "x" * 2000, 0), "similarityScore": 0.41}
+                ],
+            },
+        ]
+    }
+
+
+def _checkpoint(api_response, doc_reference):
+    return {
+        "v": 1,
+        "id": "1",
+        "channel_values": {
+            "user_query": "cte não emite",
+            "doc_reference": doc_reference,
+            "api_response": api_response,
+        },
+    }
+
+
+def test_checkpoint_keeps_only_the_selected_document_chunks():
+    serializer = CompactStateSerializer()
+    original = _api_response()
+
+    restored = serializer.loads_typed(serializer.dumps_typed(_checkpoint(original, "101")))
+    response = restored["channel_values"]["api_response"]
+
+    # O outro documento (e os 2000 caracteres dele) não vai para o banco
+    assert [r["fromDocument"] for r in response["results"]] == [
+        "KB0019150 Não Emissão de Cte - Causas"
+    ]
+    # A cadeia de vizinhos sobrevive: o lote retomado monta o mesmo contexto
+    assert build_chunk_context(response, "101") == build_chunk_context(original, "101")
+    assert "Causas da não emissão." in build_chunk_context(response, "101")
+    assert restored["channel_values"]["user_query"] == "cte não emite"
+
+
+def test_checkpoint_without_selected_document_drops_api_response():
+    serializer = CompactStateSerializer()
+
+    for doc_reference in (None, "999"):
+        restored = serializer.loads_typed(
+            serializer.dumps_typed(_checkpoint(_api_response(), doc_reference))
+        )
+        assert restored["channel_values"]["api_response"] is None
+
+
+def test_large_checkpoints_are_compressed_and_round_trip():
+    serializer = CompactStateSerializer(compress_min_bytes=64)
+    checkpoint = _checkpoint(None, None)
+    checkpoint["channel_values"]["final_response"] = "Resposta longa. " * 100
+
+    type_, data = serializer.dumps_typed(checkpoint)
+
+    assert type_.startswith("z+")
+    assert serializer.loads_typed((type_, data)) == checkpoint
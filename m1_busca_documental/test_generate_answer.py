@@ -0,0 +1,83 @@
+# m1_busca_documental/test_generate_answer.py
+"""
+Testes da contabilidade de tokens do generate_answer — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_generate_answer.py
+"""
+
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental import config, nodes
+from m1_busca_documental.model_router import TIER_SMALL
+
+_STATE = {"user_query": "como emitir cte", "raw_text_content": "texto do KB", "kb_id": "KB0019150"}
+
+
+def _usage(tokens: int):
+    return {"input_tokens": tokens, "output_tokens": 1, "total_tokens": tokens + 1}
+
+
+def _generate(state, replies, tier=TIER_SMALL):
+    """generate_answer com a LLM trocada por `replies` (texto + uso, ou exceção)."""
+    replies = iter(replies)
+
+    def _fake_llm(state, model=None):
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(config, "OPENAI_API_KEY", "test"))
+        stack.enter_context(
+            mock.patch.object(nodes, "choose_model_tier", lambda s: {"tier": tier, "model": "m"})
+        )
+        stack.enter_context(mock.patch.object(nodes, "record_outcome", lambda *a: None))
+        stack.enter_context(mock.patch.object(nodes, "_call_llm_for_answer", _fake_llm))
+        stack.enter_context(mock.patch.object(nodes.answer_cache, "put_answer", lambda *a: None))
+        return nodes.generate_answer(state)
+
+
+def test_failed_escalation_keeps_small_model_usage():
+    """O modelo menor já foi pago: a falha do maior não zera o token_usage."""
+    result = _generate(_STATE, [("saída fora do formato", _usage(100)), TimeoutError("lento")])
+
+    assert result["model_escalated"] is True
+    assert result["is_kb_relevant"] is False
+    assert result["error"].startswith("Erro ao gerar resposta com a LLM")
+    assert result["token_usage"] == _usage(100)
+
+
+def test_escalation_sums_both_calls():
+    result = _generate(
+        _STATE,
+        [("saída fora do formato", _usage(100)), ("CLASSIFICACAO: RELEVANTE\n\nok", _usage(300))],
+    )
+
+    assert result["is_kb_relevant"] is True
+    assert result["token_usage"] == {"input_tokens": 400, "output_tokens": 2, "total_tokens": 402}
+
+
+def test_insufficient_chunks_rerun_accumulates_usage():
+    """Trechos INSUFICIENTE → o grafo gera de novo com o KB inteiro; as duas execuções contam."""
+    first = _generate(
+        {**_STATE, "context_source": "chunks"},
+        [("CLASSIFICACAO: INSUFICIENTE\n\nfaltam dados", _usage(50))],
+    )
+    assert first["chunk_context_insufficient"] is True
+
+    second = _generate(
+        {**_STATE, **first, "context_source": "document"},
+        [("CLASSIFICACAO: RELEVANTE\n\nresposta", _usage(500))],
+    )
+
+    assert second["token_usage"] == {"input_tokens": 550, "output_tokens": 2, "total_tokens": 552}
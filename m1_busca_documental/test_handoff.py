@@ -0,0 +1,89 @@
+# m1_busca_documental/test_handoff.py
+"""
+Testes da fila de hand-off: lease vencido, novas tentativas com backoff e
+itens mortos — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_handoff.py
+"""
+
+import sys
+from pathlib import Path
+from unittest import mock
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental import handoff
+from m1_busca_documental.handoff import HandoffQueue, _retry_delay, deliver_batch
+
+
+def _queue(tmp_path, max_attempts=3):
+    return HandoffQueue(str(tmp_path / "handoff.db"), max_attempts=max_attempts)
+
+
+def test_expired_lease_returns_the_item_to_the_queue(tmp_path):
+    queue = _queue(tmp_path)
+    item_id = queue.enqueue("forward_to_user", {"ticket_id": "T1"}, now=100.0)
+
+    # Um processo reserva o item e morre sem ack/nack
+    assert [row["id"] for row in queue.claim(10, now=100.0, lease_seconds=30)] == [item_id]
+    assert queue.stats()["inflight"] == 1
+    # Lease ainda válido: ninguém mais leva o item
+    assert queue.claim(10, now=129.0, lease_seconds=30) == []
+    # Lease vencido: volta a "pending" e é reservado de novo, sem contar tentativa
+    rows = queue.claim(10, now=130.0, lease_seconds=30)
+    assert [row["id"] for row in rows] == [item_id]
+    assert rows[0]["attempts"] == 0
+    queue.close()
+
+
+def test_refused_items_are_retried_with_backoff(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("forward_to_user", {"ticket_id": "OK"}, now=0.0)
+    refused_id = queue.enqueue("forward_to_attendant", {"ticket_id": "NO"}, now=0.0)
+
+    def sink(items):
+        return [item["delivery_id"] for item in items if item["ticket_id"] == "NO"]
+
+    with mock.patch.object(handoff.time, "time", return_value=1000.0):
+        assert deliver_batch(queue, sink, batch_size=10) == 2
+    # O aceito saiu da fila; o recusado voltou com uma tentativa e backoff
+    assert queue.stats()["pending"] == 1
+    assert queue.claim(10, now=1000.0 + _retry_delay(1) - 0.1) == []
+    rows = queue.claim(10, now=1000.0 + _retry_delay(1))
+    assert [row["id"] for row in rows] == [refused_id]
+    assert rows[0]["attempts"] == 1
+
+    # Falha do lote inteiro (exceção): backoff dobra na segunda tentativa
+    queue.nack(rows, "ConnectionError: fora do ar", now=2000.0)
+    assert _retry_delay(2) == 2 * _retry_delay(1)
+    assert queue.claim(10, now=2000.0 + _retry_delay(1)) == []
+    assert [row["attempts"] for row in queue.claim(10, now=2000.0 + _retry_delay(2))] == [2]
+    queue.close()
+
+
+def test_item_goes_dead_after_max_attempts_and_retry_dead_revives_it(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    item_id = queue.enqueue("forward_to_user", {"ticket_id": "T1"}, now=0.0)
+
+    def failing_sink(items):
+        raise ConnectionError("fora do ar")
+
+    with mock.patch.object(handoff.time, "time", return_value=10.0):
+        deliver_batch(queue, failing_sink)
+    assert queue.stats()["pending"] == 1
+    with mock.patch.object(handoff.time, "time", return_value=10.0 + _retry_delay(1)):
+        deliver_batch(queue, failing_sink)
+
+    stats = queue.stats()
+    assert (stats["pending"], stats["inflight"], stats["dead"]) == (0, 0, 1)
+    # Morto não é mais reservado, nem depois de qualquer backoff
+    assert queue.claim(10, now=1e12) == []
+
+    assert queue.retry_dead() == 1
+    rows = queue.claim(10)
+    assert [(row["id"], row["attempts"]) for row in rows] == [(item_id, 0)]
+    queue.close()
@@ -0,0 +1,91 @@
+# m1_busca_documental/test_kb_dedup.py
+"""
+Testes da deduplicação dos KBs (kb_dedup.py) — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_kb_dedup.py
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental.kb_dedup import scan
+
+_TEXT = (
+    "Para redefinir a senha do portal acesse a página de login clique em esqueci "
+    "minha senha e siga as instruções enviadas para o e-mail cadastrado no sistema"
+)
+
+
+def _write(folder: Path, name: str, text: str) -> None:
+    (folder / name).write_text(text, encoding="utf-8")
+
+
+def test_short_documents_keep_their_own_kb(tmp_path):
+    """Textos vazios, só espaços ou menores que um shingle não se juntam entre KBs."""
+    _write(tmp_path, "KB0000001 Vazio.txt", "")
+    _write(tmp_path, "KB0000002 Espacos.txt", "   \n\t  \n")
+    _write(tmp_path, "KB0000003 Curto.txt", "Ver anexo")
+    _write(tmp_path, "KB0000004 Curto.txt", "Ver anexo")
+
+    manifest = scan(str(tmp_path), shingle_size=5)
+
+    assert manifest["canonical"] == {
+        "KB0000001": "KB0000001 Vazio.txt",
+        "KB0000002": "KB0000002 Espacos.txt",
+        "KB0000003": "KB0000003 Curto.txt",
+        "KB0000004": "KB0000004 Curto.txt",
+    }
+    assert manifest["duplicates"] == {}
+    assert len(manifest["too_short"]) == 4
+
+
+def test_short_document_groups_with_own_versions(tmp_path):
+    """Um texto vazio ainda é substituído pela versão mais nova do mesmo código."""
+    _write(tmp_path, "KB0000001 Senha.txt", "")
+    _write(tmp_path, "KB0000001 Senha (1).txt", _TEXT)
+    _write(tmp_path, "KB0000002 Senha.txt", _TEXT)
+    _write(tmp_path, "KB0000003 Vazio.txt", "")
+
+    manifest = scan(str(tmp_path), shingle_size=5)
+
+    assert manifest["canonical"]["KB0000003"] == "KB0000003 Vazio.txt"
+    assert manifest["reasons"]["KB0000001 Senha.txt"] == "superseded"
+    assert manifest["reasons"]["KB0000002 Senha.txt"] == "near_duplicate"
+    assert "KB0000003 Vazio.txt" not in manifest["duplicates"]
+    assert manifest["canonical"]["KB0000001"] == "KB0000001 Senha (1).txt"
+
+
+def test_near_duplicate_kbs_keep_their_own_canonical(tmp_path):
+    """Dois KBs quase iguais, cada um com duas versões: cada código fica com a sua."""
+    for i, name in enumerate(
+        (
+            "KB0000001 Senha (1).txt",
+            "KB0000001 Senha (2).txt",
+            "KB0000002 Senha portal (1).txt",
+            "KB0000002 Senha portal (2).txt",
+        )
+    ):
+        _write(tmp_path, name, _TEXT + (" revisado" if "(2)" in name else ""))
+        os.utime(tmp_path / name, (1_000_000 + i, 1_000_000 + i))
+
+    manifest = scan(str(tmp_path), shingle_size=5)
+
+    assert manifest["canonical"] == {
+        "KB0000001": "KB0000001 Senha (2).txt",
+        "KB0000002": "KB0000002 Senha portal (2).txt",
+    }
+    assert manifest["reasons"] == {
+        "KB0000001 Senha (1).txt": "superseded",
+        "KB0000002 Senha portal (1).txt": "superseded",
+        "KB0000001 Senha (2).txt": "near_duplicate",
+    }
+    assert manifest["duplicates"]["KB0000001 Senha (1).txt"] == "KB0000001 Senha (2).txt"
+    assert manifest["duplicates"]["KB0000002 Senha portal (1).txt"] == "KB0000002 Senha portal (2).txt"
+    assert manifest["duplicates"]["KB0000001 Senha (2).txt"] == "KB0000002 Senha portal (2).txt"
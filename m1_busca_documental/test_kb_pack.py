@@ -0,0 +1,103 @@
+# m1_busca_documental/test_kb_pack.py
+"""
+Testes do acervo empacotado (kb_pack.py): update por acréscimo, compactação e
+leitura pelo fetch_local_document com M1_KB_STORE=pack — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_kb_pack.py
+"""
+
+import os
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental import metrics, nodes
+from m1_busca_documental.kb_pack import KbPack, compact_pack, update_pack
+
+_LONG = "Passo a passo para consultar a expansão do material no centro. " * 40
+_SHORT = "Rejeição 215: confira a data de validade e de fabricação do lote."
+
+
+def _write(path: Path, text: str, mtime: float) -> None:
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def _docs(tmp_path: Path) -> Path:
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    _write(docs / "KB0034986 Expansão do material.txt", _LONG, 1000)
+    _write(docs / "KB0018415 REJEIÇÃO 215.txt", _SHORT, 1000)
+    return docs
+
+
+def test_update_appends_changed_kbs_to_the_current_pack(tmp_path):
+    docs, pack_dir = _docs(tmp_path), str(tmp_path / "pack")
+    first = update_pack(str(docs), pack_dir)
+    assert (first["added"], first["generation"], first["dead_bytes"]) == (2, 0, 0)
+
+    _write(docs / "KB0018415 REJEIÇÃO 215.txt", _SHORT + " Reenvie a nota.", 2000)
+    second = update_pack(str(docs), pack_dir)
+
+    # Mesmo arquivo de pack (mesma geração), com o blob novo no fim e o antigo morto
+    assert (second["updated"], second["unchanged"], second["compacted"]) == (1, 1, False)
+    assert second["generation"] == 0
+    appended = len((_SHORT + " Reenvie a nota.").encode())
+    assert second["pack_bytes"] == first["pack_bytes"] + appended
+    assert second["dead_bytes"] == len(_SHORT.encode())
+    pack = KbPack(pack_dir)
+    assert pack.get_text("KB0018415") == _SHORT + " Reenvie a nota."
+    assert pack.get_text("KB0034986") == _LONG
+
+    # Sem mudanças: nada é regravado
+    third = update_pack(str(docs), pack_dir)
+    assert (third["unchanged"], third["pack_bytes"]) == (2, second["pack_bytes"])
+
+
+def test_compaction_drops_dead_space_in_a_new_generation(tmp_path):
+    docs, pack_dir = _docs(tmp_path), str(tmp_path / "pack")
+    update_pack(str(docs), pack_dir, compress=True)
+    (docs / "KB0018415 REJEIÇÃO 215.txt").unlink()
+    _write(docs / "KB0034986 Expansão do material.txt", _LONG + "Fim.", 2000)
+
+    # O KB grande mudou: o espaço morto passa de metade e o update compacta sozinho
+    stats = update_pack(str(docs), pack_dir, compress=True)
+    assert (stats["removed"], stats["updated"], stats["compacted"]) == (1, 1, True)
+    assert (stats["generation"], stats["dead_bytes"], stats["kbs"]) == (1, 0, 1)
+    assert stats["compressed"] == 1
+    assert sorted(os.listdir(pack_dir)) == ["index.json", "kb-000001.pack"]
+    assert KbPack(pack_dir).get_text("KB0034986") == _LONG + "Fim."
+
+    # Compactar de novo só troca a geração
+    again = compact_pack(pack_dir)
+    assert (again["generation"], again["dead_bytes"]) == (2, 0)
+    assert KbPack(pack_dir).get_text("KB0034986") == _LONG + "Fim."
+
+
+def test_fetch_local_document_reads_from_the_pack(tmp_path):
+    docs, pack_dir = _docs(tmp_path), str(tmp_path / "pack")
+    update_pack(str(docs), pack_dir)
+    # O .txt muda depois do update: o texto servido é o do pack
+    _write(docs / "KB0018415 REJEIÇÃO 215.txt", "texto novo ainda fora do pack", 3000)
+
+    db = mock.Mock()
+    db.get_by_source_id.return_value = [{"source_id": "215", "kb_id": "KB0018415"}]
+    before = metrics.get_counter("kb_store_reads", store="pack")
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(nodes, "KB_STORE", "pack"))
+        stack.enter_context(mock.patch.object(nodes, "DOCS_REPO_PATH", str(docs)))
+        stack.enter_context(mock.patch.object(nodes, "get_kb_pack", lambda: KbPack(pack_dir)))
+        stack.enter_context(mock.patch.object(nodes, "_get_n1_db", lambda: db))
+        result = nodes.fetch_local_document({"doc_reference": "215"})
+
+    assert result["error"] is None
+    assert result["raw_text_content"] == _SHORT
+    assert result["retrieved_document"]["doc_path"] == str(docs / "KB0018415 REJEIÇÃO 215.txt")
+    assert metrics.get_counter("kb_store_reads", store="pack") == before + 1
@@ -0,0 +1,37 @@
+# m1_busca_documental/test_keyword_router.py
+"""
+Testes do roteamento por palavra-chave (keyword_router.py e o desvio no grafo)
+— M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_keyword_router.py
+"""
+
+import sys
+from pathlib import Path
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental.config import DOCS_REPO_PATH, KB_ALIASES_PATH
+from m1_busca_documental.graph import decide_next_node
+from m1_busca_documental.keyword_router import build_matcher, match_kb
+
+
+def test_generic_cte_question_is_not_routed():
+    """Uma pergunta qualquer sobre CT-e não vai direto ao KB de não emissão."""
+    matcher = build_matcher(DOCS_REPO_PATH, KB_ALIASES_PATH)
+    assert not match_kb("qual o prazo de carta de correção de CTe", matcher)["confident"]
+    hit = match_kb("o sistema não emite CTe desde ontem", matcher)
+    assert hit["confident"] and hit["kb_id"] == "KB0019150"
+
+
+def test_irrelevant_keyword_answer_falls_back_to_search():
+    state = {"retrieval_backend": "keyword", "is_kb_relevant": False, "context_source": "document"}
+    assert decide_next_node(state) == "call_libindexr"
+    assert decide_next_node({**state, "is_kb_relevant": True}) == "forward_to_user"
+    # Falha da LLM ou da busca não repete o ciclo
+    assert decide_next_node({**state, "error": "timeout"}) == "forward_to_attendant"
+    assert decide_next_node({**state, "retrieval_backend": "libindexr"}) == "forward_to_attendant"
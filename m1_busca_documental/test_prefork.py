@@ -0,0 +1,48 @@
+# m1_busca_documental/test_prefork.py
+"""
+Testes do runner multiprocesso (prefork.py) — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_prefork.py
+"""
+
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+from unittest import mock
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental import prefork
+
+
+def _fake_invoke(state, graph):
+    """Grafo falso: o ticket "crash" derruba o worker como um OOM kill."""
+    if state["ticket_id"] == "crash":
+        os.kill(os.getpid(), signal.SIGKILL)
+    time.sleep(0.05)
+    return {"user_query": state["user_query"], "status": "forwarded_to_user"}
+
+
+def test_dead_worker_does_not_hang_the_parent():
+    tickets = [{"ticket_id": str(i), "user_query": f"pergunta {i}"} for i in range(8)]
+    tickets.insert(3, {"ticket_id": "crash", "user_query": "derruba"})
+
+    with mock.patch.object(prefork, "invoke_coalesced", _fake_invoke), mock.patch.object(
+        prefork, "_POLL_SECONDS", 0.1
+    ):
+        runner = prefork.PreforkRunner(workers=2)
+        start = time.monotonic()
+        rows = {row["ticket_id"]: row for row in runner.run(tickets)}
+
+    assert time.monotonic() - start < 30
+    assert sorted(rows) == sorted(t["ticket_id"] for t in tickets)
+    assert "Worker morreu" in rows["crash"]["error"]
+    assert all(rows[str(i)]["status"] == "forwarded_to_user" for i in range(8))
+    # O substituto do worker morto e o outro worker ainda entregam as métricas
+    assert len(runner.worker_metrics) == 2
@@ -0,0 +1,76 @@
+# m1_busca_documental/test_rerank.py
+"""
+Testes do re-ranking local (rerank.py) e da validação dos pesos — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_rerank.py
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental import config
+from m1_busca_documental.rerank import rerank_documents
+
+
+def _response(scores_by_doc):
+    return {
+        "results": [
+            {
+                "fromDocument": f"Documento {source_id}",
+                "chunks": [
+                    {"chunk": {"sourceId": source_id, "rawContent": ""}, "similarityScore": s}
+                    for s in scores
+                ],
+            }
+            for source_id, scores in scores_by_doc.items()
+        ]
+    }
+
+
+@pytest.mark.parametrize("raw", ["0.5,0.15,0.25", "0.5,0.15,0.25,0.1,0.2", "0.5,a,0.25,0.1"])
+def test_bad_weights_fail_when_config_loads(raw):
+    env = {**os.environ, "M1_RERANK_WEIGHTS": raw}
+    proc = subprocess.run(
+        [sys.executable, "-c", "import m1_busca_documental.config"],
+        cwd=str(_root),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode != 0
+    assert "M1_RERANK_WEIGHTS" in proc.stderr
+
+
+def test_empty_weights_use_the_default(monkeypatch):
+    monkeypatch.setenv("M1_RERANK_WEIGHTS", "")
+    assert config._env_floats("M1_RERANK_WEIGHTS", "0.5,0.15,0.25,0.1", 4) == (0.5, 0.15, 0.25, 0.1)
+
+
+def test_wrong_number_of_weights_is_rejected():
+    with pytest.raises(ValueError, match="4 pesos"):
+        rerank_documents(_response({"1": [0.9]}), "cte", weights=(1.0, 0.0, 0.0))
+
+
+def test_topk_is_the_sum_of_the_best_k_chunks():
+    # Um chunk "sortudo" contra três chunks fortes; com k=3 os que faltam contam 0
+    response = _response({"1": [0.9], "2": [0.6, 0.6, 0.6, 0.1]})
+
+    ranking = rerank_documents(response, "", weights=(0.0, 0.0, 1.0, 0.0), top_k=3)
+
+    assert [doc["source_id"] for doc in ranking] == ["2", "1"]
+    by_id = {doc["source_id"]: doc for doc in ranking}
+    assert by_id["2"]["topk"] == pytest.approx((0.6 + 0.6 + 0.6) / 3)
+    assert by_id["1"]["topk"] == pytest.approx(0.9 / 3)
+    # A média premiaria o chunk sortudo; o top-k não
+    assert by_id["1"]["mean"] > by_id["2"]["mean"]
+    assert by_id["2"]["n_chunks"] == 4
@@ -0,0 +1,89 @@
+# m1_busca_documental/test_scheduler.py
+"""
+Testes do escalonador por prazo (scheduler.py) — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_scheduler.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from m1_busca_documental import metrics
+from m1_busca_documental.profiling import instrument
+from m1_busca_documental.scheduler import TicketScheduler
+from m1_busca_documental.singleflight import SingleFlight
+
+# "Nó" do grafo: fronteira de preempção (profiling.instrument chama checkpoint())
+_node = instrument("test_node", lambda state: time.sleep(0.02) or {})
+
+
+def _graph(flight: SingleFlight, key: str, nodes: int):
+    """Execução coalescida de `nodes` nós, como invoke_coalesced."""
+
+    def _run():
+        for _ in range(nodes):
+            _node({})
+        return key
+
+    return lambda: flight.do(key, _run)
+
+
+def test_preempted_leader_resumes_for_follower():
+    """
+    Lote líder de uma coalescência parado por preempção e um interativo com a
+    mesma chave recebendo a vaga: o líder tem de voltar, senão os dois travam.
+    """
+    flight = SingleFlight("test_graph")
+    scheduler = TicketScheduler(workers=1, max_queue=5, preempt_wait_seconds=0.05, max_paused=1)
+    before = metrics.get_counter("scheduler_priority_inheritance")
+    batch = scheduler.submit(_graph(flight, "mesma pergunta", 30), priority="batch")
+    time.sleep(0.05)
+    interactive = scheduler.submit(_graph(flight, "mesma pergunta", 30), priority="interactive")
+
+    assert interactive.result(timeout=5) == "mesma pergunta"
+    assert batch.result(timeout=5) == "mesma pergunta"
+    assert metrics.get_counter("scheduler_priority_inheritance") == before + 1
+    stats = scheduler.stats()
+    assert stats["free"] == 1 and stats["paused"] == 0
+    scheduler.shutdown()
+
+
+def test_batch_without_followers_is_preempted():
+    """Sem seguidoras, o lote ainda cede a vaga a um interativo de outra chave."""
+    flight = SingleFlight("test_graph")
+    scheduler = TicketScheduler(workers=1, max_queue=5, preempt_wait_seconds=0.05, max_paused=1)
+    before = metrics.get_counter("scheduler_preemptions")
+    batch = scheduler.submit(_graph(flight, "lote", 30), priority="batch")
+    time.sleep(0.05)
+    start = time.monotonic()
+    interactive = scheduler.submit(_graph(flight, "interativo", 1), priority="interactive")
+
+    assert interactive.result(timeout=5) == "interativo"
+    assert time.monotonic() - start < 0.3
+    assert batch.result(timeout=5) == "lote"
+    assert metrics.get_counter("scheduler_preemptions") >= before + 1
+    scheduler.shutdown()
+
+
+def test_max_paused_zero_disables_preemption():
+    """max_paused=0 desliga a preempção (não vira o número de workers)."""
+    flight = SingleFlight("test_graph")
+    scheduler = TicketScheduler(workers=1, max_queue=5, preempt_wait_seconds=0.01, max_paused=0)
+    assert scheduler.max_paused == 0
+    before = metrics.get_counter("scheduler_preemptions")
+    batch = scheduler.submit(_graph(flight, "lote", 10), priority="batch")
+    time.sleep(0.05)
+    interactive = scheduler.submit(_graph(flight, "interativo", 1), priority="interactive")
+
+    assert batch.result(timeout=5) == "lote"
+    assert interactive.result(timeout=5) == "interativo"
+    assert metrics.get_counter("scheduler_preemptions") == before
+    assert TicketScheduler(workers=3, max_paused=None).max_paused == 3
+    scheduler.shutdown()
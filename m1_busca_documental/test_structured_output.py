@@ -0,0 +1,101 @@
+# m1_busca_documental/test_structured_output.py
+"""
+Testes da saída limitada (streaming com corte) e da recuperação de JSON
+cortado — M1 N1 Chamados
+
+Uso:
+  python -m pytest -q m1_busca_documental/test_structured_output.py
+"""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# Garante que a raiz do projeto está no path
+_root = Path(__file__).resolve().parent.parent
+if str(_root) not in sys.path:
+    sys.path.insert(0, str(_root))
+
+from integrations.openai import _stream_with_cap
+from m1_busca_documental import nodes
+from m1_busca_documental.structured_output import (
+    output_cap_for,
+    parse_structured,
+    structured_to_text,
+)
+
+
+class _FakeStream:
+    """Stream do ChatOpenAI: entrega os pedaços e registra quantos foram lidos."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.read += 1
+            yield SimpleNamespace(content=piece)
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeLLM:
+    def __init__(self, pieces):
+        self.stream_obj = _FakeStream(pieces)
+
+    def stream(self, messages, **kwargs):
+        return self.stream_obj
+
+
+def test_capped_stream_stops_at_the_classification_cap():
+    pieces = ['{"classification": "IRRELEVANTE", ', '"source": "DOCUMENTACAO", ', '"answer": "a']
+    pieces += ["b"] * 50
+    llm = _FakeLLM(pieces)
+    cap = output_cap_for({"RELEVANTE": 20, "IRRELEVANTE": 5})
+
+    message = _stream_with_cap(llm, [], {}, cap)
+
+    assert llm.stream_obj.read == 5
+    assert llm.stream_obj.closed
+    assert message.content == "".join(pieces[:5])
+    parsed = parse_structured(message.content)
+    assert parsed == {
+        "classification": "IRRELEVANTE",
+        "source": "DOCUMENTACAO",
+        "answer": "abb",
+        "complete": False,
+    }
+
+
+def test_salvaged_relevant_with_partial_answer_stays_relevant():
+    parsed = parse_structured(
+        '{"classification": "RELEVANTE", "source": "DOCUMENTACAO", "answer": "Acesse o menu'
+    )
+
+    assert parsed["classification"] == "RELEVANTE"
+    is_relevant, text = nodes._parse_llm_response(structured_to_text(parsed))
+    assert is_relevant
+    assert text.startswith("Acesse o menu")
+
+
+def test_salvaged_relevant_without_answer_is_not_relevant():
+    # Cortado logo depois da fonte: nenhum texto de resposta chegou
+    for content in (
+        '{"classification": "RELEVANTE", "source": "DOCUMENTACAO", "ans',
+        '{"classification": "RELEVANTE", "source": "DOCUMENTACAO", "answer": "  ',
+    ):
+        parsed = parse_structured(content)
+        assert parsed["classification"] == "INSUFICIENTE"
+        is_relevant, _ = nodes._parse_llm_response(structured_to_text(parsed))
+        assert not is_relevant
+
+
+def test_text_answer_cut_after_the_classification_is_not_relevant():
+    for content in ("CLASSIFICACAO: RELEVANTE", "CLASSIFICACAO: RELEVANTE\n\n"):
+        is_relevant, text = nodes._parse_llm_response(content)
+        assert not is_relevant
+        assert text == ""
+        assert not nodes._is_well_formed_response(content)
@@ -0,0 +1,40 @@
+"""
+Normalização de texto — Módulo M1 N1 Chamados
+
+Perguntas de chamados chegam com variações irrelevantes para a busca
+(maiúsculas, acentos, espaços e pontuação no fim). normalize_query() reduz a
+pergunta a uma forma canônica, usada como chave de deduplicação e de cache.
+"""
+
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s?!.,;:]+$")
+
+
+def strip_accents(text: str) -> str:
+    """
+    Remove acentos (ex.: 'expansão' -> 'expansao').
+
+    Decompõe em NFKD e descarta tudo o que não é ASCII (marcas de acento e
+    símbolos tipográficos como aspas curvas). Tudo roda em C, o que importa
+    quando o texto é um chunk ou documento inteiro e não só a pergunta.
+    """
+    if text.isascii():
+        return text
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Forma canônica da pergunta: minúsculas, sem acentos, espaços colapsados
+    e sem pontuação final.
+
+    Ex.: '  Como consultar  EXPANSÃO? ' -> 'como consultar expansao'
+    """
+    if not text:
+        return ""
+    normalized = strip_accents(text).casefold()
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip()
+    return _TRAILING_PUNCT_RE.sub("", normalized)
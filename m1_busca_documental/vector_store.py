@@ -0,0 +1,510 @@
+"""
+Índice vetorial local (offline) — Módulo M1 N1 Chamados
+
+Alternativa ao libindexr para réplicas sem acesso à rede: os .txt de
+DOCS_REPO_PATH são quebrados em chunks, embutidos por uma função de embedding
+local e gravados em disco como
+
+    manifest.json               dimensão, nº de chunks, embedder, partições e a
+                                pasta da geração atual (data_dir)
+    gen-<geração>/embeddings.f32  matriz float32 (n_chunks x dim), lida com np.memmap
+    gen-<geração>/chunks.jsonl    metadados de cada linha da matriz (kb_id, título, texto)
+    gen-<geração>/centroids.npy   (opcional) centróides das partições IVF
+
+Cada build grava uma pasta de geração nova e só no fim troca o manifest
+(arquivo .tmp + rename), que é o único ponteiro para os dados: um leitor vê a
+geração antiga inteira ou a nova inteira. A geração anterior é mantida para os
+processos que ainda a leem; as mais antigas são apagadas.
+
+A busca é exata (produto interno em blocos da matriz mapeada em memória, com
+top-k por argpartition). Para acervos grandes, --partitions N agrupa os chunks
+em N partições (k-means esférico); a consulta só varre as M1_VECTOR_NPROBE
+partições mais próximas. As linhas da matriz ficam ordenadas por partição,
+então cada partição é uma fatia contígua do arquivo.
+
+VectorStore.query() devolve o mesmo formato da resposta do libindexr
+(results[] com fromDocument e chunks[]), para que o call_libindexr reutilize
+a mesma seleção de documento (re-ranking ou melhor chunk).
+
+Embedding: por padrão, hashing de termos e bigramas (sem dependências nem
+modelo). Outra função pode ser plugada com M1_VECTOR_EMBEDDER="modulo:funcao";
+ela recebe uma lista de textos e devolve uma matriz (n x dim).
+
+Uso:
+  python -m m1_busca_documental.vector_store build [--docs PASTA] [--out PASTA] [--partitions N]
+  python -m m1_busca_documental.vector_store search "como consultar expansão" [--top-k 5]
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Garante que a raiz do projeto está no path
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+from m1_busca_documental import metrics
+from m1_busca_documental.config import (
+    DOCS_REPO_PATH,
+    VECTOR_CHUNK_CHARS,
+    VECTOR_CHUNK_OVERLAP,
+    VECTOR_DIM,
+    VECTOR_EMBEDDER,
+    VECTOR_INDEX_DIR,
+    VECTOR_NPROBE,
+)
+from m1_busca_documental.kb_catalog import kb_title, list_kb_files, read_kb_text
+from m1_busca_documental.local_search import tokenize
+
+EmbedFn = Callable[[Sequence[str]], np.ndarray]
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.f32"
+CHUNKS_FILE = "chunks.jsonl"
+CENTROIDS_FILE = "centroids.npy"
+_GENERATION_PREFIX = "gen-"
+
+# Linhas da matriz multiplicadas por vez na busca (limita a memória temporária)
+_SEARCH_BLOCK_ROWS = 65536
+_KMEANS_ITERATIONS = 15
+
+
+# ---------------------------------------------------------------------------
+# Embedding
+# ---------------------------------------------------------------------------
+def hashing_embedder(texts: Sequence[str], dim: int = VECTOR_DIM) -> np.ndarray:
+    """
+    Embedding local por feature hashing: termos e bigramas (já normalizados e sem
+    stopwords) são espalhados em `dim` posições com sinal, peso 1 + log(tf), e o
+    vetor é normalizado (L2). Usa crc32, estável entre processos.
+    """
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        tokens = tokenize(text)
+        features = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+        counts: Dict[str, int] = {}
+        for f in features:
+            counts[f] = counts.get(f, 0) + 1
+        for f, n in counts.items():
+            h = zlib.crc32(f.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            matrix[i, h % dim] += sign * (1.0 + np.log(n))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def load_embedder(spec: str = VECTOR_EMBEDDER) -> Tuple[str, EmbedFn]:
+    """
+    Resolve a função de embedding: "" → hashing_embedder; "pacote.modulo:funcao" →
+    a função importada. Retorna (nome, função); o nome fica no manifest para
+    impedir buscas com um embedder diferente do usado na construção.
+    """
+    if not spec:
+        return f"hashing-{VECTOR_DIM}", hashing_embedder
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"M1_VECTOR_EMBEDDER deve ter o formato 'modulo:funcao' (recebido: {spec!r}).")
+    return spec, getattr(importlib.import_module(module_name), attr)
+
+
+def _embed(embedder: EmbedFn, texts: Sequence[str]) -> np.ndarray:
+    """Chama o embedder e garante matriz float32 com linhas normalizadas."""
+    matrix = np.asarray(embedder(list(texts)), dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(texts):
+        raise ValueError("O embedder deve devolver uma matriz (n_textos x dim).")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+# ---------------------------------------------------------------------------
+# Construção do índice
+# ---------------------------------------------------------------------------
+def chunk_text(
+    text: str, size: int = VECTOR_CHUNK_CHARS, overlap: int = VECTOR_CHUNK_OVERLAP
+) -> List[Tuple[int, str]]:
+    """
+    Quebra o texto em chunks de até `size` caracteres, respeitando parágrafos
+    quando possível. Parágrafos maiores que `size` são cortados em janelas com
+    `overlap` caracteres de sobreposição. Retorna [(offset, texto)].
+    """
+    chunks: List[Tuple[int, str]] = []
+    start: Optional[int] = None
+    end = 0
+    pos = 0
+    for paragraph in text.split("\n\n"):
+        p_start, p_end = pos, pos + len(paragraph)
+        pos = p_end + 2
+        if not paragraph.strip():
+            continue
+        if len(paragraph) > size:
+            if start is not None:
+                chunks.append((start, text[start:end]))
+                start = None
+            step = max(1, size - overlap)
+            for offset in range(p_start, p_end, step):
+                chunks.append((offset, text[offset : min(offset + size, p_end)]))
+                if offset + size >= p_end:
+                    break
+            continue
+        if start is not None and p_end - start > size:
+            chunks.append((start, text[start:end]))
+            start = None
+        if start is None:
+            start = p_start
+        end = p_end
+    if start is not None:
+        chunks.append((start, text[start:end]))
+    return [(offset, chunk.strip()) for offset, chunk in chunks if chunk.strip()]
+
+
+def _spherical_kmeans(
+    matrix: np.ndarray, k: int, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """k-means com similaridade de cosseno. Retorna (centróides, partição de cada linha)."""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), size=k, replace=False)].copy()
+    assignment = np.zeros(len(matrix), dtype=np.int64)
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        for c in range(k):
+            members = matrix[assignment == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                centroids[c] = centroid / norm if norm > 0 else centroid
+    return centroids, assignment
+
+
+def build_index(
+    docs_path: str = DOCS_REPO_PATH,
+    index_dir: str = VECTOR_INDEX_DIR,
+    partitions: int = 0,
+    batch_size: int = 256,
+) -> Dict[str, Any]:
+    """
+    Constrói o índice em `index_dir` e devolve o manifest.
+
+    Os dados vão para uma pasta de geração nova; o manifest, gravado por último
+    com um único rename, passa a apontar para ela. Um processo lendo o índice
+    antigo nunca vê arquivos de gerações diferentes misturados.
+    """
+    embedder_name, embedder = load_embedder()
+    records: List[Dict[str, Any]] = []
+    for kb_code, paths in list_kb_files(docs_path).items():
+        for path in paths:
+            for offset, text in chunk_text(read_kb_text(path)):
+                records.append(
+                    {
+                        "kb_id": kb_code,
+                        "title": kb_title(path),
+                        "file": os.path.basename(path),
+                        "offset": offset,
+                        "text": text,
+                    }
+                )
+
+    n_chunks = len(records)
+    vectors = np.zeros((n_chunks, 0), dtype=np.float32)
+    for start in range(0, n_chunks, batch_size):
+        batch = _embed(embedder, [r["text"] for r in records[start : start + batch_size]])
+        if start == 0:
+            vectors = np.empty((n_chunks, batch.shape[1]), dtype=np.float32)
+        vectors[start : start + len(batch)] = batch
+    dim = int(vectors.shape[1]) if n_chunks else 0
+
+    # Partições IVF: ordena as linhas por partição para que cada uma seja contígua
+    centroids = None
+    offsets: List[int] = []
+    if partitions > 1 and n_chunks >= partitions:
+        centroids, assignment = _spherical_kmeans(vectors, partitions)
+        order = np.argsort(assignment, kind="stable")
+        vectors = vectors[order]
+        records = [records[i] for i in order]
+        offsets = np.searchsorted(assignment[order], np.arange(partitions + 1)).tolist()
+
+    previous = _read_manifest(index_dir)
+    generation = int(previous.get("generation", -1)) + 1 if previous else 0
+    data_dir = f"{_GENERATION_PREFIX}{generation:06d}"
+    gen_path = os.path.join(index_dir, data_dir)
+    # Sobra de um build interrompido com o mesmo número: nenhum manifest aponta para ela
+    shutil.rmtree(gen_path, ignore_errors=True)
+    os.makedirs(gen_path)
+    path = lambda name: os.path.join(gen_path, name)  # noqa: E731
+
+    if n_chunks:
+        mm = np.memmap(path(EMBEDDINGS_FILE), dtype=np.float32, mode="w+", shape=vectors.shape)
+        mm[:] = vectors
+        mm.flush()
+        del mm
+    else:
+        open(path(EMBEDDINGS_FILE), "wb").close()
+    with open(path(CHUNKS_FILE), "w", encoding="utf-8") as f:
+        for row, record in enumerate(records):
+            f.write(json.dumps({"row": row, **record}, ensure_ascii=False) + "\n")
+    if centroids is not None:
+        with open(path(CENTROIDS_FILE), "wb") as f:
+            np.save(f, centroids.astype(np.float32))
+    for name in os.listdir(gen_path):
+        with open(path(name), "rb") as f:
+            os.fsync(f.fileno())
+
+    manifest = {
+        "version": 1,
+        "generation": generation,
+        "data_dir": data_dir,
+        "embedder": embedder_name,
+        "dim": dim,
+        "n_chunks": n_chunks,
+        "n_documents": sum(len(p) for p in list_kb_files(docs_path).values()),
+        "partitions": len(offsets) - 1 if offsets else 0,
+        "partition_offsets": offsets,
+        "docs_path": os.path.abspath(docs_path),
+    }
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    _remove_old_generations(index_dir, keep={data_dir, (previous or {}).get("data_dir")})
+    return manifest
+
+
+def _read_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _remove_old_generations(index_dir: str, keep: set) -> None:
+    """Apaga as gerações fora de `keep` (a atual e a anterior, que ainda pode estar em uso)."""
+    for name in os.listdir(index_dir):
+        if name.startswith(_GENERATION_PREFIX) and name not in keep:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+    if None not in keep:
+        # Índice no layout antigo (arquivos soltos na raiz), já duas gerações atrás
+        for name in (EMBEDDINGS_FILE, CHUNKS_FILE, CENTROIDS_FILE):
+            if os.path.exists(os.path.join(index_dir, name)):
+                os.remove(os.path.join(index_dir, name))
+
+
+# ---------------------------------------------------------------------------
+# Busca
+# ---------------------------------------------------------------------------
+def _merge_top_k(
+    best_rows: np.ndarray, best_scores: np.ndarray, rows: np.ndarray, scores: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Junta os candidatos atuais com um novo bloco e mantém os k maiores scores."""
+    all_rows = np.concatenate([best_rows, rows])
+    all_scores = np.concatenate([best_scores, scores])
+    if len(all_scores) > k:
+        keep = np.argpartition(-all_scores, k - 1)[:k]
+        all_rows, all_scores = all_rows[keep], all_scores[keep]
+    return all_rows, all_scores
+
+
+class VectorStore:
+    """Índice vetorial somente leitura sobre os arquivos gerados por build_index()."""
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR):
+        manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(
+                f"Índice vetorial não encontrado em {index_dir}. "
+                "Rode: python -m m1_busca_documental.vector_store build"
+            )
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest: Dict[str, Any] = json.load(f)
+        self.index_dir = index_dir
+        self.manifest_mtime = os.path.getmtime(manifest_path)
+        # Pasta da geração apontada pelo manifest (sem data_dir: layout antigo, na raiz)
+        data_dir = os.path.join(index_dir, self.manifest.get("data_dir") or "")
+
+        self.embedder_name, self.embedder = load_embedder()
+        if self.embedder_name != self.manifest["embedder"]:
+            raise ValueError(
+                f"Índice construído com o embedder {self.manifest['embedder']!r}, "
+                f"mas o configurado é {self.embedder_name!r}. Reconstrua o índice."
+            )
+
+        n, dim = self.manifest["n_chunks"], self.manifest["dim"]
+        self.embeddings = (
+            np.memmap(os.path.join(data_dir, EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(n, dim))
+            if n
+            else np.zeros((0, dim), dtype=np.float32)
+        )
+        with open(os.path.join(data_dir, CHUNKS_FILE), "r", encoding="utf-8") as f:
+            self.chunks: List[Dict[str, Any]] = [json.loads(line) for line in f if line.strip()]
+
+        self.partition_offsets: List[int] = self.manifest.get("partition_offsets") or []
+        centroids_path = os.path.join(data_dir, CENTROIDS_FILE)
+        if self.partition_offsets and not os.path.exists(centroids_path):
+            raise FileNotFoundError(f"centroids.npy ausente em {data_dir}.")
+        self.centroids = np.load(centroids_path) if self.partition_offsets else None
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def _row_ranges(self, query_vector: np.ndarray, nprobe: int) -> List[Tuple[int, int]]:
+        """Fatias da matriz a varrer: tudo, ou as `nprobe` partições mais próximas."""
+        if self.centroids is None or nprobe <= 0 or nprobe >= len(self.centroids):
+            return [(0, len(self.chunks))]
+        nearest = np.argsort(-(self.centroids @ query_vector))[:nprobe]
+        offsets = self.partition_offsets
+        return [(offsets[p], offsets[p + 1]) for p in sorted(nearest)]
+
+    def search_many(
+        self, queries: Sequence[str], top_k: int = 5, nprobe: int = VECTOR_NPROBE
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k por pergunta: [[(linha, score), ...], ...] com score = cosseno, maior primeiro.
+
+        Sem partições, as perguntas são multiplicadas juntas contra cada bloco da
+        matriz (Q @ Eᵀ); com partições, cada pergunta varre só as suas.
+        """
+        if not queries or not len(self.chunks):
+            return [[] for _ in queries]
+        q = _embed(self.embedder, queries)
+        k = max(1, top_k)
+        best = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+
+        if self.centroids is None or nprobe <= 0 or nprobe >= len(self.centroids):
+            for start in range(0, len(self.chunks), _SEARCH_BLOCK_ROWS):
+                block = np.asarray(self.embeddings[start : start + _SEARCH_BLOCK_ROWS])
+                scores = q @ block.T
+                rows = np.arange(start, start + len(block))
+                for i in range(len(queries)):
+                    best[i] = _merge_top_k(best[i][0], best[i][1], rows, scores[i], k)
+        else:
+            for i in range(len(queries)):
+                for a, b in self._row_ranges(q[i], nprobe):
+                    for start in range(a, b, _SEARCH_BLOCK_ROWS):
+                        stop = min(b, start + _SEARCH_BLOCK_ROWS)
+                        scores = np.asarray(self.embeddings[start:stop]) @ q[i]
+                        best[i] = _merge_top_k(
+                            best[i][0], best[i][1], np.arange(start, stop), scores, k
+                        )
+
+        results = []
+        for rows, scores in best:
+            order = np.argsort(-scores, kind="stable")
+            results.append([(int(rows[j]), float(scores[j])) for j in order])
+        return results
+
+    def search(
+        self, query: str, top_k: int = 5, nprobe: int = VECTOR_NPROBE
+    ) -> List[Tuple[int, float]]:
+        """Top-k de uma pergunta: [(linha, score)]."""
+        return self.search_many([query], top_k=top_k, nprobe=nprobe)[0]
+
+    def query(
+        self,
+        search_query: str,
+        quantity: int,
+        threshold_similarity: float,
+        source_ids: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Busca no formato da resposta do libindexr:
+            {"results": [{"fromDocument": título, "chunks": [
+                {"chunk": {"sourceId", "rawContent", "kbId"}, "similarityScore"}]}]}
+
+        `source_ids` mapeia kb_id → source_id (tabela n1_chamados); chunks de KBs
+        sem source_id conhecido são descartados, pois o fetch_local_document não
+        conseguiria resolvê-los.
+        """
+        hits = self.search(search_query, top_k=quantity)
+        by_document: Dict[str, Dict[str, Any]] = {}
+        for row, score in hits:
+            if score < threshold_similarity:
+                continue
+            record = self.chunks[row]
+            source_id = (source_ids or {}).get(record["kb_id"])
+            if not source_id:
+                metrics.incr("vector_store_unmapped_chunks")
+                continue
+            result = by_document.setdefault(
+                record["title"], {"fromDocument": record["title"], "chunks": []}
+            )
+            result["chunks"].append(
+                {
+                    "chunk": {
+                        "sourceId": source_id,
+                        "rawContent": record["text"],
+                        "kbId": record["kb_id"],
+                    },
+                    "similarityScore": score,
+                }
+            )
+        return {"results": list(by_document.values()), "backend": "vector"}
+
+
+_store_lock = threading.Lock()
+_store: Optional[VectorStore] = None
+
+
+def get_vector_store(index_dir: str = VECTOR_INDEX_DIR) -> VectorStore:
+    """VectorStore do processo; recarregado quando o manifest é regravado (novo build)."""
+    global _store
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    mtime = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+    with _store_lock:
+        if (
+            _store is None
+            or _store.index_dir != index_dir
+            or _store.manifest_mtime != mtime
+        ):
+            _store = VectorStore(index_dir)
+        return _store
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Índice vetorial local do M1.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Constrói o índice a partir dos .txt dos KBs.")
+    build.add_argument("--docs", default=DOCS_REPO_PATH, help="Pasta dos documentos.")
+    build.add_argument("--out", default=VECTOR_INDEX_DIR, help="Pasta do índice.")
+    build.add_argument(
+        "--partitions", type=int, default=0, help="Nº de partições IVF (0 = busca exata)."
+    )
+
+    search = sub.add_parser("search", help="Consulta o índice.")
+    search.add_argument("query", help="Pergunta.")
+    search.add_argument("--index", default=VECTOR_INDEX_DIR, help="Pasta do índice.")
+    search.add_argument("--top-k", type=int, default=5)
+    search.add_argument("--nprobe", type=int, default=VECTOR_NPROBE)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        manifest = build_index(args.docs, args.out, partitions=args.partitions)
+        print(json.dumps(manifest, ensure_ascii=False, indent=2))
+        return
+
+    store = VectorStore(args.index)
+    for row, score in store.search(args.query, top_k=args.top_k, nprobe=args.nprobe):
+        record = store.chunks[row]
+        preview = record["text"][:100].replace("\n", " ")
+        print(f"{score:.3f}  {record['kb_id']}  {preview}")
+
+
+if __name__ == "__main__":
+    main()